@@ -0,0 +1,291 @@
+import asyncio
+import json
+import math
+import re
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+from graphql import FieldNode, OperationType, get_operation_ast, parse, value_from_ast_untyped
+from config import settings
+
+# ==============================
+# CLASIFICACIÓN DE RUTAS
+# ==============================
+# critica: lecturas puntuales baratas que deben seguir respondiendo bajo carga
+# pesada:  listados grandes, exportaciones y estadísticas (se descartan primero)
+# normal:  todo lo demás
+# GraphQL se clasifica por operación (ver clasificar_graphql).
+RUTAS_CRITICAS = [re.compile(r) for r in (
+    r"^/health$",
+    r"^/productos/\d+$",
+    r"^/productos/codigo-producto/[^/]+$",
+    r"^/categorias/\d+$",
+    r"^/distribuidores/\d+$",
+    r"^/distribuidores/rut/[^/]+$",
+)]
+
+RUTAS_PESADAS = [re.compile(r) for r in (
+    r"^/productos/snapshot",
+)]
+
+RUTA_GRAPHQL = re.compile(r"^/graphql/?$")
+
+# Campos raíz de GraphQL equivalentes a las rutas críticas, y listados que
+# pasan a pesados con `limit` mayor a ADMISION_LIMIT_PESADO (como GET /productos/)
+CAMPOS_GRAPHQL_CRITICOS = {"product", "__typename"}
+CAMPOS_GRAPHQL_LISTADO = {"products": 100}  # campo -> limit por defecto
+
+# Lecturas que pasan por single-flight (service/single_flight.py): un request
+# idéntico a otro ya admitido o en cola comparte su admisión sin ocupar cupo
+RUTAS_COMPARTIDAS = [re.compile(r) for r in (
+    r"^/productos/?$",
+    r"^/productos/\d+$",
+    r"^/productos/codigo-producto/[^/]+$",
+    r"^/categorias/?$",
+    r"^/categorias/\d+$",
+)]
+CAMPOS_GRAPHQL_COMPARTIDOS = {"products", "product", "categories", "__typename"}
+
+# Conexiones de larga duración: no ocupan cupo
+RUTAS_EXENTAS = [re.compile(r) for r in (
+    r"^/productos/changes/stream$",
+)]
+
+
+def clasificar(metodo: str, ruta: str, query_string: bytes = b"") -> Optional[str]:
+    """Clase de prioridad de un request, o None si está exento del control de admisión."""
+    if any(r.match(ruta) for r in RUTAS_EXENTAS):
+        return None
+    if metodo == "GET" and any(r.match(ruta) for r in RUTAS_CRITICAS):
+        return "critica"
+    if any(r.match(ruta) for r in RUTAS_PESADAS):
+        return "pesada"
+    if metodo == "GET" and ruta.rstrip("/") == "/productos" and query_string:
+        limit = parse_qs(query_string.decode("latin-1")).get("limit", [""])[0]
+        if limit.isdigit() and int(limit) > settings.ADMISION_LIMIT_PESADO:
+            return "pesada"
+    return "normal"
+
+
+def clasificar_graphql(cuerpo: bytes, query_string: bytes = b"") -> Tuple[str, bool]:
+    """Clase de una operación GraphQL y si se resuelve con lecturas compartidas.
+
+    Mutations normal, consultas solo de campos puntuales critica, listados
+    grandes, introspección o documentos que no se pueden analizar pesada, el
+    resto normal.
+    """
+    try:
+        if cuerpo:
+            datos = json.loads(cuerpo)
+        else:
+            datos = {clave: valores[0] for clave, valores in parse_qs(query_string.decode("latin-1")).items()}
+            if isinstance(datos.get("variables"), str):
+                datos["variables"] = json.loads(datos["variables"])
+        if not isinstance(datos, dict):
+            return "pesada", False
+        if "query" not in datos:
+            return "normal", False  # GraphiQL
+        operacion = get_operation_ast(parse(datos["query"]), datos.get("operationName"))
+    except Exception:
+        return "pesada", False
+    if operacion is None:
+        return "pesada", False
+    if operacion.operation != OperationType.QUERY:
+        return "normal", False
+    campos = operacion.selection_set.selections
+    if not all(isinstance(campo, FieldNode) for campo in campos):
+        return "pesada", False  # fragmentos en la raíz: no se analizan
+    nombres = {campo.name.value for campo in campos}
+    compartida = nombres <= CAMPOS_GRAPHQL_COMPARTIDOS
+    if nombres <= CAMPOS_GRAPHQL_CRITICOS:
+        return "critica", compartida
+    if any(nombre.startswith("__") and nombre != "__typename" for nombre in nombres):
+        return "pesada", False
+    variables = datos.get("variables") or {}
+    for campo in campos:
+        if campo.name.value in CAMPOS_GRAPHQL_LISTADO:
+            limit = CAMPOS_GRAPHQL_LISTADO[campo.name.value]
+            for argumento in campo.arguments:
+                if argumento.name.value == "limit":
+                    limit = value_from_ast_untyped(argumento.value, variables)
+            if not isinstance(limit, int) or limit > settings.ADMISION_LIMIT_PESADO:
+                return "pesada", compartida
+    return "normal", compartida
+
+
+class Limitador:
+    """Cupo de concurrencia con cola de espera acotada y plazo máximo de espera."""
+
+    def __init__(self, nombre: str, concurrencia: int, cola: int, espera_ms: int):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.max_cola = cola
+        self.espera = espera_ms / 1000
+        self.activos = 0
+        self.esperando = 0
+        self.rechazados = 0
+        self.cedidos = 0
+        self.compartidos = 0
+        self._semaforo = asyncio.Semaphore(concurrencia)
+
+    async def adquirir(self) -> bool:
+        if self._semaforo.locked():
+            if self.esperando >= self.max_cola:
+                self.rechazados += 1
+                return False
+            self.esperando += 1
+            try:
+                await asyncio.wait_for(self._semaforo.acquire(), timeout=self.espera)
+            except asyncio.TimeoutError:
+                self.rechazados += 1
+                return False
+            finally:
+                self.esperando -= 1
+        else:
+            await self._semaforo.acquire()
+        self.activos += 1
+        return True
+
+    def liberar(self) -> None:
+        self.activos -= 1
+        self._semaforo.release()
+
+    def estadisticas(self) -> dict:
+        return {
+            "concurrencia": self.concurrencia,
+            "activos": self.activos,
+            "esperando": self.esperando,
+            "rechazados": self.rechazados,
+            "cedidos": self.cedidos,
+            "compartidos": self.compartidos,
+        }
+
+
+class Cupo:
+    """Lugar que ocupa un request en su clase; se libera una sola vez."""
+
+    def __init__(self, limitador: Limitador):
+        self.limitador = limitador
+        self.liberado = False
+
+    def liberar(self) -> None:
+        if not self.liberado:
+            self.liberado = True
+            self.limitador.liberar()
+
+
+_cupo: ContextVar[Optional[Cupo]] = ContextVar("cupo_admision", default=None)
+
+
+def ceder_cupo() -> None:
+    """Libera antes de terminar el cupo del request en curso.
+
+    Lo usa single-flight: un request que espera un cálculo ya en curso no usa
+    conexión ni CPU, así no cuenta contra el límite de su clase.
+    """
+    cupo = _cupo.get()
+    if cupo is not None and not cupo.liberado:
+        cupo.limitador.cedidos += 1
+        cupo.liberar()
+
+
+class AdmissionMiddleware:
+    """Middleware ASGI: limita la concurrencia por clase de ruta y responde 503 con
+    Retry-After cuando el cupo y la cola de su clase están llenos.
+
+    Cada clase tiene su propio cupo, así los listados y consultas pesadas no
+    pueden ocupar las conexiones que necesitan las lecturas críticas. Las
+    lecturas compartidas idénticas a un request ya en cola o en curso esperan
+    su admisión en vez de ocupar un lugar propio: se van a unir a su cálculo.
+    """
+
+    def __init__(self, app, clases: Optional[Dict[str, dict]] = None):
+        self.app = app
+        clases = clases or settings.ADMISION_CLASES
+        self.limitadores = {nombre: Limitador(nombre, **config) for nombre, config in clases.items()}
+        self._admisiones: Dict[tuple, asyncio.Future] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        ruta, query_string = scope["path"], scope.get("query_string", b"")
+        clave = None
+        if RUTA_GRAPHQL.match(ruta):
+            cuerpo, receive = await _leer_cuerpo(receive)
+            clase, compartida = clasificar_graphql(cuerpo, query_string)
+            if compartida:
+                clave = (ruta, query_string, cuerpo)
+        else:
+            clase = clasificar(scope["method"], ruta, query_string)
+            if scope["method"] == "GET" and any(r.match(ruta) for r in RUTAS_COMPARTIDAS):
+                clave = (ruta, query_string)
+        limitador = self.limitadores.get(clase) if clase else None
+        if limitador is None:
+            return await self.app(scope, receive, send)
+        if not settings.COALESCER_LECTURAS:
+            clave = None  # sin single-flight cada request idéntico calcula por su cuenta
+
+        admision = self._admisiones.get(clave) if clave else None
+        if admision is not None:
+            # Mismo request ya en cola o en curso: se admite (o rechaza) junto con él
+            if not await asyncio.shield(admision):
+                limitador.rechazados += 1
+                return await self._rechazar(send, limitador)
+            limitador.compartidos += 1
+            return await self.app(scope, receive, send)
+
+        admision = asyncio.get_running_loop().create_future()
+        if clave:
+            self._admisiones[clave] = admision
+        try:
+            admitido = await limitador.adquirir()
+            admision.set_result(admitido)
+            if not admitido:
+                return await self._rechazar(send, limitador)
+            cupo = Cupo(limitador)
+            token = _cupo.set(cupo)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                cupo.liberar()
+                _cupo.reset(token)
+        finally:
+            if clave and self._admisiones.get(clave) is admision:
+                del self._admisiones[clave]
+            if not admision.done():
+                admision.set_result(False)
+
+    @staticmethod
+    async def _rechazar(send, limitador: Limitador):
+        cuerpo = json.dumps({
+            "detail": f"Servicio saturado ({limitador.nombre}), reintente más tarde"
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode()),
+                (b"retry-after", str(math.ceil(settings.ADMISION_RETRY_AFTER)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _leer_cuerpo(receive):
+    """Lee el cuerpo completo y devuelve otro `receive` que lo entrega de nuevo a la app."""
+    mensajes, partes = [], []
+    while True:
+        mensaje = await receive()
+        mensajes.append(mensaje)
+        if mensaje["type"] != "http.request":
+            break
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"):
+            break
+
+    async def repetir():
+        return mensajes.pop(0) if mensajes else await receive()
+
+    return b"".join(partes), repetir
@@ -0,0 +1,117 @@
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+from jose import jwt, JWTError
+from config import settings
+
+
+class TokenCache:
+    """LRU acotado de tokens ya verificados, indexado por el SHA-256 del token.
+
+    Cada entrada vale hasta el `exp` del token, así las llamadas repetidas con
+    el mismo token no vuelven a verificar la firma.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self._tokens: "OrderedDict[bytes, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _clave(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        clave = self._clave(token)
+        with self._lock:
+            claims = self._tokens.get(clave)
+            if claims is None:
+                return None
+            if claims["exp"] <= time.time():
+                del self._tokens[clave]
+                return None
+            self._tokens.move_to_end(clave)
+            return claims
+
+    def put(self, token: str, claims: dict) -> None:
+        if self.max_tokens <= 0:
+            return
+        clave = self._clave(token)
+        with self._lock:
+            self._tokens[clave] = claims
+            self._tokens.move_to_end(clave)
+            while len(self._tokens) > self.max_tokens:
+                self._tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+
+
+token_cache = TokenCache(settings.JWT_CACHE_TOKENS)
+
+# Secretos que no firman ni aceptan tokens: vacío (no configurado) o el valor
+# por defecto que publicaban versiones anteriores
+SECRETOS_INSEGUROS = {"", "secreto123"}
+
+
+class SecretoNoConfigurado(RuntimeError):
+    """JWT_SECRET no está configurado: las escrituras quedan deshabilitadas."""
+
+
+def secreto_jwt() -> str:
+    if settings.JWT_SECRET in SECRETOS_INSEGUROS:
+        raise SecretoNoConfigurado("JWT_SECRET no está configurado; las escrituras están deshabilitadas")
+    return settings.JWT_SECRET
+
+
+def scopes_de(claims: dict) -> set:
+    """Scopes del token: claim `scope` separado por espacios (OAuth2) o lista `scopes`."""
+    scopes = claims.get("scopes") or claims.get("scope") or []
+    if isinstance(scopes, str):
+        scopes = scopes.split()
+    return set(scopes)
+
+
+def crear_token(sub: str, scopes: Iterable[str] = (), expira_minutos: Optional[int] = None) -> str:
+    expira = expira_minutos if expira_minutos is not None else settings.JWT_EXPIRA_MINUTOS
+    ahora = int(time.time())
+    claims = {"sub": sub, "scope": " ".join(scopes), "iat": ahora, "exp": ahora + expira * 60}
+    return jwt.encode(claims, secreto_jwt(), algorithm=settings.JWT_ALGORITHM)
+
+
+def verificar_token(token: str, scopes_requeridos: Iterable[str] = (), usar_cache: bool = True) -> dict:
+    """Valida firma, expiración y scopes del token y devuelve sus claims.
+
+    Lanza ValueError si el token es inválido o expiró, PermissionError si le
+    falta alguno de los scopes requeridos y SecretoNoConfigurado si el servidor
+    no tiene un JWT_SECRET propio.
+    """
+    secreto = secreto_jwt()
+    claims = token_cache.get(token) if usar_cache else None
+    if claims is None:
+        try:
+            claims = jwt.decode(
+                token,
+                secreto,
+                algorithms=[settings.JWT_ALGORITHM],
+                options={"require_exp": True}
+            )
+        except JWTError as e:
+            raise ValueError(f"Token inválido o expirado: {e}")
+        if usar_cache:
+            token_cache.put(token, claims)
+
+    faltantes = set(scopes_requeridos) - scopes_de(claims)
+    if faltantes:
+        raise PermissionError(f"El token no tiene los permisos requeridos: {', '.join(sorted(faltantes))}")
+    return claims
+
+
+if __name__ == "__main__":
+    # Emitir un token de escritura para pruebas: python auth.py <usuario> [scope ...]
+    usuario = sys.argv[1] if len(sys.argv) > 1 else "admin"
+    print(crear_token(usuario, sys.argv[2:] or [settings.JWT_SCOPE_ESCRITURA]))
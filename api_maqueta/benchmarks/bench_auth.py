@@ -0,0 +1,39 @@
+"""Benchmark del costo de autenticación por request, con y sin cache de tokens.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_auth.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("JWT_SECRET", "secreto-del-benchmark")
+
+from auth import crear_token, token_cache, verificar_token
+from config import settings
+
+REPETICIONES = 20000
+CLIENTES = 200  # tokens distintos rotando, como terminales que reutilizan su token
+
+
+def medir(nombre: str, usar_cache: bool, tokens):
+    token_cache.clear()
+    scopes = [settings.JWT_SCOPE_ESCRITURA]
+    inicio = time.perf_counter()
+    for i in range(REPETICIONES):
+        verificar_token(tokens[i % len(tokens)], scopes, usar_cache=usar_cache)
+    total = time.perf_counter() - inicio
+    print(f"  {nombre:<28} {total / REPETICIONES * 1e6:8.2f} µs/request")
+    return total
+
+
+def main():
+    tokens = [crear_token(f"terminal-{i}", [settings.JWT_SCOPE_ESCRITURA]) for i in range(CLIENTES)]
+    print(f"{REPETICIONES} verificaciones, {CLIENTES} tokens distintos ({settings.JWT_ALGORITHM})")
+    sin_cache = medir("sin cache (firma + claims)", False, tokens)
+    con_cache = medir("con cache LRU", True, tokens)
+    print(f"  aceleración: x{sin_cache / con_cache:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark: 50 GET /productos/{id} individuales vs un POST /productos/batch-get.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_batch_get.py
+Requiere httpx (TestClient de FastAPI).
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)  # DATABASE_URL es relativa: la base del benchmark queda en el directorio temporal
+
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.comun import poblar
+from database import SessionLocal
+
+N_PRODUCTOS = 20_000
+POR_PEDIDO = 50
+RONDAS = 50
+
+
+def main_bench():
+    db = SessionLocal()
+    poblar(db, N_PRODUCTOS)
+    db.close()
+
+    client = TestClient(main.app)
+    pedidos = [random.sample(range(1, N_PRODUCTOS + 1), POR_PEDIDO) for _ in range(RONDAS)]
+
+    inicio = time.perf_counter()
+    for ids in pedidos:
+        for i in ids:
+            assert client.get(f"/productos/{i}").status_code == 200
+    individual = (time.perf_counter() - inicio) / RONDAS
+
+    inicio = time.perf_counter()
+    for ids in pedidos:
+        respuesta = client.post("/productos/batch-get", json={"ids": ids})
+        assert respuesta.status_code == 200 and not respuesta.json()["no_encontrados"]
+    batch = (time.perf_counter() - inicio) / RONDAS
+
+    print(f"{POR_PEDIDO} productos por pedido, {RONDAS} pedidos, {N_PRODUCTOS} productos en la base")
+    print(f"  {POR_PEDIDO} GET individuales: {individual * 1000:8.2f} ms/pedido ({POR_PEDIDO} requests, {POR_PEDIDO} sesiones)")
+    print(f"  1 POST batch-get:      {batch * 1000:8.2f} ms/pedido (1 request, 1 consulta IN)")
+    print(f"  aceleración: x{individual / batch:.1f}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,71 @@
+"""Benchmark del snapshot en memoria del catálogo.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_catalog_snapshot.py [n_productos]
+
+Reporta tiempo de carga, memoria por 100k productos y latencia de lecturas
+(snapshot vs SQLite).
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+from benchmarks.comun import poblar
+from service.catalog_snapshot import CatalogSnapshot
+from service.product_service import ProductService
+
+
+def medir(nombre: str, fn, repeticiones: int = 20000):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    total = time.perf_counter() - inicio
+    print(f"  {nombre:<40} {total / repeticiones * 1e6:8.2f} µs/op")
+
+
+def main(n: int = 100_000):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        models.Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        poblar(db, n)
+
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        snapshot = CatalogSnapshot()
+        snapshot.cargar(db)
+        carga = time.perf_counter() - inicio
+        memoria, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = snapshot.estadisticas()
+        print(f"Productos: {n}")
+        print(f"  carga completa: {carga:.2f} s")
+        print(f"  memoria (tracemalloc): {memoria / 1024 / 1024:.1f} MiB "
+              f"-> {memoria / n * 100_000 / 1024 / 1024:.1f} MiB por 100k productos")
+        print(f"  memoria (estimada por el snapshot): "
+              f"{stats['bytes_por_100k_productos'] / 1024 / 1024:.1f} MiB por 100k productos")
+
+        service = ProductService(db)
+        ids = [random.randint(1, n) for _ in range(1000)]
+        codigos = [f"P{i:07d}" for i in ids]
+        print("Lecturas:")
+        medir("get_by_id (SQLite)", lambda: service.get_by_id(random.choice(ids)), 2000)
+        medir("get_by_id (snapshot)", lambda: snapshot.get_producto(random.choice(ids)))
+        medir("get_by_codigo (SQLite)", lambda: service.get_by_codigo_producto(random.choice(codigos)), 2000)
+        medir("get_by_codigo (snapshot)", lambda: snapshot.get_producto_by_codigo(random.choice(codigos)))
+        medir("filtrar_por_categoria 100 (SQLite)", lambda: service.filtrar_por_categoria(3, 500, 100), 200)
+        medir("filtrar_por_categoria 100 (snapshot)", lambda: snapshot.listar(500, 100, categoria_id=3), 2000)
+        db.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,172 @@
+"""Benchmark del historial de precios y stock: espacio por millón de cambios y latencia por rango.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_history.py
+
+Genera CAMBIOS cambios sintéticos (paseo aleatorio de precio, margen y stock)
+de PRODUCTOS productos repartidos en un año y los guarda de dos formas, cada
+una en su propio archivo SQLite:
+  - tablas mensuales WITHOUT ROWID con deltas (service/history_service.py)
+  - tabla de auditoría ingenua: rowid, fecha DATETIME, DECIMAL absolutos e
+    índice (id_producto, fecha)
+Después mide consultas por producto y rango con HistoryService y el SELECT
+equivalente sobre la tabla de auditoría, y el costo agregado a
+ProductService.update.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import models
+import schemas
+from benchmarks.comun import poblar
+from service.history_service import CAMPOS, HistoryService, inicio_mes, muestrear, tabla_mes
+from service.product_service import ProductService
+
+CAMBIOS = 1_000_000
+PRODUCTOS = 10_000
+INICIO = datetime(2025, 1, 1)
+FIN = datetime(2026, 1, 1)
+CONSULTAS = 300
+
+
+def generar():
+    """Cambios (id_producto, fecha, precio en centésimas, margen en centésimas, stock) ordenados por producto y fecha."""
+    random.seed(7)
+    por_producto = CAMBIOS // PRODUCTOS
+    segundos = int((FIN - INICIO).total_seconds())
+    for id_producto in range(1, PRODUCTOS + 1):
+        precio, margen, stock = random.randint(1000, 500000), 3000, random.randint(0, 200)
+        for s in sorted(random.sample(range(segundos), por_producto)):
+            r = random.random()
+            if r < 0.7:
+                stock = max(0, stock + random.randint(-20, 20))
+            elif r < 0.95:
+                precio = max(100, precio + random.randint(-precio // 20, precio // 20))
+            else:
+                margen = random.choice((2500, 3000, 3500, 4000))
+            yield id_producto, INICIO + timedelta(seconds=s, milliseconds=random.randint(0, 999)), precio, margen, stock
+
+
+def cargar_historial(db):
+    filas_por_mes = {}
+    anterior = {}
+    for id_producto, fecha, *valores in generar():
+        mes = inicio_mes(fecha)
+        clave = (id_producto, mes)
+        previo = anterior.get(clave)
+        fila = {"id_producto": id_producto, "fecha": (fecha - mes) // timedelta(milliseconds=1), "base": int(previo is None)}
+        for campo, valor, antes in zip(CAMPOS, valores, previo or (0, 0, 0)):
+            fila[campo] = valor - antes
+        anterior[clave] = valores
+        filas_por_mes.setdefault(mes, []).append(fila)
+    for mes, filas in filas_por_mes.items():
+        tabla = tabla_mes(mes)
+        tabla.create(db.connection(), checkfirst=True)
+        db.execute(tabla.insert(), filas)
+    db.commit()
+
+
+def cargar_auditoria(db):
+    db.execute(text(
+        "CREATE TABLE Auditoria (id INTEGER PRIMARY KEY, id_producto INTEGER NOT NULL, fecha DATETIME NOT NULL, "
+        "precio_compra DECIMAL(10, 2) NOT NULL, margen_ganancia DECIMAL(5, 2) NOT NULL, stock INTEGER NOT NULL)"
+    ))
+    db.execute(text("CREATE INDEX ix_auditoria ON Auditoria (id_producto, fecha)"))
+    db.execute(text("INSERT INTO Auditoria (id_producto, fecha, precio_compra, margen_ganancia, stock) "
+                    "VALUES (:p, :f, :pc, :m, :s)"), [
+        {"p": p, "f": f.isoformat(sep=" "), "pc": pc / 100, "m": m / 100, "s": s} for p, f, pc, m, s in generar()
+    ])
+    db.commit()
+
+
+def tamano(ruta: str, engine) -> int:
+    with engine.connect() as conexion:
+        conexion.exec_driver_sql("VACUUM")
+    return os.path.getsize(ruta)
+
+
+def latencia(fn) -> tuple:
+    tiempos = []
+    for _ in range(CONSULTAS):
+        id_producto = random.randint(1, PRODUCTOS)
+        inicio = time.perf_counter()
+        fn(id_producto)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return statistics.median(tiempos) * 1e6, tiempos[int(len(tiempos) * 0.99)] * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta_historial, ruta_auditoria = f"{tmp}/historial.db", f"{tmp}/auditoria.db"
+        engine_historial = create_engine(f"sqlite:///{ruta_historial}")
+        engine_auditoria = create_engine(f"sqlite:///{ruta_auditoria}")
+        db = sessionmaker(bind=engine_historial)()
+        db_auditoria = sessionmaker(bind=engine_auditoria)()
+
+        inicio = time.perf_counter()
+        cargar_historial(db)
+        print(f"{CAMBIOS:,} cambios de {PRODUCTOS:,} productos en {time.perf_counter() - inicio:.1f} s")
+        cargar_auditoria(db_auditoria)
+
+        por_millon = 1_000_000 / CAMBIOS / 2**20
+        print("Espacio por millón de cambios (después de VACUUM):")
+        print(f"  historial mensual con deltas   {tamano(ruta_historial, engine_historial) * por_millon:7.1f} MiB")
+        print(f"  auditoría ingenua + índice     {tamano(ruta_auditoria, engine_auditoria) * por_millon:7.1f} MiB")
+
+        historial = HistoryService(db)
+        consulta_auditoria = text(
+            "SELECT fecha, precio_compra, margen_ganancia, stock FROM Auditoria "
+            "WHERE id_producto = :p AND fecha BETWEEN :d AND :h ORDER BY fecha"
+        )
+
+        def auditoria(id_producto, desde, hasta):
+            return [
+                (datetime.fromisoformat(f), Decimal(str(pc)), Decimal(str(m)), s)
+                for f, pc, m, s in db_auditoria.execute(consulta_auditoria, {
+                    "p": id_producto, "d": desde.isoformat(sep=" "), "h": hasta.isoformat(sep=" ")
+                })
+            ]
+
+        print(f"Latencia por consulta, mediana / p99 en µs ({CONSULTAS} productos al azar, ~{CAMBIOS // PRODUCTOS} cambios/año c/u):")
+        for nombre, desde, hasta in (
+            ("1 semana", datetime(2025, 6, 10), datetime(2025, 6, 17)),
+            ("1 mes", datetime(2025, 6, 1), datetime(2025, 7, 1)),
+            ("3 meses", datetime(2025, 4, 1), datetime(2025, 7, 1)),
+            ("12 meses", INICIO, FIN),
+        ):
+            h = latencia(lambda p: historial.get_history(p, desde, hasta))
+            a = latencia(lambda p: auditoria(p, desde, hasta))
+            print(f"  {nombre:<10} historial {h[0]:7.0f} / {h[1]:7.0f}    auditoría {a[0]:7.0f} / {a[1]:7.0f}")
+        s = latencia(lambda p: muestrear(historial.puntos(p, INICIO, FIN), INICIO, FIN, 100))
+        print(f"  serie de 12 meses en 100 intervalos: {s[0]:.0f} / {s[1]:.0f}")
+
+        # Costo agregado a la escritura: precio/stock (con fila de historial) frente a un campo sin historial
+        engine = create_engine(f"sqlite:///{tmp}/escritura.db")
+        models.Base.metadata.create_all(bind=engine)
+        db_escritura = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)()
+        poblar(db_escritura, 1000)
+        service = ProductService(db_escritura)
+        print("Escritura con ProductService.update:")
+        for nombre, cambio in (
+            ("update sin historial (nombre)", lambda i: schemas.ProductoUpdate(nombre_producto=f"Filtro {i}")),
+            ("update con historial (stock)", lambda i: schemas.ProductoUpdate(stock=i)),
+        ):
+            inicio = time.perf_counter()
+            for i in range(2000):
+                service.update(i % 1000 + 1, cambio(i))
+            print(f"  {nombre:<32} {(time.perf_counter() - inicio) / 2000 * 1e6:7.0f} µs/op")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Prueba de sobrecarga: latencia de lecturas baratas durante un pico de listados pesados.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_overload.py
+Requiere httpx. Compara la app sin control de admisión y con AdmissionMiddleware
+con las clases por defecto (settings.ADMISION_CLASES), que es lo que monta
+main.py; la app se importa sin middleware solo para medir la línea base. La
+prueba con aserciones equivalente está en tests/test_admission.py.
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import httpx
+
+from config import settings
+
+settings.ADMISION_ACTIVA = False  # la app base sin middleware; se envuelve manualmente abajo
+
+import main
+from admission import AdmissionMiddleware
+from benchmarks.comun import poblar
+from database import SessionLocal
+
+N_PRODUCTOS = 20_000
+PESADOS = 40          # GET /productos/?limit=1000 lanzados de golpe
+BARATOS = 300         # GET /productos/{id} espaciados durante el pico
+INTERVALO = 0.005
+
+
+async def escenario(app):
+    # Los errores de la app (p. ej. pool de conexiones agotado) se cuentan como 500
+    transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=120) as client:
+        latencias = []
+        estados = {}
+        fallidos = 0
+
+        async def pesado():
+            r = await client.get("/productos/", params={"limit": 1000, "skip": random.randint(0, 15000)})
+            estados[r.status_code] = estados.get(r.status_code, 0) + 1
+
+        async def barato():
+            nonlocal fallidos
+            inicio = time.perf_counter()
+            r = await client.get(f"/productos/{random.randint(1, N_PRODUCTOS)}")
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code != 200:
+                fallidos += 1
+
+        tareas = [asyncio.create_task(pesado()) for _ in range(PESADOS)]
+        for _ in range(BARATOS):
+            tareas.append(asyncio.create_task(barato()))
+            await asyncio.sleep(INTERVALO)
+        await asyncio.gather(*tareas)
+
+    latencias.sort()
+    p50 = statistics.median(latencias) * 1000
+    p99 = latencias[int(len(latencias) * 0.99) - 1] * 1000
+    return p50, p99, fallidos, estados
+
+
+def main_bench():
+    db = SessionLocal()
+    poblar(db, N_PRODUCTOS)
+    db.close()
+
+    print(f"{PESADOS} listados pesados concurrentes + {BARATOS} lecturas por id cada {INTERVALO * 1000:.0f} ms")
+    for nombre, app in (("sin admisión", main.app), ("con admisión", AdmissionMiddleware(main.app))):
+        p50, p99, fallidos, estados = asyncio.run(escenario(app))
+        print(f"  {nombre:<14} get-by-id p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  fallidos {fallidos}/{BARATOS}  "
+              f"pesados por estado {estados}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,148 @@
+"""Benchmark de escrituras concurrentes según el número de shards.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_sharding.py
+
+Para 1, 2, 4 y 8 shards lanza HILOS escritores que crean productos de
+distribuidores al azar con ShardedProductService (directorio, id y log de
+cambios en los shards; el relay los lleva al log global en segundo plano).
+Se reporta además el caso "solo shards" (INSERT + commit directo en el
+shard), que muestra cuánto escala la parte particionada sin ningún costo
+adicional, y cuánto tarda el relay en dejar el log global al día tras la
+última escritura.
+
+La columna "procesos" repite la prueba del servicio con PROCESOS procesos
+de un hilo (como varios workers de uvicorn sobre los mismos shards): dentro
+de un proceso el costo por escritura es sobre todo CPU de Python y el GIL
+lo serializa, así que es entre procesos donde se ve si las escrituras siguen
+compartiendo algún cuello de botella (antes, la base global). Solo tiene
+sentido con al menos PROCESOS núcleos: con uno, los procesos se reparten la
+misma CPU y además esperan locks de shards retenidos por un proceso
+desalojado.
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Los procesos hijos (spawn) heredan el directorio por el entorno: el engine fija la ruta al importarse
+if "BENCH_SHARDING_DIR" not in os.environ:
+    TMP = tempfile.TemporaryDirectory()
+    os.environ["BENCH_SHARDING_DIR"] = TMP.name
+os.chdir(os.environ["BENCH_SHARDING_DIR"])
+
+from sqlalchemy import func, insert
+
+from config import settings
+import models
+import schemas
+import sharding
+from benchmarks.comun import poblar
+from database import SessionLocal, engine
+from service import sharded_product_service
+from service.sharded_product_service import ShardedProductService, activar_sharding, detener_sharding
+
+SHARDS = [1, 2, 4, 8]
+HILOS = 8
+PROCESOS = 4
+ESCRITURAS_POR_HILO = 300
+DISTRIBUIDORES = 64
+
+
+def nuevo(hilo: int, i: int) -> schemas.ProductoCreate:
+    return schemas.ProductoCreate(
+        codigo_producto=f"H{hilo:02d}-{i:06d}", nombre_producto="Filtro", id_categoria=1, marca="Marca",
+        precio_compra=Decimal(1000 + i), stock=10, id_distribuidor=random.randint(1, DISTRIBUIDORES),
+    )
+
+
+def en_hilos(fn) -> float:
+    """Ejecuta fn(hilo) en HILOS hilos a la vez y devuelve escrituras por segundo."""
+    hilos = [threading.Thread(target=fn, args=(h,)) for h in range(HILOS)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return HILOS * ESCRITURAS_POR_HILO / (time.perf_counter() - inicio)
+
+
+def configurar(n_shards: int) -> None:
+    settings.SHARDS = n_shards
+    settings.SHARD_URL_TEMPLATE = f"sqlite:///./n{n_shards}_shard{{n}}.db"
+
+
+def escribir_en_proceso(n_shards: int, proceso: int) -> tuple:
+    """Worker de otro proceso: conecta los shards ya creados y escribe con su propio relay."""
+    configurar(n_shards)
+    sharded_product_service.conectar_sharding()
+    service = ShardedProductService(SessionLocal())
+    inicio = time.time()
+    for i in range(ESCRITURAS_POR_HILO * HILOS // PROCESOS):
+        service.create(nuevo(proceso + n_shards * 100 + 50, i))
+    fin = time.time()
+    detener_sharding()
+    return inicio, fin
+
+
+def en_procesos(n_shards: int) -> float:
+    with multiprocessing.get_context("spawn").Pool(PROCESOS) as pool:
+        tiempos = pool.starmap(escribir_en_proceso, [(n_shards, p) for p in range(PROCESOS)])
+    return HILOS * ESCRITURAS_POR_HILO / (max(f for _, f in tiempos) - min(i for i, _ in tiempos))
+
+
+def medir(n_shards: int) -> tuple:
+    configurar(n_shards)
+    db = SessionLocal()
+    activar_sharding(db)
+    router = sharding.router
+    en_log = db.scalar(func.count(models.CambiosCatalogo.seq))
+
+    def servicio(hilo: int):
+        service = ShardedProductService(db)
+        for i in range(ESCRITURAS_POR_HILO):
+            service.create(nuevo(hilo + n_shards * 100, i))
+
+    def solo_shards(hilo: int):
+        for i in range(ESCRITURAS_POR_HILO):
+            producto = nuevo(hilo + n_shards * 100 + HILOS, i)
+            # Ids explícitos fuera del rango de las secuencias, que el servicio sigue usando después
+            id_producto = 10 ** 9 + hilo * ESCRITURAS_POR_HILO + i
+            with router.sesion(router.shard_para(producto.id_distribuidor)) as db_shard:
+                db_shard.execute(insert(models.Productos).values(id_producto=id_producto, **producto.model_dump()))
+                db_shard.commit()
+
+    escrituras = en_hilos(servicio)
+    fin = time.perf_counter()
+    while db.scalar(func.count(models.CambiosCatalogo.seq)) < en_log + HILOS * ESCRITURAS_POR_HILO:
+        time.sleep(0.001)
+    retraso = time.perf_counter() - fin
+    directo = en_hilos(solo_shards)
+    procesos = en_procesos(n_shards)
+
+    detener_sharding()
+    db.close()
+    return escrituras, directo, retraso, procesos
+
+
+def main():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    poblar(db, 0, distribuidores=DISTRIBUIDORES)
+    db.close()
+    print(f"{HILOS} hilos x {ESCRITURAS_POR_HILO} escrituras, {DISTRIBUIDORES} distribuidores")
+    print(f"  {'shards':>6}  {'ShardedProductService':>22}  {'solo shards':>12}  {'log global al día':>18}"
+          f"  {f'{PROCESOS} procesos':>12}")
+    for n in SHARDS:
+        servicio, directo, retraso, procesos = medir(n)
+        print(f"  {n:>6}  {servicio:>16.0f} esc/s  {directo:>8.0f} esc/s  {retraso * 1e3:>15.0f} ms"
+              f"  {procesos:>6.0f} esc/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Benchmark de GET /productos/snapshot.arrow|parquet frente a paginar el JSON.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_snapshot_arrow.py
+Requiere httpx y pyarrow. Descarga el catálogo completo de N_PRODUCTOS
+productos de tres formas y mide bytes transferidos, tiempo del servidor y
+tiempo de decodificación en el cliente:
+  - JSON paginado con keyset (GET /productos/?after_id=&limit=PAGINA)
+  - snapshot Arrow IPC / Parquet sin cache (primera descarga de la versión)
+  - snapshot Arrow IPC / Parquet desde la cache (misma versión del catálogo)
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import settings
+
+import main
+from benchmarks.comun import poblar
+from database import SessionLocal
+
+N_PRODUCTOS = 100_000
+PAGINA = 500
+
+
+async def paginar_json(client) -> tuple:
+    """Todas las páginas del listado; devuelve (bytes, segundos de red/servidor, segundos de json.loads, filas)."""
+    total_bytes = filas = 0
+    cuerpos = []
+    after_id = 0
+    inicio = time.perf_counter()
+    while True:
+        r = await client.get("/productos/", params={"after_id": after_id, "limit": PAGINA})
+        total_bytes += len(r.content)
+        cuerpos.append(r.content)
+        items = json.loads(r.content)["items"]
+        if not items:
+            break
+        filas += len(items)
+        after_id = items[-1]["id_producto"]
+    servidor = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for cuerpo in cuerpos:
+        json.loads(cuerpo)
+    return total_bytes, servidor, time.perf_counter() - inicio, filas
+
+
+async def descargar(client, formato: str) -> tuple:
+    inicio = time.perf_counter()
+    r = await client.get(f"/productos/snapshot.{formato}")
+    servidor = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    if formato == "arrow":
+        tabla = pa.ipc.open_stream(r.content).read_all()
+    else:
+        tabla = pq.read_table(io.BytesIO(r.content))
+    return len(r.content), servidor, time.perf_counter() - inicio, tabla.num_rows
+
+
+async def ejecutar():
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=600) as client:
+        resultados = [("JSON paginado", await paginar_json(client))]
+        for formato in ("arrow", "parquet"):
+            resultados.append((f"{formato} (sin cache)", await descargar(client, formato)))
+            resultados.append((f"{formato} (cache)", await descargar(client, formato)))
+    return resultados
+
+
+def main_bench():
+    db = SessionLocal()
+    poblar(db, N_PRODUCTOS)
+    db.close()
+
+    resultados = asyncio.run(ejecutar())
+    json_bytes = resultados[0][1][0]
+    print(f"Catálogo completo de {N_PRODUCTOS:,} productos (JSON en páginas de {PAGINA}):")
+    print(f"  {'':<20} {'MiB':>8} {'vs JSON':>8} {'servidor s':>11} {'decodif. s':>11} {'filas':>8}")
+    for nombre, (total_bytes, servidor, decodificacion, filas) in resultados:
+        print(f"  {nombre:<20} {total_bytes / 2**20:8.2f} {total_bytes / json_bytes:8.1%} "
+              f"{servidor:11.2f} {decodificacion:11.3f} {filas:8,}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,111 @@
+"""Estampida de lecturas idénticas: consultas a la base por ráfaga con y sin single-flight.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_thundering_herd.py
+Requiere httpx. Simula la publicación de una lista de precios: RAFAGA
+terminales piden a la vez la misma página (REST y GraphQL) y se cuentan las
+sentencias SQL ejecutadas, los cálculos compartidos y la latencia, con
+COALESCER_LECTURAS desactivado y activado. El último escenario reparte la
+ráfaga entre PAGINAS páginas distintas, y el último, RAFAGA_PUNTUAL
+consultas GraphQL product(id:) simultáneas. Corre con la configuración por
+defecto, control de admisión incluido: los 503 cuentan como errores.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import httpx
+from sqlalchemy import event
+
+from config import settings
+
+import main
+from benchmarks.comun import poblar
+from database import SessionLocal, engine
+from service.single_flight import lecturas
+
+N_PRODUCTOS = 20_000
+RAFAGA = 300
+PAGINAS = 10
+RAFAGA_PUNTUAL = 12
+REPETICIONES = 5
+
+consultas = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def contar(conn, cursor, statement, parameters, context, executemany):
+    global consultas
+    consultas += 1
+
+
+GRAPHQL = "{ products(skip: 200, limit: 100) { idProducto precioVenta stock categoria { nombreCategoria } } }"
+
+
+def escenarios():
+    return [
+        ("REST misma página", RAFAGA, lambda n: ("GET", "/productos/", {"params": {"categoria_id": 3, "limit": 100}})),
+        ("GraphQL products", RAFAGA, lambda n: ("POST", "/graphql", {"json": {"query": GRAPHQL}})),
+        (f"REST {PAGINAS} páginas", RAFAGA,
+         lambda n: ("GET", "/productos/", {"params": {"skip": n % PAGINAS * 100, "limit": 100}})),
+        ("GraphQL product(id:)", RAFAGA_PUNTUAL,
+         lambda n: ("POST", "/graphql", {"json": {"query": "{ product(id: 1) { idProducto stock } }"}})),
+    ]
+
+
+async def rafaga(client, cantidad, solicitud) -> tuple:
+    global consultas
+    latencias, errores = [], 0
+
+    async def una(n):
+        nonlocal errores
+        metodo, url, opciones = solicitud(n)
+        inicio = time.perf_counter()
+        r = await client.request(metodo, url, **opciones)
+        latencias.append(time.perf_counter() - inicio)
+        if r.status_code != 200 or b'"errors"' in r.content:
+            errores += 1
+
+    consultas = 0
+    calculos = lecturas.calculos
+    inicio = time.perf_counter()
+    await asyncio.gather(*(una(n) for n in range(cantidad)))
+    total = time.perf_counter() - inicio
+    latencias.sort()
+    return consultas, lecturas.calculos - calculos, total, statistics.median(latencias), latencias[int(cantidad * 0.99)], errores
+
+
+async def ejecutar():
+    transporte = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=120) as client:
+        print(f"Ráfagas de solicitudes simultáneas, {N_PRODUCTOS:,} productos (mediana de {REPETICIONES} ráfagas):")
+        print(f"  {'':<22} {'':<13} {'n':>4} {'SQL/ráfaga':>10} {'cálculos':>9} {'ráfaga ms':>10} "
+              f"{'p50 ms':>8} {'p99 ms':>8} {'errores':>8}")
+        for nombre, cantidad, solicitud in escenarios():
+            for coalescer in (False, True):
+                settings.COALESCER_LECTURAS = coalescer
+                await rafaga(client, cantidad, solicitud)  # calentamiento
+                resultados = [await rafaga(client, cantidad, solicitud) for _ in range(REPETICIONES)]
+                sql, calculos, total, p50, p99, errores = (statistics.median(columna) for columna in zip(*resultados))
+                print(f"  {nombre:<22} {'single-flight' if coalescer else 'directo':<13} {cantidad:4} {sql:10.0f} "
+                      f"{calculos if coalescer else cantidad:9.0f} {total * 1e3:10.0f} {p50 * 1e3:8.1f} "
+                      f"{p99 * 1e3:8.1f} {errores:8.0f}")
+
+
+def main_bench():
+    db = SessionLocal()
+    poblar(db, N_PRODUCTOS)
+    db.close()
+    asyncio.run(ejecutar())
+
+
+if __name__ == "__main__":
+    main_bench()
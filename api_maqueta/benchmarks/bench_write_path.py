@@ -0,0 +1,124 @@
+"""Benchmark de las escrituras de ProductService: round trips y latencia.
+
+Uso (desde api_maqueta/):  python benchmarks/bench_write_path.py
+
+Compara el camino anterior (SELECT de verificación + INSERT + commit + refresh,
+SELECT + UPDATE + commit + refresh) con el actual de una sola sentencia con
+RETURNING. Cuenta las sentencias SQL y los commits enviados a SQLite.
+"""
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import models
+import schemas
+from benchmarks.comun import poblar
+from service.change_service import ChangeService
+from service.product_service import ProductService
+
+N = 2000
+
+
+class Contador:
+    def __init__(self, engine):
+        self.sentencias = 0
+        self.commits = 0
+        event.listen(engine, "before_cursor_execute", self._sentencia)
+        event.listen(engine, "commit", self._commit)
+
+    def _sentencia(self, *args):
+        self.sentencias += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def reiniciar(self):
+        self.sentencias = self.commits = 0
+
+
+# Camino anterior, tal como estaba en ProductService (incluido el registro en el log de cambios)
+def crear_anterior(db, producto: schemas.ProductoCreate):
+    existente = db.query(models.Productos).filter(
+        models.Productos.codigo_producto == producto.codigo_producto
+    ).first()
+    if existente:
+        raise ValueError("duplicado")
+    db_producto = models.Productos(**producto.model_dump())
+    db.add(db_producto)
+    db.flush()
+    ChangeService(db).registrar("producto", db_producto.id_producto, "create")
+    db.commit()
+    db.refresh(db_producto)
+    return db_producto
+
+
+def actualizar_anterior(db, producto_id: int, producto_update: schemas.ProductoUpdate):
+    db_producto = db.query(models.Productos).filter(models.Productos.id_producto == producto_id).first()
+    for field, value in producto_update.model_dump(exclude_unset=True).items():
+        setattr(db_producto, field, value)
+    ChangeService(db).registrar("producto", producto_id, "update")
+    db.commit()
+    db.refresh(db_producto)
+    return db_producto
+
+
+def ejecutar(nombre, contador, fn, esperado):
+    """Corre fn(i) N veces y comprueba que cada resultado traiga los valores escritos (esperado(i))."""
+    contador.reiniciar()
+    resultados = []
+    inicio = time.perf_counter()
+    for i in range(N):
+        resultados.append(fn(i))
+    total = time.perf_counter() - inicio
+    # Los resultados siguen referenciados: las instancias de un caso están en la sesión
+    # (identity map) cuando el siguiente las actualiza
+    for i, resultado in enumerate(resultados):
+        valores = {campo: getattr(resultado, campo) for campo in esperado(i)}
+        assert valores == esperado(i), (nombre, i, valores, esperado(i))
+        assert resultado.precio_venta is not None
+    print(f"  {nombre:<32} {contador.sentencias / N:5.2f} sentencias/op  "
+          f"{contador.commits / N:4.2f} commits/op  {total / N * 1e6:8.1f} µs/op")
+    return resultados
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        models.Base.metadata.create_all(bind=engine)
+        contador = Contador(engine)
+        Sesion = sessionmaker(bind=engine, autoflush=False)
+        poblar(Sesion(), 0)
+
+        def nuevo(prefijo, i):
+            return schemas.ProductoCreate(
+                codigo_producto=f"{prefijo}{i:06d}", nombre_producto="Filtro", id_categoria=1,
+                marca="Marca", precio_compra=Decimal(1000 + i), stock=10, id_distribuidor=1,
+            )
+
+        def creado(prefijo):
+            return lambda i: {"codigo_producto": f"{prefijo}{i:06d}", "precio_compra": Decimal(1000 + i), "stock": 10}
+
+        def actualizado(i):
+            return {"stock": i + 1000, "margen_ganancia": Decimal(25)}
+
+        print(f"{N} escrituras por caso")
+        db_anterior = Sesion()
+        ejecutar("create (anterior)", contador, lambda i: crear_anterior(db_anterior, nuevo("OLD", i)), creado("OLD"))
+        ejecutar("update (anterior)", contador, lambda i: actualizar_anterior(
+            db_anterior, i + 1, schemas.ProductoUpdate(stock=i + 1000, margen_ganancia=Decimal(25))), actualizado)
+
+        service = ProductService(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)())
+        creados = ejecutar("create (RETURNING)", contador, lambda i: service.create(nuevo("NEW", i)), creado("NEW"))
+        ejecutar("update (RETURNING)", contador, lambda i: service.update(
+            creados[i].id_producto, schemas.ProductoUpdate(stock=i + 1000, margen_ganancia=Decimal(25))), actualizado)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+"""Utilidades compartidas por los benchmarks (ejecutar desde api_maqueta/)."""
+import models
+
+
+def poblar(db, n: int, categorias: int = 10, distribuidores: int = 50):
+    """Inserta n productos sintéticos repartidos entre categorías y distribuidores."""
+    db.bulk_insert_mappings(models.Categorias, [
+        {"id_categoria": i, "nombre_categoria": f"Categoria {i}"} for i in range(1, categorias + 1)
+    ])
+    db.bulk_insert_mappings(models.Distribuidores, [
+        {"id_distribuidor": i, "nombre": f"Distribuidor {i}", "rut": f"{76000000 + i}-{i % 10}"}
+        for i in range(1, distribuidores + 1)
+    ])
+    db.bulk_insert_mappings(models.Productos, [
+        {
+            "codigo_producto": f"P{i:07d}", "nombre_producto": f"Filtro {i}", "marca": "Marca",
+            "id_categoria": i % categorias + 1, "id_distribuidor": i % distribuidores + 1,
+            "precio_compra": 1000 + i % 5000, "margen_ganancia": 30, "stock": i % 100,
+        }
+        for i in range(1, n + 1)
+    ])
+    db.commit()
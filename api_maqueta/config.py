@@ -1,9 +1,51 @@
 from pydantic_settings import BaseSettings
 
 
-class Settings:
-    JWT_SECRET: str = "secreto123"
+class Settings(BaseSettings):
+    # Cada valor se puede fijar con la variable de entorno del mismo nombre
+    JWT_SECRET: str = ""  # obligatorio (variable de entorno); sin él se rechazan todas las escrituras
     JWT_ALGORITHM: str = "HS256"
+    JWT_EXPIRA_MINUTOS: int = 60
+    JWT_SCOPE_ESCRITURA: str = "catalogo:write"  # requerido por POST/PUT/PATCH/DELETE y mutations
+    JWT_CACHE_TOKENS: int = 10000  # tokens verificados en memoria (0 desactiva el cache)
     DATABASE_URL: str = "sqlite:///./productos.db"
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 5.0  # segundos esperando una conexión libre
+    # Particionado de Productos por id_distribuidor (1 = sin particionar). Al activarlo, los productos
+    # de la base global pasan a sus shards en el arranque (con su historial) y se borran de ella
+    SHARDS: int = 1
+    SHARD_URL_TEMPLATE: str = "sqlite:///./productos_shard{n}.db"
+    SHARD_SYNC_SEGUNDOS: float = 2.0  # réplica de categorías y distribuidores escritos por otros procesos
+    SHARD_HUERFANOS_SEGUNDOS: float = 30.0  # cambios que quedaron en el log de un shard (proceso detenido) se reenvían
+    # Log de cambios del catálogo
+    CHANGE_LOG_PAGINA: int = 500
+    CHANGE_LOG_RETENCION: int = 10000  # entradas recientes que no se compactan
+    CHANGE_LOG_SONDEO_SEGUNDOS: float = 2.0  # relectura del log (escrituras de otros procesos), un solo sondeo para todas las suscripciones SSE / GraphQL
+    # Snapshot en memoria del catálogo para las lecturas frecuentes
+    CATALOG_SNAPSHOT: bool = False
+    CATALOG_SNAPSHOT_SYNC_SEGUNDOS: float = 5.0  # relectura del log (escrituras de otros procesos)
+    SNAPSHOT_COLUMNAR_LOTE: int = 65536  # filas por lote de GET /productos/snapshot.arrow|parquet
+    # Lecturas idénticas concurrentes (misma ruta, parámetros y versión del catálogo) comparten un solo cálculo
+    COALESCER_LECTURAS: bool = True
+    COALESCER_VERSION_SEGUNDOS: float = 1.0  # relectura del último seq (escrituras de otros procesos)
+    # Control de admisión por clase de ruta (ver admission.py); la suma de las
+    # concurrencias no debería superar DB_POOL_SIZE + DB_MAX_OVERFLOW
+    ADMISION_ACTIVA: bool = True
+    ADMISION_CLASES: dict = {
+        "critica": {"concurrencia": 8, "cola": 256, "espera_ms": 2000},
+        "normal": {"concurrencia": 5, "cola": 64, "espera_ms": 1000},
+        "pesada": {"concurrencia": 2, "cola": 4, "espera_ms": 250},
+    }
+    ADMISION_LIMIT_PESADO: int = 500  # GET /productos/ con limit mayor se considera pesado
+    ADMISION_RETRY_AFTER: float = 1.0
+    # Trabajos en segundo plano (ver jobs.py); con varios workers cada uno despacha y solo reanuda
+    # los trabajos cuyo propietario dejó de renovar su latido
+    JOBS_ACTIVOS: bool = True
+    JOBS_WORKERS: int = 2  # procesos del pool
+    JOBS_LOTE: int = 500  # filas por lote; el checkpoint se guarda al confirmar cada lote
+    JOBS_POLL_SEGUNDOS: float = 1.0
+    JOBS_LEASE_SEGUNDOS: float = 30.0  # sin latido en este tiempo, un trabajo en_curso se da por interrumpido
+    JOBS_DIR: str = "./trabajos"  # archivos generados por las exportaciones
 
 settings = Settings()
\ No newline at end of file
@@ -1,19 +1,35 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config import settings
-
-engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
+from sqlalchemy import create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.util import identity_key
+from config import settings
+
+engine = create_engine(
+    settings.DATABASE_URL, 
+    connect_args={"check_same_thread": False},
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT
+)
+
+# expire_on_commit=False: los objetos devueltos por INSERT/UPDATE ... RETURNING
+# siguen cargados tras el commit y no necesitan un refresh
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+Base = declarative_base()
+# Tablas que solo existen en los shards (modo particionado, ver sharding.py): no se crean en la base global
+BaseShards = declarative_base()
+
+def descartar_instancia(db: Session, modelo, id_) -> None:
+    # Un UPDATE ... RETURNING(modelo) del ORM no reemplaza los valores de una instancia que la
+    # sesión ya tiene cargada (populate_existing no aplica): se saca de la sesión antes de
+    # ejecutarlo, así el RETURNING carga una instancia nueva con la fila actualizada
+    existente = db.identity_map.get(identity_key(modelo, id_))
+    if existente is not None:
+        db.expunge(existente)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
         db.close()
\ No newline at end of file
@@ -0,0 +1,355 @@
+import asyncio
+import csv
+import io
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from typing import Callable, Dict, Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal, engine
+import models
+import schemas
+import sharding
+from service.job_service import JobService
+from service.product_service import ProductService
+from service.sharded_product_service import conectar_sharding, product_service_para
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================
+# EJECUCIÓN DE UN TRABAJO (en un proceso del pool)
+# ==============================
+class TrabajoCancelado(Exception):
+    pass
+
+
+class TrabajoPerdido(Exception):
+    """Otro ejecutor tomó el trabajo (este dejó vencer su latido): el lote en curso se descarta."""
+
+
+class Contexto:
+    """Estado de un trabajo en ejecución. Las tareas procesan por lotes y llaman a
+    avanzar() después de cada uno, que confirma el checkpoint. Las escrituras que
+    la tarea no haya confirmado por su cuenta van en esa misma transacción (el
+    reprecio); las que confirman fila a fila (la importación) se repiten al
+    reanudar y la tarea debe reconocerlas.
+    """
+
+    def __init__(self, db: Session, trabajo: models.Trabajos, propietario: str):
+        self.db = db
+        self.id_trabajo = trabajo.id_trabajo
+        self.propietario = propietario
+        self.checkpoint = trabajo.checkpoint
+        self.procesados = trabajo.procesados
+
+    def avanzar(self, checkpoint: dict, procesados: int, total: Optional[int] = None) -> None:
+        valores = {"checkpoint": checkpoint, "procesados": procesados}
+        if total is not None:
+            valores["total"] = total
+        # Solo mientras el trabajo siga siendo de este ejecutor; si no, el lote se revierte sin confirmar
+        actualizados = self.db.execute(
+            update(models.Trabajos)
+            .where(models.Trabajos.id_trabajo == self.id_trabajo,
+                   models.Trabajos.estado == "en_curso",
+                   models.Trabajos.propietario == self.propietario)
+            .values(**valores)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not actualizados:
+            self.db.rollback()
+            raise TrabajoPerdido()
+        self.db.commit()
+        # Libera los objetos del lote confirmado (las exportaciones recorren todo el catálogo)
+        self.db.expunge_all()
+        self.checkpoint, self.procesados = checkpoint, procesados
+        if self.db.scalar(select(models.Trabajos.cancelacion_solicitada).where(
+            models.Trabajos.id_trabajo == self.id_trabajo
+        )):
+            raise TrabajoCancelado()
+
+
+def importar_productos(ctx: Contexto, parametros: dict) -> dict:
+    """Carga masiva de productos; los códigos ya existentes se omiten.
+
+    Cada alta se confirma por separado, así que un lote interrumpido a medias se
+    repite al reanudar. Antes de cada lote el checkpoint guarda qué códigos ya
+    existían: al repetirlo, un código que "ya existe" sin estar en esa lista es
+    un alta del intento anterior y se cuenta como creado, no como omitido.
+    """
+    productos = parametros["productos"]
+    estado = ctx.checkpoint or {"indice": 0, "creados": 0, "omitidos": 0, "errores": []}
+    service = product_service_para(ctx.db)
+    ctx.avanzar(estado, estado["indice"], total=len(productos))
+    while estado["indice"] < len(productos):
+        lote = productos[estado["indice"]:estado["indice"] + settings.JOBS_LOTE]
+        reanudado = "existentes" in estado
+        if not reanudado:
+            codigos = [datos["codigo_producto"] for datos in lote]
+            existentes = [p.codigo_producto for p in service.get_many_by_codigo_producto(codigos) if p]
+            estado = dict(estado, existentes=sorted(set(existentes)))
+            ctx.avanzar(estado, estado["indice"])
+        existentes = set(estado["existentes"])
+        estado = dict(estado, errores=list(estado["errores"]))
+        vistos = set()
+        for i, datos in enumerate(lote, start=estado["indice"]):
+            codigo = datos["codigo_producto"]
+            if codigo in existentes or codigo in vistos:
+                estado["omitidos"] += 1
+                continue
+            vistos.add(codigo)
+            try:
+                service.create(schemas.ProductoCreate(**datos))
+                estado["creados"] += 1
+            except ValueError as e:
+                if "ya existe" in str(e):
+                    # Al reanudar, el alta del intento anterior; si no, otro cliente lo creó entretanto
+                    estado["creados" if reanudado else "omitidos"] += 1
+                elif len(estado["errores"]) < 100:
+                    estado["errores"].append({"indice": i, "error": str(e)})
+        estado["indice"] += len(lote)
+        del estado["existentes"]
+        ctx.avanzar(estado, estado["indice"])
+    return {"creados": estado["creados"], "omitidos": estado["omitidos"], "errores": estado["errores"]}
+
+
+def repreciar_productos(ctx: Contexto, parametros: dict) -> dict:
+    """Reprecio masivo: cada lote es un UPDATE confirmado junto con su checkpoint."""
+    service = ProductService(ctx.db)
+    valores = {
+        campo: Decimal(parametros[campo]) if parametros.get(campo) is not None else None
+        for campo in ("margen_ganancia", "factor_precio")
+    }
+    estado = ctx.checkpoint or {"after_id": 0}
+    procesados = ctx.procesados
+    if ctx.checkpoint is None:
+        ctx.avanzar(estado, 0, total=_contar(ctx.db, parametros))
+    while True:
+        ids = service.repreciar_lote(
+            estado["after_id"], settings.JOBS_LOTE, **valores,
+            categoria_id=parametros.get("categoria_id"), distribuidor_id=parametros.get("distribuidor_id")
+        )
+        if not ids:
+            break
+        estado = {"after_id": ids[-1]}
+        procesados += len(ids)
+        ctx.avanzar(estado, procesados)
+    return {"actualizados": procesados}
+
+
+COLUMNAS_EXPORTACION = [
+    "id_producto", "codigo_producto", "nombre_producto", "marca", "categoria", "distribuidor",
+    "precio_compra", "margen_ganancia", "precio_neto", "precio_iva", "precio_venta", "stock",
+]
+
+
+def exportar_productos(ctx: Contexto, parametros: dict) -> dict:
+    """Exporta el catálogo a CSV en JOBS_DIR. El checkpoint guarda el último id y el
+    tamaño del archivo confirmado; al reanudar se trunca lo escrito después."""
+    os.makedirs(settings.JOBS_DIR, exist_ok=True)
+    ruta = os.path.join(settings.JOBS_DIR, f"exportacion_{ctx.id_trabajo}.csv")
+    estado = ctx.checkpoint or {"after_id": 0, "bytes": 0, "filas": 0}
+    service = product_service_para(ctx.db)
+    if ctx.checkpoint is None:
+        ctx.avanzar(estado, 0, total=_contar(ctx.db, parametros))
+
+    with open(ruta, "ab") as archivo:
+        archivo.truncate(estado["bytes"])
+        archivo.seek(estado["bytes"])
+        if estado["bytes"] == 0:
+            archivo.write(_csv([COLUMNAS_EXPORTACION]))
+        while True:
+            productos = service.listar_desde(
+                estado["after_id"], settings.JOBS_LOTE,
+                parametros.get("categoria_id"), parametros.get("distribuidor_id")
+            )
+            if not productos:
+                break
+            archivo.write(_csv([
+                [p.id_producto, p.codigo_producto, p.nombre_producto, p.marca,
+                 p.categoria.nombre_categoria if p.categoria else "",
+                 p.distribuidor.nombre if p.distribuidor else "",
+                 p.precio_compra, p.margen_ganancia, p.precio_neto, p.precio_iva, p.precio_venta, p.stock]
+                for p in productos
+            ]))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+            estado = {
+                "after_id": productos[-1].id_producto,
+                "bytes": archivo.tell(),
+                "filas": estado["filas"] + len(productos),
+            }
+            ctx.avanzar(estado, estado["filas"])
+    return {"archivo": os.path.abspath(ruta), "filas": estado["filas"], "bytes": estado["bytes"]}
+
+
+def reconstruir_indices(ctx: Contexto, parametros: dict) -> dict:
+    """REINDEX y ANALYZE de la base global y de cada shard; un paso por checkpoint."""
+    engines = [engine] + (sharding.router.engines if sharding.router else [])
+    pasos = [(n, sentencia) for n in range(len(engines)) for sentencia in ("REINDEX", "ANALYZE")]
+    hechos = (ctx.checkpoint or {}).get("pasos", 0)
+    ctx.avanzar({"pasos": hechos}, hechos, total=len(pasos))
+    for n, (base, sentencia) in enumerate(pasos[hechos:], start=hechos + 1):
+        with engines[base].begin() as conexion:
+            conexion.exec_driver_sql(sentencia)
+        ctx.avanzar({"pasos": n}, n)
+    return {"bases": len(engines), "pasos": len(pasos)}
+
+
+def _contar(db: Session, parametros: dict) -> Optional[int]:
+    if parametros.get("categoria_id") or parametros.get("distribuidor_id"):
+        return None
+    return product_service_para(db).count_all()
+
+
+def _csv(filas) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(filas)
+    return buffer.getvalue().encode("utf-8")
+
+
+TAREAS: Dict[str, Callable[[Contexto, dict], dict]] = {
+    "importacion": importar_productos,
+    "reprecio": repreciar_productos,
+    "exportacion": exportar_productos,
+    "reindexado": reconstruir_indices,
+}
+
+
+def ejecutar_trabajo(trabajo_id: int, propietario: str) -> str:
+    """Punto de entrada en el proceso del pool: corre la tarea y deja el estado final en la tabla."""
+    db = SessionLocal()
+    try:
+        trabajo = db.get(models.Trabajos, trabajo_id)
+        if trabajo.estado != "en_curso" or trabajo.propietario != propietario:
+            return "perdido"
+        ctx = Contexto(db, trabajo, propietario)
+        service = JobService(db)
+        try:
+            resultado = TAREAS[trabajo.tipo](ctx, trabajo.parametros)
+        except TrabajoPerdido:
+            logger.warning("El trabajo %s pasó a otro ejecutor; se abandona", trabajo_id)
+            return "perdido"
+        except TrabajoCancelado:
+            db.rollback()
+            service.finalizar(trabajo_id, "cancelado", propietario=propietario)
+            return "cancelado"
+        except Exception as e:
+            db.rollback()
+            logger.exception("Falló el trabajo %s", trabajo_id)
+            service.finalizar(trabajo_id, "fallido", error=f"{type(e).__name__}: {e}", propietario=propietario)
+            return "fallido"
+        service.finalizar(trabajo_id, "completado", resultado=resultado, propietario=propietario)
+        return "completado"
+    finally:
+        db.close()
+
+
+def _iniciar_proceso() -> None:
+    # Cada proceso del pool abre sus propias conexiones; los shards solo se conectan (ya están replicados)
+    if settings.SHARDS > 1:
+        conectar_sharding()
+
+
+# ==============================
+# EJECUTOR (en el proceso de la app)
+# ==============================
+class JobRunner:
+    """Despacha los trabajos pendientes a un pool de procesos.
+
+    El trabajo pesado corre fuera del proceso de la app, así no compite por el
+    GIL ni bloquea el event loop; aquí solo se consulta la tabla de trabajos
+    (en un hilo) y se espera a los procesos.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        # Identifica a este ejecutor entre los workers de la app (columna propietario de Trabajos)
+        self.id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tarea: Optional[asyncio.Task] = None
+        self._despertar = asyncio.Event()
+        self._en_curso: Dict[Future, tuple] = {}
+        self._ultimo_latido = 0.0
+
+    async def iniciar(self) -> None:
+        self._executor = self._crear_executor()
+        self._tarea = asyncio.create_task(self._despachar())
+
+    async def detener(self) -> None:
+        if self._tarea:
+            self._tarea.cancel()
+        if self._executor:
+            # Los trabajos en curso que no alcancen a terminar se reanudan cuando venza su latido
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def avisar(self) -> None:
+        """Despacha de inmediato en vez de esperar al siguiente sondeo."""
+        self._despertar.set()
+
+    def _crear_executor(self) -> ProcessPoolExecutor:
+        # spawn: los procesos no heredan conexiones ni hilos (pool de shards) del proceso de la app
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_iniciar_proceso,
+        )
+
+    async def _despachar(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                if time.monotonic() - self._ultimo_latido >= settings.JOBS_LEASE_SEGUNDOS / 3:
+                    await asyncio.to_thread(self._mantener_latido)
+                libres = self.workers - len(self._en_curso)
+                if libres > 0:
+                    for trabajo_id in await asyncio.to_thread(self._con_servicio, JobService.tomar_pendientes, libres, self.id):
+                        futuro = self._executor.submit(ejecutar_trabajo, trabajo_id, self.id)
+                        self._en_curso[futuro] = (trabajo_id, self._executor)
+                        futuro.add_done_callback(
+                            lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._terminado, f)
+                        )
+            except Exception:
+                # Un error de la base (p. ej. "database is locked") no debe detener el despacho ni los latidos
+                logger.exception("Falló el despacho de trabajos; se reintenta")
+            self._despertar.clear()
+            try:
+                await asyncio.wait_for(self._despertar.wait(), timeout=settings.JOBS_POLL_SEGUNDOS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _terminado(self, futuro: Future) -> None:
+        trabajo_id, executor = self._en_curso.pop(futuro)
+        if executor is self._executor and not futuro.cancelled() and isinstance(futuro.exception(), BrokenProcessPool):
+            # Un proceso del pool murió: sus trabajos vuelven a pendiente y se reanudan desde su checkpoint
+            logger.error("El pool de trabajos se interrumpió (trabajo %s); se reinicia", trabajo_id)
+            self._executor = self._crear_executor()
+            self._con_servicio(JobService.reanudar_interrumpidos, self.id)
+        self.avisar()
+
+    def _mantener_latido(self) -> None:
+        # Renueva los trabajos propios y reanuda los de ejecutores detenidos (incluido este mismo proceso antes de reiniciar)
+        self._con_servicio(JobService.renovar, self.id)
+        reanudados = self._con_servicio(JobService.reanudar_interrumpidos)
+        if reanudados:
+            logger.info("Reanudando %s trabajos interrumpidos", reanudados)
+        self._ultimo_latido = time.monotonic()
+
+    @staticmethod
+    def _con_servicio(metodo, *args):
+        db = SessionLocal()
+        try:
+            return metodo(JobService(db), *args)
+        finally:
+            db.close()
+
+
+runner = JobRunner(settings.JOBS_WORKERS)
@@ -1,24 +1,125 @@
+import asyncio
+import logging
 from fastapi import FastAPI
 import models
-from database import engine
+from config import settings
+from auth import SECRETOS_INSEGUROS
+from admission import AdmissionMiddleware
+from database import engine, SessionLocal
 from routers import rest, graphql
 from routers.graphql import graphql_router
+from service.catalog_snapshot import snapshot
+from service.distribuidor_service import DistribuidorService
+from service.single_flight import refrescar_version
+from service.sharded_product_service import activar_sharding, detener_sharding
+from jobs import runner
+
+# Sin un JWT_SECRET propio no se aceptan tokens (ver auth.secreto_jwt)
+if settings.JWT_SECRET in SECRETOS_INSEGUROS:
+    logging.getLogger(__name__).warning("JWT_SECRET no está configurado: todas las escrituras responderán 503")
 
 # Crear tablas
 models.Base.metadata.create_all(bind=engine)
 
+# RUT guardados antes de normalizarlos (las búsquedas por RUT son solo por igualdad)
+_db = SessionLocal()
+try:
+    DistribuidorService(_db).normalizar_ruts_existentes()
+finally:
+    _db.close()
+
+# Particionado opcional de Productos por distribuidor
+if settings.SHARDS > 1:
+    _db = SessionLocal()
+    try:
+        activar_sharding(_db)
+    finally:
+        _db.close()
+
 app = FastAPI(
     title="API de Productos - Sistema Vehicular",
     description="API REST y GraphQL para gestión de productos vehiculares",
     version="2.0.0"
 )
 
+# Control de admisión: 503 rápido con Retry-After en vez de timeouts bajo saturación
+if settings.ADMISION_ACTIVA:
+    app.add_middleware(AdmissionMiddleware)
+
 # Incluir routers
 app.include_router(rest.router_productos)
 app.include_router(rest.router_categorias)
 app.include_router(rest.router_distribuidores)
+app.include_router(rest.router_jobs)
 app.include_router(graphql_router, prefix="/graphql")
 
+# Snapshot en memoria del catálogo (opcional)
+def _cargar_snapshot():
+    db = SessionLocal()
+    try:
+        snapshot.cargar(db)
+    finally:
+        db.close()
+
+def _sincronizar_snapshot():
+    db = SessionLocal()
+    try:
+        snapshot.sincronizar(db)
+    finally:
+        db.close()
+
+async def _sincronizar_snapshot_periodicamente():
+    while True:
+        await asyncio.sleep(settings.CATALOG_SNAPSHOT_SYNC_SEGUNDOS)
+        await asyncio.to_thread(_sincronizar_snapshot)
+
+@app.on_event("startup")
+async def iniciar_snapshot():
+    if settings.CATALOG_SNAPSHOT:
+        await asyncio.to_thread(_cargar_snapshot)
+        app.state.sync_snapshot = asyncio.create_task(_sincronizar_snapshot_periodicamente())
+
+@app.on_event("shutdown")
+async def detener_snapshot():
+    tarea = getattr(app.state, "sync_snapshot", None)
+    if tarea:
+        tarea.cancel()
+
+# Versión del catálogo para las lecturas compartidas: relectura periódica (escrituras de otros procesos)
+async def _refrescar_version_periodicamente():
+    while True:
+        await asyncio.sleep(settings.COALESCER_VERSION_SEGUNDOS)
+        await asyncio.to_thread(refrescar_version)
+
+@app.on_event("startup")
+async def iniciar_version_catalogo():
+    if settings.COALESCER_LECTURAS:
+        await asyncio.to_thread(refrescar_version)
+        app.state.version_catalogo = asyncio.create_task(_refrescar_version_periodicamente())
+
+@app.on_event("shutdown")
+async def detener_version_catalogo():
+    tarea = getattr(app.state, "version_catalogo", None)
+    if tarea:
+        tarea.cancel()
+
+# Particionado: al detenerse, los cambios de los shards que falten pasan al log global
+@app.on_event("shutdown")
+async def detener_relay_shards():
+    if settings.SHARDS > 1:
+        await asyncio.to_thread(detener_sharding)
+
+# Trabajos en segundo plano: los pendientes se despachan a un pool de procesos
+@app.on_event("startup")
+async def iniciar_trabajos():
+    if settings.JOBS_ACTIVOS:
+        await runner.iniciar()
+
+@app.on_event("shutdown")
+async def detener_trabajos():
+    if settings.JOBS_ACTIVOS:
+        await runner.detener()
+
 @app.get("/")
 async def root():
     return {
@@ -34,38 +135,58 @@ async def root():
                     "GET_ALL": "GET /productos/",
                     "GET_BY_ID": "GET /productos/{producto_id}",
                     "GET_BY_CODIGO": "GET /productos/codigo-producto/{codigo_producto}",
+                    "HISTORY": "GET /productos/{producto_id}/history?from={fecha}&to={fecha}",
+                    "HISTORY_SERIES": "GET /productos/{producto_id}/history/series?from=&to=&buckets=100",
+                    "BATCH_GET": "POST /productos/batch-get",
+                    "CHANGES": "GET /productos/changes?since={seq}",
+                    "CHANGES_STREAM": "GET /productos/changes/stream (Server-Sent Events)",
+                    "CHANGES_COMPACT": "POST /productos/changes/compact (Protegido con JWT)",
+                    "SNAPSHOT_ARROW": "GET /productos/snapshot.arrow (stream Arrow IPC, requiere pyarrow)",
+                    "SNAPSHOT_PARQUET": "GET /productos/snapshot.parquet (requiere pyarrow)",
                     "POST": "POST /productos/ (Protegido con JWT)",
-                    "PUT": "PUT /productos/{producto_id}",
-                    "PATCH": "PATCH /productos/{producto_id}",
-                    "DELETE": "DELETE /productos/{producto_id}"
+                    "PUT": "PUT /productos/{producto_id} (Protegido con JWT)",
+                    "PATCH": "PATCH /productos/{producto_id} (Protegido con JWT)",
+                    "DELETE": "DELETE /productos/{producto_id} (Protegido con JWT)"
                 },
                 "categorias": {
                     "GET_ALL": "GET /categorias/",
                     "GET_BY_ID": "GET /categorias/{categoria_id}",
                     "POST": "POST /categorias/ (Protegido con JWT)",
-                    "PUT": "PUT /categorias/{categoria_id}",
-                    "PATCH": "PATCH /categorias/{categoria_id}",
-                    "DELETE": "DELETE /categorias/{categoria_id}"
+                    "PUT": "PUT /categorias/{categoria_id} (Protegido con JWT)",
+                    "PATCH": "PATCH /categorias/{categoria_id} (Protegido con JWT)",
+                    "DELETE": "DELETE /categorias/{categoria_id} (Protegido con JWT)"
                 },
                 "distribuidores": {
                     "GET_ALL": "GET /distribuidores/",
+                    "GET_MANY": "GET /distribuidores/?ids=1,2,3",
                     "GET_BY_ID": "GET /distribuidores/{distribuidor_id}",
                     "GET_BY_RUT": "GET /distribuidores/rut/{rut}",
                     "POST": "POST /distribuidores/ (Protegido con JWT)",
-                    "PUT": "PUT /distribuidores/{distribuidor_id}",
-                    "PATCH": "PATCH /distribuidores/{distribuidor_id}",
-                    "DELETE": "DELETE /distribuidores/{distribuidor_id}"
+                    "PUT": "PUT /distribuidores/{distribuidor_id} (Protegido con JWT)",
+                    "PATCH": "PATCH /distribuidores/{distribuidor_id} (Protegido con JWT)",
+                    "DELETE": "DELETE /distribuidores/{distribuidor_id} (Protegido con JWT)"
+                },
+                "jobs": {
+                    "GET_ALL": "GET /jobs/?estado={estado}",
+                    "GET_BY_ID": "GET /jobs/{trabajo_id}",
+                    "GET_ARCHIVO": "GET /jobs/{trabajo_id}/archivo",
+                    "POST": "POST /jobs/ {tipo: importacion|reprecio|exportacion|reindexado, parametros} (Protegido con JWT)",
+                    "CANCEL": "POST /jobs/{trabajo_id}/cancel (Protegido con JWT)"
                 }
             },
             "graphql": {
                 "endpoint": "POST /graphql",
-                "queries": ["products", "product", "categories", "distribuidores"],
-                "mutations": ["createProduct", "createCategoria", "createDistribuidor"]
+                "queries": ["products", "product", "productsByIds", "productsByCodes", "categories", "distribuidores"],
+                "mutations": ["createProduct", "createCategoria", "createDistribuidor"],
+                "subscriptions": ["productChanges"]
             }
         },
         "autenticacion": {
-            "metodo": "Bearer Token",
-            "token": "secreto123"
+            "metodo": "Bearer Token (JWT)",
+            "algoritmo": settings.JWT_ALGORITHM,
+            "scope_escritura": settings.JWT_SCOPE_ESCRITURA,
+            "emitir_token": "python auth.py <usuario>",
+            "graphql": "Las mutations requieren el mismo token"
         }
     }
 
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, DECIMAL, Computed
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, DECIMAL, Computed, Index, Boolean, JSON
 from sqlalchemy.orm import relationship
 from datetime import datetime, date
-from database import Base
+from database import Base, BaseShards
 
 # ==============================
 # TABLA DISTRIBUIDORES
@@ -59,4 +59,78 @@ class Productos(Base):
     
     # Relationships
     categoria = relationship("Categorias", back_populates="productos")
-    distribuidor = relationship("Distribuidores", back_populates="productos")
\ No newline at end of file
+    distribuidor = relationship("Distribuidores", back_populates="productos")
+
+# ==============================
+# TABLA CAMBIOS CATALOGO (log de cambios, solo se agrega)
+# ==============================
+# En modo particionado cada shard tiene también esta tabla: los cambios de
+# productos se anotan en su shard junto con la escritura y luego se mueven al
+# log global (ver RelayCambios en service/sharded_product_service.py).
+class CambiosCatalogo(Base):
+    __tablename__ = "CambiosCatalogo"
+    __table_args__ = (
+        Index("ix_cambios_entidad", "entidad", "id_entidad"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entidad = Column(String(20), nullable=False)  # producto, categoria, distribuidor
+    id_entidad = Column(Integer, nullable=False)
+    operacion = Column(String(10), nullable=False)  # create, update, delete
+    fecha = Column(DateTime, default=datetime.now, nullable=False)
+
+
+# ==============================
+# TABLAS DE LOS SHARDS (solo en modo particionado, fuera de Base.metadata)
+# ==============================
+# Ubicación de cada producto. La fila vive en el shard dueño de su código
+# (crc32 del código módulo N, ver sharding.py), así la restricción UNIQUE
+# local garantiza que codigo_producto sea único entre todos los shards.
+class DirectorioProductos(BaseShards):
+    __tablename__ = "DirectorioProductos"
+
+    id_producto = Column(Integer, primary_key=True, autoincrement=False)
+    codigo_producto = Column(String(50), unique=True, nullable=False)
+    shard = Column(Integer, nullable=False)  # shard donde está la fila de Productos
+    # Cambio de shard en curso: shard que puede tener una copia de la fila que no vale (el destino
+    # antes de apuntar aquí, el origen después) y desde cuándo; ver ShardedProductService._mover
+    shard_pendiente = Column(Integer, index=True)
+    movido = Column(DateTime)
+
+
+# Generador de id_producto de cada shard (una sola fila): avanza de a `paso`
+# desde un valor congruente con el número del shard, así los ids de shards
+# distintos nunca coinciden.
+class SecuenciaProductos(BaseShards):
+    __tablename__ = "SecuenciaProductos"
+
+    id = Column(Integer, primary_key=True)
+    ultimo_id = Column(Integer, nullable=False)
+    paso = Column(Integer, nullable=False)  # número de shards con que se sembró
+
+
+# ==============================
+# TABLA TRABAJOS (operaciones largas en segundo plano, ver jobs.py)
+# ==============================
+class Trabajos(Base):
+    __tablename__ = "Trabajos"
+    __table_args__ = (
+        Index("ix_trabajos_estado", "estado", "id_trabajo"),
+    )
+
+    id_trabajo = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(20), nullable=False)  # importacion, reprecio, exportacion, reindexado
+    estado = Column(String(12), nullable=False, default="pendiente")  # pendiente, en_curso, completado, fallido, cancelado
+    parametros = Column(JSON, nullable=False, default=dict)
+    checkpoint = Column(JSON)  # avance del último lote confirmado, para reanudar
+    procesados = Column(Integer, nullable=False, default=0)
+    total = Column(Integer)
+    resultado = Column(JSON)
+    error = Column(Text)
+    cancelacion_solicitada = Column(Boolean, nullable=False, default=False)
+    creado = Column(DateTime, default=datetime.now, nullable=False)
+    iniciado = Column(DateTime)
+    terminado = Column(DateTime)
+    propietario = Column(String(64))  # ejecutor que lo tomó (ver JobRunner.id)
+    latido = Column(DateTime)  # última renovación del propietario; vencida, el trabajo se reanuda en otro ejecutor
@@ -1,12 +1,20 @@
 import strawberry
-from typing import List, Optional
+from typing import AsyncGenerator, List, Optional
 from strawberry.fastapi import GraphQLRouter
+from strawberry.permission import BasePermission
+from strawberry.scalars import JSON
 from sqlalchemy.orm import Session
 from fastapi import Depends
 
+from auth import SecretoNoConfigurado, verificar_token
+from config import settings
 from database import get_db
-from service.product_service import ProductService
+from service.sharded_product_service import product_service_para
+from service.catalog_snapshot import get_catalog_snapshot
 from service.category_service import CategoryService
+from service.distribuidor_service import DistribuidorService
+from service.change_service import escuchar_cambios
+from service.single_flight import compartir
 import models
 import schemas
 
@@ -14,10 +22,28 @@ import schemas
 async def get_context(db: Session = Depends(get_db)):
     return {
         "db": db, 
-        "product_service": ProductService(db),
-        "category_service": CategoryService(db)
+        "product_service": product_service_para(db),
+        "category_service": CategoryService(db),
+        "distribuidor_service": DistribuidorService(db)
     }
 
+# Permisos GraphQL: las mutations exigen el mismo JWT que las escrituras REST
+class IsAuthenticated(BasePermission):
+    message = "Token inválido o expirado"
+
+    def has_permission(self, source, info, **kwargs) -> bool:
+        autorizacion = info.context["request"].headers.get("Authorization", "")
+        esquema, _, token = autorizacion.partition(" ")
+        if esquema.lower() != "bearer" or not token:
+            self.message = "Falta el token Bearer"
+            return False
+        try:
+            info.context["token"] = verificar_token(token, [settings.JWT_SCOPE_ESCRITURA])
+        except (ValueError, PermissionError, SecretoNoConfigurado) as e:
+            self.message = str(e)
+            return False
+        return True
+
 # Tipos GraphQL
 @strawberry.type
 class Categoria:
@@ -89,6 +115,26 @@ class Product:
             distribuidor=Distribuidor.from_db(db_producto.distribuidor) if db_producto.distribuidor else None
         )
 
+@strawberry.type
+class CambioCatalogo:
+    seq: int
+    entidad: str
+    id_entidad: int
+    operacion: str
+    fecha: str
+    datos: Optional[JSON]
+
+    @classmethod
+    def from_evento(cls, evento: dict):
+        return cls(
+            seq=evento["seq"],
+            entidad=evento["entidad"],
+            id_entidad=evento["id_entidad"],
+            operacion=evento["operacion"],
+            fecha=evento["fecha"],
+            datos=evento["datos"]
+        )
+
 # Inputs GraphQL
 @strawberry.input
 class ProductInput:
@@ -115,41 +161,70 @@ class DistribuidorInput:
     direccion: Optional[str] = None
     ciudad: Optional[str] = None
 
+# Mismo tope que POST /productos/batch-get
+def validar_lote(claves: list) -> None:
+    if len(claves) > schemas.MAX_PRODUCTOS_POR_CONSULTA:
+        raise Exception(f"Se permiten como máximo {schemas.MAX_PRODUCTOS_POR_CONSULTA} productos por consulta")
+
 # Queries GraphQL
 @strawberry.type
 class Query:
     @strawberry.field
-    def products(self, info, skip: int = 0, limit: int = 100) -> List[Product]:
+    async def products(self, info, skip: int = 0, limit: int = 100) -> List[Product]:
         """Query products - Obtener lista de productos"""
-        service = info.context["product_service"]
-        db_productos = service.get_all(skip=skip, limit=limit)
-        return [Product.from_db(producto) for producto in db_productos]
+        def listar(db: Session) -> List[Product]:
+            db_productos = product_service_para(db).get_all(skip=skip, limit=limit)
+            return [Product.from_db(producto) for producto in db_productos]
+
+        return await compartir("graphql products", {"skip": skip, "limit": limit}, listar)
     
     @strawberry.field
-    def product(self, info, id: int) -> Optional[Product]:
+    async def product(self, info, id: int) -> Optional[Product]:
         """Query product - Obtener un producto por ID"""
-        service = info.context["product_service"]
-        db_producto = service.get_by_id(id)
-        return Product.from_db(db_producto) if db_producto else None
+        def buscar(db: Session) -> Optional[Product]:
+            db_producto = product_service_para(db).get_by_id(id)
+            return Product.from_db(db_producto) if db_producto else None
+
+        return await compartir("graphql product", {"id": id}, buscar)
     
     @strawberry.field
-    def categories(self, info) -> List[Categoria]:
+    def productsByIds(self, info, ids: List[int]) -> List[Optional[Product]]:
+        """Query productsByIds - Obtener varios productos por ID (null si no existe)"""
+        validar_lote(ids)
+        snapshot = get_catalog_snapshot()
+        productos = snapshot.get_productos(ids) if snapshot else info.context["product_service"].get_many(ids)
+        return [Product.from_db(p) if p else None for p in productos]
+
+    @strawberry.field
+    def productsByCodes(self, info, codigos: List[str]) -> List[Optional[Product]]:
+        """Query productsByCodes - Obtener varios productos por código (null si no existe)"""
+        validar_lote(codigos)
+        snapshot = get_catalog_snapshot()
+        if snapshot:
+            productos = snapshot.get_productos_by_codigo(codigos)
+        else:
+            productos = info.context["product_service"].get_many_by_codigo_producto(codigos)
+        return [Product.from_db(p) if p else None for p in productos]
+
+    @strawberry.field
+    async def categories(self, info) -> List[Categoria]:
         """Query categories - Obtener todas las categorías"""
-        service = info.context["category_service"]
-        db_categorias = service.get_all()
-        return [Categoria.from_db(categoria) for categoria in db_categorias]
+        def listar(db: Session) -> List[Categoria]:
+            return [Categoria.from_db(categoria) for categoria in CategoryService(db).get_all()]
+
+        return await compartir("graphql categories", {}, listar)
 
     @strawberry.field
-    def distribuidores(self, info) -> List[Distribuidor]:
-        """Query distribuidores - Obtener todos los distribuidores"""
-        db = info.context["db"]
-        db_distribuidores = db.query(models.Distribuidores).all()
+    def distribuidores(self, info, ids: Optional[List[int]] = None) -> List[Distribuidor]:
+        """Query distribuidores - Obtener todos los distribuidores, o solo los indicados en `ids`"""
+        service = info.context["distribuidor_service"]
+        db_distribuidores = service.get_all() if ids is None else service.get_many(ids)
         return [Distribuidor.from_db(distribuidor) for distribuidor in db_distribuidores]
 
 # Mutations GraphQL
 @strawberry.type
 class Mutation:
-    @strawberry.mutation
+    @strawberry.mutation(permission_classes=[IsAuthenticated])
     def createProduct(self, info, product: ProductInput) -> Product:
         """Mutation createProduct - Crear un nuevo producto"""
         service = info.context["product_service"]
@@ -172,7 +247,7 @@ class Mutation:
         except ValueError as e:
             raise Exception(str(e))
 
-    @strawberry.mutation
+    @strawberry.mutation(permission_classes=[IsAuthenticated])
     def createCategoria(self, info, categoria: CategoriaInput) -> Categoria:
         """Mutation createCategoria - Crear una nueva categoría"""
         service = info.context["category_service"]
@@ -187,10 +262,10 @@ class Mutation:
         except ValueError as e:
             raise Exception(str(e))
 
-    @strawberry.mutation
+    @strawberry.mutation(permission_classes=[IsAuthenticated])
     def createDistribuidor(self, info, distribuidor: DistribuidorInput) -> Distribuidor:
         """Mutation createDistribuidor - Crear un nuevo distribuidor"""
-        db = info.context["db"]
+        service = info.context["distribuidor_service"]
         
         distribuidor_data = schemas.DistribuidorCreate(
             nombre=distribuidor.nombre,
@@ -202,14 +277,20 @@ class Mutation:
         )
         
         try:
-            db_distribuidor = models.Distribuidores(**distribuidor_data.dict())
-            db.add(db_distribuidor)
-            db.commit()
-            db.refresh(db_distribuidor)
+            db_distribuidor = service.create(distribuidor_data)
             return Distribuidor.from_db(db_distribuidor)
-        except Exception as e:
-            db.rollback()
-            raise Exception(f"Error al crear distribuidor: {str(e)}")
+        except ValueError as e:
+            raise Exception(str(e))
+
+# Subscriptions GraphQL
+@strawberry.type
+class Subscription:
+    @strawberry.subscription
+    async def productChanges(self, info, since: Optional[int] = None) -> AsyncGenerator[CambioCatalogo, None]:
+        """Subscription productChanges - Cambios del catálogo en vivo (reenvía desde `since` si se indica)"""
+        async for evento in escuchar_cambios(since):
+            if evento is not None:
+                yield CambioCatalogo.from_evento(evento)
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+schema = strawberry.Schema(query=Query, mutation=Mutation, subscription=Subscription)
 graphql_router = GraphQLRouter(schema, context_getter=get_context)
\ No newline at end of file
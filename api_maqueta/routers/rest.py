@@ -1,30 +1,57 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import json
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Path, status, Query
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 from database import get_db
 from service.product_service import ProductService
+from service.sharded_product_service import product_service_para
 from service.category_service import CategoryService
+from service.distribuidor_service import DistribuidorService
+from service.change_service import ChangeService, escuchar_cambios
+from service.catalog_snapshot import CatalogSnapshot, get_catalog_snapshot
+from service import columnar_snapshot
+from service.single_flight import codificar, compartir
+from service.job_service import JobService
+from jobs import runner
+from config import settings
+from auth import SecretoNoConfigurado, verificar_token
 import schemas
-import models
 
-# Dependencia de autenticación
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())):
-    if credentials.credentials != "secreto123":
+# Dependencia de autenticación: JWT firmado con scope de escritura
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer())) -> dict:
+    try:
+        return verificar_token(credentials.credentials, [settings.JWT_SCOPE_ESCRITURA])
+    except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido o expirado"
+            detail=str(e),
+            headers={"WWW-Authenticate": "Bearer"}
         )
-    return True
+    except PermissionError as e:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=str(e))
+    except SecretoNoConfigurado as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
 
 # Dependencias de servicios
 def get_product_service(db: Session = Depends(get_db)) -> ProductService:
-    return ProductService(db)
+    return product_service_para(db)
 
 def get_category_service(db: Session = Depends(get_db)) -> CategoryService:
     return CategoryService(db)
 
+def get_distribuidor_service(db: Session = Depends(get_db)) -> DistribuidorService:
+    return DistribuidorService(db)
+
+def get_change_service(db: Session = Depends(get_db)) -> ChangeService:
+    return ChangeService(db)
+
+def get_job_service(db: Session = Depends(get_db)) -> JobService:
+    return JobService(db)
+
 # ==============================
 # ROUTER PARA PRODUCTOS
 # ==============================
@@ -36,53 +63,218 @@ async def get_all_productos(
     limit: int = 100,
     categoria_id: Optional[int] = Query(None),
     distribuidor_id: Optional[int] = Query(None),
-    service: ProductService = Depends(get_product_service)
+    after_id: Optional[int] = Query(None, description="Paginación por keyset: productos con id mayor a este")
 ):
     """GET ALL - Obtener todos los productos con filtros opcionales"""
-    if categoria_id:
-        productos = service.filtrar_por_categoria(categoria_id, skip, limit)
-        total = len(productos)
-    elif distribuidor_id:
-        productos = service.filtrar_por_distribuidor(distribuidor_id, skip, limit)
-        total = len(productos)
+    def listar(db: Session) -> bytes:
+        service = product_service_para(db)
+        snapshot = get_catalog_snapshot()
+        if after_id is not None:
+            if snapshot:
+                productos = snapshot.listar_desde(after_id, limit, categoria_id, distribuidor_id)
+            else:
+                productos = service.listar_desde(after_id, limit, categoria_id, distribuidor_id)
+            total = len(productos)
+        elif snapshot:
+            productos = snapshot.listar(skip, limit, categoria_id, distribuidor_id)
+            total = len(productos) if categoria_id or distribuidor_id else snapshot.count_all()
+        elif categoria_id:
+            productos = service.filtrar_por_categoria(categoria_id, skip, limit)
+            total = len(productos)
+        elif distribuidor_id:
+            productos = service.filtrar_por_distribuidor(distribuidor_id, skip, limit)
+            total = len(productos)
+        else:
+            productos = service.get_all(skip=skip, limit=limit)
+            total = service.count_all()
+
+        return codificar(schemas.ProductoListResponse, schemas.ProductoListResponse(
+            items=productos,
+            total=total,
+            pagina=skip // limit + 1 if limit > 0 else 1,
+            tamaño=limit
+        ))
+
+    parametros = {"skip": skip, "limit": limit, "categoria_id": categoria_id,
+                  "distribuidor_id": distribuidor_id, "after_id": after_id}
+    return Response(await compartir("GET /productos/", parametros, listar), media_type="application/json")
+
+@router_productos.post("/batch-get", response_model=schemas.ProductoBatchResponse)
+async def batch_get_productos(
+    consulta: schemas.ProductoBatchRequest,
+    service: ProductService = Depends(get_product_service),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot)
+):
+    """POST batch-get - Obtener varios productos por ID o código en una sola llamada"""
+    if consulta.ids is not None:
+        claves = consulta.ids
+        productos = snapshot.get_productos(claves) if snapshot else service.get_many(claves)
     else:
-        productos = service.get_all(skip=skip, limit=limit)
-        total = service.count_all()
-    
-    return schemas.ProductoListResponse(
+        claves = consulta.codigos
+        if snapshot:
+            productos = snapshot.get_productos_by_codigo(claves)
+        else:
+            productos = service.get_many_by_codigo_producto(claves)
+    return schemas.ProductoBatchResponse(
         items=productos,
-        total=total,
-        pagina=skip // limit + 1 if limit > 0 else 1,
-        tamaño=limit
+        no_encontrados=[clave for clave, producto in zip(claves, productos) if producto is None]
     )
 
+@router_productos.get("/changes", response_model=schemas.CambiosListResponse)
+async def get_cambios(
+    since: int = Query(0, ge=0),
+    limit: int = Query(settings.CHANGE_LOG_PAGINA, gt=0, le=5000),
+    entidad: Optional[str] = Query(None, pattern="^(producto|categoria|distribuidor)$"),
+    service: ChangeService = Depends(get_change_service)
+):
+    """GET changes - Cambios del catálogo posteriores a `since` para sincronización incremental"""
+    cambios = service.get_since(since, limit, entidad)
+    ultimo_seq = max((c["seq"] for c in cambios), default=since)
+    return schemas.CambiosListResponse(
+        items=cambios,
+        ultimo_seq=ultimo_seq,
+        hay_mas=ultimo_seq < service.ultimo_seq(entidad)
+    )
+
+@router_productos.get("/changes/stream")
+async def stream_cambios(since: Optional[int] = Query(None, ge=0)):
+    """GET changes/stream - Server-Sent Events con los cambios del catálogo en vivo"""
+    async def eventos():
+        async for evento in escuchar_cambios(since):
+            if evento is None:
+                yield ": ping\n\n"
+            else:
+                yield f"id: {evento['seq']}\nevent: {evento['operacion']}\ndata: {json.dumps(evento)}\n\n"
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router_productos.post("/changes/compact", dependencies=[Depends(verify_token)])
+async def compactar_cambios(
+    hasta_seq: Optional[int] = Query(None, ge=0),
+    service: ChangeService = Depends(get_change_service)
+):
+    """POST changes/compact - Compactar el log dejando solo el último cambio de cada fila (Protegido con JWT)"""
+    return {"eliminados": service.compactar(hasta_seq)}
+
+@router_productos.get("/snapshot/stats")
+async def get_snapshot_stats(snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot)):
+    """GET snapshot/stats - Tamaño y memoria del snapshot en memoria del catálogo"""
+    if not snapshot:
+        raise HTTPException(status_code=404, detail="Snapshot del catálogo deshabilitado")
+    return snapshot.estadisticas()
+
+@router_productos.get("/snapshot.{formato}")
+async def get_snapshot_columnar(
+    formato: str = Path(..., pattern="^(arrow|parquet)$"),
+    if_none_match: Optional[str] = Header(None),
+    service: ChangeService = Depends(get_change_service)
+):
+    """GET snapshot.arrow / snapshot.parquet - Catálogo completo en formato columnar (stream Arrow IPC o Parquet)"""
+    if not columnar_snapshot.disponible():
+        raise HTTPException(status_code=501, detail="Snapshot columnar no disponible: falta instalar pyarrow")
+    version = service.ultimo_seq()
+    etag = f'"catalogo-{version}-{formato}"'
+    headers = {
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="productos-{version}.{formato}"',
+    }
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    media_type = columnar_snapshot.FORMATOS[formato]
+    datos = columnar_snapshot.columnar.en_cache(formato, version)
+    if datos is not None:
+        return Response(datos, media_type=media_type, headers=headers)
+    return StreamingResponse(columnar_snapshot.columnar.generar(formato, version), media_type=media_type, headers=headers)
+
 @router_productos.get("/{producto_id}", response_model=schemas.ProductoResponse)
-async def get_producto_by_id(
+async def get_producto_by_id(producto_id: int):
+    """GET by ID - Obtener un producto por su ID"""
+    def buscar(db: Optional[Session]) -> Optional[bytes]:
+        snapshot = get_catalog_snapshot()
+        producto = snapshot.get_producto(producto_id) if snapshot else product_service_para(db).get_by_id(producto_id)
+        return codificar(schemas.ProductoResponse, producto) if producto else None
+
+    if get_catalog_snapshot():
+        # Lectura puntual en memoria: se resuelve en el event loop, sin hilo ni clave compartida
+        datos = buscar(None)
+    else:
+        datos = await compartir("GET /productos/{producto_id}", {"producto_id": producto_id}, buscar)
+    if not datos:
+        raise HTTPException(status_code=404, detail="Producto no encontrado")
+    return Response(datos, media_type="application/json")
+
+def hora_local(fecha: Optional[datetime]) -> Optional[datetime]:
+    # El historial se guarda en hora local sin zona: una fecha con zona se convierte a esa hora
+    if fecha is None or fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone().replace(tzinfo=None)
+
+def rango_historial(
+    desde: Optional[datetime] = Query(None, alias="from", description="Por defecto, 30 días antes de `to`"),
+    hasta: Optional[datetime] = Query(None, alias="to", description="Por defecto, ahora")
+) -> tuple:
+    desde, hasta = hora_local(desde), hora_local(hasta)
+    hasta = hasta or datetime.now()
+    desde = desde or hasta - timedelta(days=30)
+    if desde >= hasta:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+    return desde, hasta
+
+@router_productos.get("/{producto_id}/history", response_model=schemas.HistorialResponse)
+async def get_historial_producto(
     producto_id: int,
+    rango: tuple = Depends(rango_historial),
     service: ProductService = Depends(get_product_service)
 ):
-    """GET by ID - Obtener un producto por su ID"""
-    producto = service.get_by_id(producto_id)
-    if not producto:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return producto
+    """GET history - Precio de compra, margen y stock después de cada cambio en el rango"""
+    desde, hasta = rango
+    return schemas.HistorialResponse(
+        id_producto=producto_id, desde=desde, hasta=hasta,
+        items=service.get_history(producto_id, desde, hasta)
+    )
 
-@router_productos.get("/codigo-producto/{codigo_producto}", response_model=schemas.ProductoResponse)
-async def get_producto_by_codigo_producto(
-    codigo_producto: str,
+@router_productos.get("/{producto_id}/history/series", response_model=schemas.HistorialSerieResponse)
+async def get_serie_historial_producto(
+    producto_id: int,
+    rango: tuple = Depends(rango_historial),
+    buckets: int = Query(100, gt=0, le=1000, description="Cantidad de intervalos iguales del rango"),
     service: ProductService = Depends(get_product_service)
 ):
+    """GET history/series - Historial reducido a intervalos iguales (último, mínimo y máximo por intervalo)"""
+    desde, hasta = rango
+    return schemas.HistorialSerieResponse(
+        id_producto=producto_id, desde=desde, hasta=hasta,
+        items=service.get_history_series(producto_id, desde, hasta, buckets)
+    )
+
+@router_productos.get("/codigo-producto/{codigo_producto}", response_model=schemas.ProductoResponse)
+async def get_producto_by_codigo_producto(codigo_producto: str):
     """GET by código de producto - Obtener un producto por su código de producto"""
-    producto = service.get_by_codigo_producto(codigo_producto)
-    if not producto:
+    def buscar(db: Optional[Session]) -> Optional[bytes]:
+        snapshot = get_catalog_snapshot()
+        if snapshot:
+            producto = snapshot.get_producto_by_codigo(codigo_producto)
+        else:
+            producto = product_service_para(db).get_by_codigo_producto(codigo_producto)
+        return codificar(schemas.ProductoResponse, producto) if producto else None
+
+    if get_catalog_snapshot():
+        datos = buscar(None)
+    else:
+        datos = await compartir("GET /productos/codigo-producto/{codigo_producto}", {"codigo_producto": codigo_producto}, buscar)
+    if not datos:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return producto
+    return Response(datos, media_type="application/json")
 
 @router_productos.post("/", response_model=schemas.ProductoResponse)
 async def create_producto(
     producto: schemas.ProductoCreate,
     service: ProductService = Depends(get_product_service),
-    token_valid: bool = Depends(verify_token)
+    token: dict = Depends(verify_token)
 ):
     """POST - Crear un nuevo producto (Protegido con JWT)"""
     try:
@@ -90,36 +282,42 @@ async def create_producto(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router_productos.put("/{producto_id}", response_model=schemas.ProductoResponse)
+@router_productos.put("/{producto_id}", response_model=schemas.ProductoResponse, dependencies=[Depends(verify_token)])
 async def update_producto(
     producto_id: int,
     producto_update: schemas.ProductoUpdate,
     service: ProductService = Depends(get_product_service)
 ):
-    """PUT - Actualizar completamente un producto"""
-    producto_actualizado = service.update(producto_id, producto_update)
+    """PUT - Actualizar completamente un producto (Protegido con JWT)"""
+    try:
+        producto_actualizado = service.update(producto_id, producto_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not producto_actualizado:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     return producto_actualizado
 
-@router_productos.patch("/{producto_id}", response_model=schemas.ProductoResponse)
+@router_productos.patch("/{producto_id}", response_model=schemas.ProductoResponse, dependencies=[Depends(verify_token)])
 async def partial_update_producto(
     producto_id: int,
     producto_update: schemas.ProductoUpdate,
     service: ProductService = Depends(get_product_service)
 ):
-    """PATCH - Actualizar parcialmente un producto"""
-    producto_actualizado = service.partial_update(producto_id, producto_update)
+    """PATCH - Actualizar parcialmente un producto (Protegido con JWT)"""
+    try:
+        producto_actualizado = service.partial_update(producto_id, producto_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not producto_actualizado:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     return producto_actualizado
 
-@router_productos.delete("/{producto_id}")
+@router_productos.delete("/{producto_id}", dependencies=[Depends(verify_token)])
 async def delete_producto(
     producto_id: int,
     service: ProductService = Depends(get_product_service)
 ):
-    """DELETE - Eliminar un producto"""
+    """DELETE - Eliminar un producto (Protegido con JWT)"""
     if service.delete(producto_id):
         return {"message": "Producto eliminado correctamente"}
     else:
@@ -131,20 +329,24 @@ async def delete_producto(
 router_categorias = APIRouter(prefix="/categorias", tags=["Categorias"])
 
 @router_categorias.get("/", response_model=List[schemas.CategoriaResponse])
-async def get_all_categorias(service: CategoryService = Depends(get_category_service)):
+async def get_all_categorias():
     """GET ALL - Obtener todas las categorías"""
-    return service.get_all()
+    def listar(db: Session) -> bytes:
+        return codificar(List[schemas.CategoriaResponse], CategoryService(db).get_all())
+
+    return Response(await compartir("GET /categorias/", {}, listar), media_type="application/json")
 
 @router_categorias.get("/{categoria_id}", response_model=schemas.CategoriaResponse)
-async def get_categoria_by_id(
-    categoria_id: int, 
-    service: CategoryService = Depends(get_category_service)
-):
+async def get_categoria_by_id(categoria_id: int):
     """GET by ID - Obtener una categoría por su ID"""
-    categoria = service.get_by_id(categoria_id)
-    if not categoria:
+    def buscar(db: Session) -> Optional[bytes]:
+        categoria = CategoryService(db).get_by_id(categoria_id)
+        return codificar(schemas.CategoriaResponse, categoria) if categoria else None
+
+    datos = await compartir("GET /categorias/{categoria_id}", {"categoria_id": categoria_id}, buscar)
+    if not datos:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
-    return categoria
+    return Response(datos, media_type="application/json")
 
 @router_categorias.post("/", response_model=schemas.CategoriaResponse, dependencies=[Depends(verify_token)])
 async def create_categoria(
@@ -157,36 +359,42 @@ async def create_categoria(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router_categorias.put("/{categoria_id}", response_model=schemas.CategoriaResponse)
+@router_categorias.put("/{categoria_id}", response_model=schemas.CategoriaResponse, dependencies=[Depends(verify_token)])
 async def update_categoria(
     categoria_id: int, 
     categoria_update: schemas.CategoriaCreate, 
     service: CategoryService = Depends(get_category_service)
 ):
-    """PUT - Actualizar completamente una categoría"""
-    updated = service.update(categoria_id, categoria_update)
+    """PUT - Actualizar completamente una categoría (Protegido con JWT)"""
+    try:
+        updated = service.update(categoria_id, categoria_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     return updated
 
-@router_categorias.patch("/{categoria_id}", response_model=schemas.CategoriaResponse)
+@router_categorias.patch("/{categoria_id}", response_model=schemas.CategoriaResponse, dependencies=[Depends(verify_token)])
 async def partial_update_categoria(
     categoria_id: int, 
     categoria_update: schemas.CategoriaUpdate, 
     service: CategoryService = Depends(get_category_service)
 ):
-    """PATCH - Actualizar parcialmente una categoría"""
-    updated = service.partial_update(categoria_id, categoria_update)
+    """PATCH - Actualizar parcialmente una categoría (Protegido con JWT)"""
+    try:
+        updated = service.partial_update(categoria_id, categoria_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
     return updated
 
-@router_categorias.delete("/{categoria_id}")
+@router_categorias.delete("/{categoria_id}", dependencies=[Depends(verify_token)])
 async def delete_categoria(
     categoria_id: int, 
     service: CategoryService = Depends(get_category_service)
 ):
-    """DELETE - Eliminar una categoría"""
+    """DELETE - Eliminar una categoría (Protegido con JWT)"""
     if service.delete(categoria_id):
         return {"message": "Categoría eliminada correctamente"}
     else:
@@ -198,22 +406,41 @@ async def delete_categoria(
 router_distribuidores = APIRouter(prefix="/distribuidores", tags=["Distribuidores"])
 
 @router_distribuidores.get("/", response_model=List[schemas.DistribuidorResponse])
-async def get_all_distribuidores(db: Session = Depends(get_db)):
-    """GET ALL - Obtener todos los distribuidores"""
-    return db.query(models.Distribuidores).all()
+async def get_all_distribuidores(
+    ids: Optional[str] = Query(None, description="Ids separados por coma: ?ids=1,2,3"),
+    service: DistribuidorService = Depends(get_distribuidor_service)
+):
+    """GET ALL - Obtener todos los distribuidores, o solo los indicados en `ids`"""
+    if ids is None:
+        return service.get_all()
+    try:
+        lista_ids = [int(i) for i in ids.split(",") if i.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El parámetro ids debe ser una lista de enteros separados por coma")
+    return service.get_many(lista_ids)
 
 @router_distribuidores.get("/{distribuidor_id}", response_model=schemas.DistribuidorResponse)
-async def get_distribuidor_by_id(distribuidor_id: int, db: Session = Depends(get_db)):
+async def get_distribuidor_by_id(
+    distribuidor_id: int,
+    service: DistribuidorService = Depends(get_distribuidor_service)
+):
     """GET by ID - Obtener un distribuidor por su ID"""
-    distribuidor = db.query(models.Distribuidores).filter(models.Distribuidores.id_distribuidor == distribuidor_id).first()
+    distribuidor = service.get_by_id(distribuidor_id)
     if not distribuidor:
         raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
     return distribuidor
 
 @router_distribuidores.get("/rut/{rut}", response_model=schemas.DistribuidorResponse)
-async def get_distribuidor_by_rut(rut: str, db: Session = Depends(get_db)):
-    """GET by RUT - Obtener un distribuidor por su RUT"""
-    distribuidor = db.query(models.Distribuidores).filter(models.Distribuidores.rut == rut).first()
+async def get_distribuidor_by_rut(
+    rut: str,
+    service: DistribuidorService = Depends(get_distribuidor_service),
+    snapshot: Optional[CatalogSnapshot] = Depends(get_catalog_snapshot)
+):
+    """GET by RUT - Obtener un distribuidor por su RUT (acepta el RUT con o sin puntos)"""
+    if snapshot:
+        distribuidor = snapshot.get_distribuidor_by_rut(rut)
+    else:
+        distribuidor = service.get_by_rut(rut)
     if not distribuidor:
         raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
     return distribuidor
@@ -221,63 +448,106 @@ async def get_distribuidor_by_rut(rut: str, db: Session = Depends(get_db)):
 @router_distribuidores.post("/", response_model=schemas.DistribuidorResponse, dependencies=[Depends(verify_token)])
 async def create_distribuidor(
     distribuidor: schemas.DistribuidorCreate, 
-    db: Session = Depends(get_db)
+    service: DistribuidorService = Depends(get_distribuidor_service)
 ):
     """POST - Crear un nuevo distribuidor (Protegido con JWT)"""
     try:
-        db_distribuidor = models.Distribuidores(**distribuidor.dict())
-        db.add(db_distribuidor)
-        db.commit()
-        db.refresh(db_distribuidor)
-        return db_distribuidor
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail=f"Error al crear distribuidor: {str(e)}")
-
-@router_distribuidores.put("/{distribuidor_id}", response_model=schemas.DistribuidorResponse)
+        return service.create(distribuidor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router_distribuidores.put("/{distribuidor_id}", response_model=schemas.DistribuidorResponse, dependencies=[Depends(verify_token)])
 async def update_distribuidor(
     distribuidor_id: int, 
     distribuidor_update: schemas.DistribuidorCreate, 
-    db: Session = Depends(get_db)
+    service: DistribuidorService = Depends(get_distribuidor_service)
 ):
-    """PUT - Actualizar completamente un distribuidor"""
-    distribuidor = db.query(models.Distribuidores).filter(models.Distribuidores.id_distribuidor == distribuidor_id).first()
+    """PUT - Actualizar completamente un distribuidor (Protegido con JWT)"""
+    try:
+        distribuidor = service.update(distribuidor_id, distribuidor_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not distribuidor:
         raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-    
-    for key, value in distribuidor_update.dict().items():
-        setattr(distribuidor, key, value)
-    
-    db.commit()
-    db.refresh(distribuidor)
     return distribuidor
 
-@router_distribuidores.patch("/{distribuidor_id}", response_model=schemas.DistribuidorResponse)
+@router_distribuidores.patch("/{distribuidor_id}", response_model=schemas.DistribuidorResponse, dependencies=[Depends(verify_token)])
 async def partial_update_distribuidor(
     distribuidor_id: int, 
     distribuidor_update: schemas.DistribuidorUpdate, 
-    db: Session = Depends(get_db)
+    service: DistribuidorService = Depends(get_distribuidor_service)
 ):
-    """PATCH - Actualizar parcialmente un distribuidor"""
-    distribuidor = db.query(models.Distribuidores).filter(models.Distribuidores.id_distribuidor == distribuidor_id).first()
+    """PATCH - Actualizar parcialmente un distribuidor (Protegido con JWT)"""
+    try:
+        distribuidor = service.partial_update(distribuidor_id, distribuidor_update)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not distribuidor:
         raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-    
-    update_data = distribuidor_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(distribuidor, key, value)
-    
-    db.commit()
-    db.refresh(distribuidor)
     return distribuidor
 
-@router_distribuidores.delete("/{distribuidor_id}")
-async def delete_distribuidor(distribuidor_id: int, db: Session = Depends(get_db)):
-    """DELETE - Eliminar un distribuidor"""
-    distribuidor = db.query(models.Distribuidores).filter(models.Distribuidores.id_distribuidor == distribuidor_id).first()
-    if not distribuidor:
+@router_distribuidores.delete("/{distribuidor_id}", dependencies=[Depends(verify_token)])
+async def delete_distribuidor(
+    distribuidor_id: int,
+    service: DistribuidorService = Depends(get_distribuidor_service)
+):
+    """DELETE - Eliminar un distribuidor (Protegido con JWT)"""
+    if service.delete(distribuidor_id):
+        return {"message": "Distribuidor eliminado correctamente"}
+    else:
         raise HTTPException(status_code=404, detail="Distribuidor no encontrado")
-    
-    db.delete(distribuidor)
-    db.commit()
-    return {"message": "Distribuidor eliminado correctamente"}
\ No newline at end of file
+
+# ==============================
+# ROUTER PARA TRABAJOS EN SEGUNDO PLANO
+# ==============================
+router_jobs = APIRouter(prefix="/jobs", tags=["Trabajos"])
+
+@router_jobs.get("/", response_model=List[schemas.TrabajoResponse])
+async def get_trabajos(
+    estado: Optional[str] = Query(None, pattern="^(pendiente|en_curso|completado|fallido|cancelado)$"),
+    limit: int = Query(100, gt=0, le=1000),
+    service: JobService = Depends(get_job_service)
+):
+    """GET ALL - Trabajos más recientes, opcionalmente filtrados por estado"""
+    return service.get_all(estado, limit)
+
+@router_jobs.get("/{trabajo_id}", response_model=schemas.TrabajoResponse)
+async def get_trabajo(trabajo_id: int, service: JobService = Depends(get_job_service)):
+    """GET by ID - Estado, avance y resultado de un trabajo"""
+    trabajo = service.get_by_id(trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
+
+@router_jobs.get("/{trabajo_id}/archivo")
+async def get_archivo_trabajo(trabajo_id: int, service: JobService = Depends(get_job_service)):
+    """GET archivo - Descargar el CSV de una exportación completada"""
+    trabajo = service.get_by_id(trabajo_id)
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if trabajo.estado != "completado" or not (trabajo.resultado or {}).get("archivo"):
+        raise HTTPException(status_code=409, detail="El trabajo no tiene un archivo disponible")
+    return FileResponse(trabajo.resultado["archivo"], media_type="text/csv",
+                        filename=f"exportacion_{trabajo_id}.csv")
+
+@router_jobs.post("/", response_model=schemas.TrabajoResponse, status_code=status.HTTP_202_ACCEPTED,
+                  dependencies=[Depends(verify_token)])
+async def create_trabajo(trabajo: schemas.TrabajoCreate, service: JobService = Depends(get_job_service)):
+    """POST - Encolar un trabajo: importacion, reprecio, exportacion o reindexado (Protegido con JWT)"""
+    try:
+        db_trabajo = service.create(trabajo)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    runner.avisar()
+    return db_trabajo
+
+@router_jobs.post("/{trabajo_id}/cancel", response_model=schemas.TrabajoResponse, dependencies=[Depends(verify_token)])
+async def cancel_trabajo(trabajo_id: int, service: JobService = Depends(get_job_service)):
+    """POST cancel - Cancelar un trabajo; si está en curso se detiene al terminar su lote (Protegido con JWT)"""
+    try:
+        trabajo = service.cancel(trabajo_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not trabajo:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return trabajo
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, field_validator
-from typing import Optional, List
-from datetime import date
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Optional, List, Dict, Any, Union, Literal
+from datetime import date, datetime
 from decimal import Decimal
 
 # ==============================
@@ -114,4 +114,93 @@ class ProductoListResponse(BaseModel):
     items: List[ProductoResponse]
     total: int
     pagina: int
-    tamaño: int
\ No newline at end of file
+    tamaño: int
+
+# Tope de productos por consulta en batch-get (REST) y productsByIds/productsByCodes (GraphQL)
+MAX_PRODUCTOS_POR_CONSULTA = 500
+
+class ProductoBatchRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    codigos: Optional[List[str]] = None
+
+    @model_validator(mode='after')
+    def ids_o_codigos(self):
+        if (self.ids is None) == (self.codigos is None):
+            raise ValueError('Debe indicar ids o codigos, pero no ambos')
+        if len(self.ids or self.codigos) > MAX_PRODUCTOS_POR_CONSULTA:
+            raise ValueError(f'Se permiten como máximo {MAX_PRODUCTOS_POR_CONSULTA} productos por consulta')
+        return self
+
+class ProductoBatchResponse(BaseModel):
+    items: List[Optional[ProductoResponse]]  # mismo orden que la consulta; None si no existe
+    no_encontrados: List[Union[int, str]]
+
+# ==============================
+# SCHEMAS PARA HISTORIAL DE PRECIOS Y STOCK
+# ==============================
+class HistorialPunto(BaseModel):
+    fecha: datetime
+    precio_compra: Decimal
+    margen_ganancia: Decimal
+    stock: int
+
+class HistorialResponse(BaseModel):
+    id_producto: int
+    desde: datetime
+    hasta: datetime
+    items: List[HistorialPunto]
+
+class HistorialIntervalo(BaseModel):
+    desde: datetime
+    hasta: datetime
+    precio_compra: Decimal  # último valor del intervalo
+    precio_compra_min: Decimal
+    precio_compra_max: Decimal
+    margen_ganancia: Decimal
+    stock: int
+    cambios: int
+
+class HistorialSerieResponse(BaseModel):
+    id_producto: int
+    desde: datetime
+    hasta: datetime
+    items: List[HistorialIntervalo]
+
+# ==============================
+# SCHEMAS PARA LOG DE CAMBIOS
+# ==============================
+class CambioResponse(BaseModel):
+    seq: int
+    entidad: str
+    id_entidad: int
+    operacion: str
+    fecha: str
+    datos: Optional[Dict[str, Any]] = None
+
+class CambiosListResponse(BaseModel):
+    items: List[CambioResponse]
+    ultimo_seq: int
+    hay_mas: bool
+
+# ==============================
+# SCHEMAS PARA TRABAJOS EN SEGUNDO PLANO
+# ==============================
+class TrabajoCreate(BaseModel):
+    tipo: Literal["importacion", "reprecio", "exportacion", "reindexado"]
+    parametros: Dict[str, Any] = {}
+
+class TrabajoResponse(BaseModel):
+    id_trabajo: int
+    tipo: str
+    estado: str
+    procesados: int
+    total: Optional[int] = None
+    resultado: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancelacion_solicitada: bool
+    creado: datetime
+    iniciado: Optional[datetime] = None
+    terminado: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
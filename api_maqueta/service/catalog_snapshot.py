@@ -0,0 +1,338 @@
+import heapq
+import sys
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import date
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import models
+import sharding
+from service.change_service import ChangeService, broker
+from service.distribuidor_service import rut_buscable
+
+# ==============================
+# REGISTROS COMPACTOS (__slots__)
+# ==============================
+# Los registros exponen los mismos atributos que los modelos, así los schemas
+# con from_attributes los serializan sin cambios.
+
+class CategoriaRecord:
+    __slots__ = ("id_categoria", "nombre_categoria")
+
+    def __init__(self, id_categoria: int, nombre_categoria: str):
+        self.id_categoria = id_categoria
+        self.nombre_categoria = nombre_categoria
+
+
+class DistribuidorRecord:
+    __slots__ = ("id_distribuidor", "nombre", "rut", "telefono", "email", "direccion", "ciudad")
+
+    def __init__(self, id_distribuidor, nombre, rut, telefono=None, email=None, direccion=None, ciudad=None):
+        self.id_distribuidor = id_distribuidor
+        self.nombre = nombre
+        self.rut = rut
+        self.telefono = telefono
+        self.email = email
+        self.direccion = direccion
+        self.ciudad = ciudad
+
+
+class ProductoRecord:
+    __slots__ = (
+        "id_producto", "codigo_producto", "nombre_producto", "id_categoria", "marca", "descripcion",
+        "precio_compra", "margen_ganancia", "precio_neto", "precio_iva", "precio_venta",
+        "stock", "id_distribuidor", "fecha_actualizacion", "_snapshot",
+    )
+
+    def __init__(self, snapshot: "CatalogSnapshot", id_producto, codigo_producto, nombre_producto, id_categoria,
+                 marca, descripcion, precio_compra, margen_ganancia, precio_neto, precio_iva, precio_venta,
+                 stock, id_distribuidor, fecha_actualizacion):
+        self._snapshot = snapshot
+        self.id_producto = id_producto
+        self.codigo_producto = codigo_producto
+        self.nombre_producto = nombre_producto
+        self.id_categoria = id_categoria
+        self.marca = marca
+        self.descripcion = descripcion
+        self.precio_compra = precio_compra
+        self.margen_ganancia = margen_ganancia
+        self.precio_neto = precio_neto
+        self.precio_iva = precio_iva
+        self.precio_venta = precio_venta
+        self.stock = stock
+        self.id_distribuidor = id_distribuidor
+        self.fecha_actualizacion = fecha_actualizacion
+
+    # Las relaciones se resuelven contra el snapshot para que un cambio de
+    # categoría o distribuidor se vea en todos sus productos sin reescribirlos
+    @property
+    def categoria(self) -> Optional[CategoriaRecord]:
+        return self._snapshot.categorias.get(self.id_categoria)
+
+    @property
+    def distribuidor(self) -> Optional[DistribuidorRecord]:
+        return self._snapshot.distribuidores.get(self.id_distribuidor)
+
+
+COLUMNAS_PRODUCTO = (
+    models.Productos.id_producto, models.Productos.codigo_producto, models.Productos.nombre_producto,
+    models.Productos.id_categoria, models.Productos.marca, models.Productos.descripcion,
+    models.Productos.precio_compra, models.Productos.margen_ganancia, models.Productos.precio_neto,
+    models.Productos.precio_iva, models.Productos.precio_venta, models.Productos.stock,
+    models.Productos.id_distribuidor, models.Productos.fecha_actualizacion,
+)
+
+COLUMNAS_DISTRIBUIDOR = (
+    models.Distribuidores.id_distribuidor, models.Distribuidores.nombre, models.Distribuidores.rut,
+    models.Distribuidores.telefono, models.Distribuidores.email, models.Distribuidores.direccion,
+    models.Distribuidores.ciudad,
+)
+
+
+def _decimal(valor) -> Optional[Decimal]:
+    return None if valor is None else Decimal(str(valor))
+
+
+def _fecha(valor) -> Optional[date]:
+    if valor is None or isinstance(valor, date):
+        return valor
+    return date.fromisoformat(valor)
+
+
+class CatalogSnapshot:
+    """Modelo de lectura en memoria de Productos, Categorias y Distribuidores.
+
+    Se construye completo con `cargar` y luego se mantiene con los eventos del
+    log de cambios (`aplicar`), tanto los publicados en este proceso como los
+    que `sincronizar` lee del log escritos por otros procesos.
+
+    `seq` es el cambio más reciente aplicado; `cursor` es hasta dónde se leyó
+    el log y solo lo avanza `sincronizar`. Los eventos en vivo de este proceso
+    no lo mueven: otro proceso puede haber escrito un seq menor que todavía no
+    se leyó.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.activo = False
+        self.seq = 0
+        self.cursor = 0
+        self.version = 0  # aumenta con cada carga o evento aplicado (clave de las lecturas compartidas)
+        self._limpiar()
+
+    def _limpiar(self):
+        self.productos: Dict[int, ProductoRecord] = {}
+        self.por_codigo: Dict[str, ProductoRecord] = {}
+        self.categorias: Dict[int, CategoriaRecord] = {}
+        self.distribuidores: Dict[int, DistribuidorRecord] = {}
+        self.distribuidores_por_rut: Dict[str, DistribuidorRecord] = {}
+        # Índices secundarios: ids de producto ordenados (mismo orden que la tabla)
+        self.ids_ordenados: List[int] = []
+        self.por_categoria: Dict[int, List[int]] = {}
+        self.por_distribuidor: Dict[int, List[int]] = {}
+        self._versiones: Dict[Tuple[str, int], int] = {}
+
+    # ------------------------------
+    # Construcción y mantenimiento
+    # ------------------------------
+    def cargar(self, db: Session) -> None:
+        with self._lock:
+            self.seq = self.cursor = ChangeService(db).ultimo_seq()
+            self.version += 1
+            self._limpiar()
+            for id_categoria, nombre in db.query(models.Categorias.id_categoria, models.Categorias.nombre_categoria):
+                self.categorias[id_categoria] = CategoriaRecord(id_categoria, nombre)
+            for fila in db.query(*COLUMNAS_DISTRIBUIDOR):
+                self._poner_distribuidor(DistribuidorRecord(*fila))
+            if sharding.router:
+                # Modo particionado: se leen todos los shards y se mezclan por id
+                partes = sharding.router.en_todos(
+                    lambda db_shard, shard: db_shard.query(*COLUMNAS_PRODUCTO).order_by(models.Productos.id_producto).all()
+                )
+                filas = heapq.merge(*partes, key=lambda fila: fila[0])
+            else:
+                filas = db.query(*COLUMNAS_PRODUCTO).order_by(models.Productos.id_producto)
+            for fila in filas:
+                self._poner_producto(ProductoRecord(self, *fila), ordenado=True)
+            if not self.activo:
+                broker.agregar_oyente(self.aplicar)
+            self.activo = True
+
+    def sincronizar(self, db: Session, pagina: int = 500) -> int:
+        """Aplica los cambios del log posteriores al cursor (incluye los ya aplicados en vivo, que no cambian nada)."""
+        aplicados = 0
+        while True:
+            eventos = ChangeService(db).get_since(self.cursor, limit=pagina)
+            if not eventos:
+                return aplicados
+            for evento in eventos:
+                self.aplicar(evento)
+            with self._lock:
+                self.cursor = max(self.cursor, max(evento["seq"] for evento in eventos))
+            aplicados += len(eventos)
+
+    def aplicar(self, evento: dict) -> None:
+        entidad, id_entidad = evento["entidad"], evento["id_entidad"]
+        with self._lock:
+            # Un evento más antiguo que el ya aplicado para la misma fila se descarta. Sin seq es una
+            # escritura de este proceso que todavía no llega al log global (modo particionado): se
+            # aplica igual y `sincronizar` la vuelve a leer del log con su seq.
+            clave, seq = (entidad, id_entidad), evento["seq"]
+            if seq is not None:
+                if seq < self._versiones.get(clave, 0):
+                    return
+                self._versiones[clave] = seq
+                self.seq = max(self.seq, seq)
+            self.version += 1
+
+            datos = evento.get("datos")
+            if entidad == "producto":
+                self._quitar_producto(id_entidad)
+                if datos is not None:
+                    self._poner_producto(ProductoRecord(
+                        self, datos["id_producto"], datos["codigo_producto"], datos["nombre_producto"],
+                        datos["id_categoria"], datos["marca"], datos["descripcion"],
+                        _decimal(datos["precio_compra"]), _decimal(datos["margen_ganancia"]),
+                        _decimal(datos["precio_neto"]), _decimal(datos["precio_iva"]),
+                        _decimal(datos["precio_venta"]), datos["stock"], datos["id_distribuidor"],
+                        _fecha(datos["fecha_actualizacion"]),
+                    ))
+            elif entidad == "categoria":
+                if datos is None:
+                    self.categorias.pop(id_entidad, None)
+                else:
+                    self.categorias[id_entidad] = CategoriaRecord(id_entidad, datos["nombre_categoria"])
+            elif entidad == "distribuidor":
+                anterior = self.distribuidores.pop(id_entidad, None)
+                if anterior is not None:
+                    self.distribuidores_por_rut.pop(anterior.rut, None)
+                if datos is not None:
+                    self._poner_distribuidor(DistribuidorRecord(
+                        id_entidad, datos["nombre"], datos["rut"], datos.get("telefono"),
+                        datos.get("email"), datos.get("direccion"), datos.get("ciudad"),
+                    ))
+
+    def _poner_distribuidor(self, registro: DistribuidorRecord) -> None:
+        self.distribuidores[registro.id_distribuidor] = registro
+        # Los RUT guardados ya están en forma canónica (ver normalizar_rut)
+        self.distribuidores_por_rut[registro.rut] = registro
+
+    def _poner_producto(self, registro: ProductoRecord, ordenado: bool = False) -> None:
+        self.productos[registro.id_producto] = registro
+        self.por_codigo[registro.codigo_producto] = registro
+        agregar = list.append if ordenado else insort
+        agregar(self.ids_ordenados, registro.id_producto)
+        agregar(self.por_categoria.setdefault(registro.id_categoria, []), registro.id_producto)
+        if registro.id_distribuidor is not None:
+            agregar(self.por_distribuidor.setdefault(registro.id_distribuidor, []), registro.id_producto)
+
+    def _quitar_producto(self, id_producto: int) -> None:
+        registro = self.productos.pop(id_producto, None)
+        if registro is None:
+            return
+        self.por_codigo.pop(registro.codigo_producto, None)
+        _quitar_id(self.ids_ordenados, id_producto)
+        _quitar_id(self.por_categoria.get(registro.id_categoria, []), id_producto)
+        if registro.id_distribuidor is not None:
+            _quitar_id(self.por_distribuidor.get(registro.id_distribuidor, []), id_producto)
+
+    # ------------------------------
+    # Lecturas
+    # ------------------------------
+    # Corren en hilos (compartir, to_thread) mientras aplicar y sincronizar modifican los
+    # diccionarios e índices: toman el mismo lock, así nunca ven un producto a medio
+    # actualizar (entre _quitar_producto y _poner_producto) ni un id sin su registro.
+    def get_producto(self, producto_id: int) -> Optional[ProductoRecord]:
+        with self._lock:
+            return self.productos.get(producto_id)
+
+    def get_producto_by_codigo(self, codigo_producto: str) -> Optional[ProductoRecord]:
+        with self._lock:
+            return self.por_codigo.get(codigo_producto)
+
+    def get_productos(self, ids: List[int]) -> List[Optional[ProductoRecord]]:
+        with self._lock:
+            return [self.productos.get(i) for i in ids]
+
+    def get_productos_by_codigo(self, codigos: List[str]) -> List[Optional[ProductoRecord]]:
+        with self._lock:
+            return [self.por_codigo.get(c) for c in codigos]
+
+    def get_distribuidor_by_rut(self, rut: str) -> Optional[DistribuidorRecord]:
+        rut = rut_buscable(rut)
+        with self._lock:
+            return self.distribuidores_por_rut.get(rut)
+
+    def listar(self, skip: int = 0, limit: int = 100, categoria_id: Optional[int] = None,
+               distribuidor_id: Optional[int] = None) -> List[ProductoRecord]:
+        with self._lock:
+            ids = self._ids(categoria_id, distribuidor_id)
+            return [self.productos[i] for i in ids[skip:skip + limit]]
+
+    def listar_desde(self, after_id: int, limit: int = 100, categoria_id: Optional[int] = None,
+                     distribuidor_id: Optional[int] = None) -> List[ProductoRecord]:
+        with self._lock:
+            ids = self._ids(categoria_id, distribuidor_id)
+            inicio = bisect_right(ids, after_id)
+            return [self.productos[i] for i in ids[inicio:inicio + limit]]
+
+    def _ids(self, categoria_id: Optional[int], distribuidor_id: Optional[int]) -> List[int]:
+        if categoria_id:
+            return self.por_categoria.get(categoria_id, [])
+        if distribuidor_id:
+            return self.por_distribuidor.get(distribuidor_id, [])
+        return self.ids_ordenados
+
+    def count_all(self) -> int:
+        with self._lock:
+            return len(self.productos)
+
+    def estadisticas(self) -> dict:
+        """Memoria aproximada del snapshot (registros, valores e índices), también escalada a 100k productos."""
+        vistos = set()
+
+        def tam(obj) -> int:
+            if id(obj) in vistos:
+                return 0
+            vistos.add(id(obj))
+            return sys.getsizeof(obj)
+
+        with self._lock:
+            bytes_productos = 0
+            for registro in self.productos.values():
+                bytes_productos += tam(registro)
+                for campo in ProductoRecord.__slots__[:-1]:
+                    bytes_productos += tam(getattr(registro, campo))
+            bytes_indices = sum(tam(d) for d in (self.productos, self.por_codigo, self.ids_ordenados))
+            bytes_indices += sum(tam(ids) for ids in self.por_categoria.values())
+            bytes_indices += sum(tam(ids) for ids in self.por_distribuidor.values())
+            bytes_resto = tam(self.categorias) + tam(self.distribuidores) + tam(self.distribuidores_por_rut)
+            bytes_resto += sum(tam(r) for r in self.categorias.values())
+            bytes_resto += sum(tam(r) for r in self.distribuidores.values())
+            total = bytes_productos + bytes_indices + bytes_resto
+            n = len(self.productos)
+
+        return {
+            "productos": n,
+            "categorias": len(self.categorias),
+            "distribuidores": len(self.distribuidores),
+            "seq": self.seq,
+            "cursor": self.cursor,
+            "bytes_total": total,
+            "bytes_por_100k_productos": int((bytes_productos + bytes_indices) / n * 100_000) if n else 0,
+        }
+
+
+def _quitar_id(ids: List[int], valor: int) -> None:
+    i = bisect_left(ids, valor)
+    if i < len(ids) and ids[i] == valor:
+        del ids[i]
+
+
+snapshot = CatalogSnapshot()
+
+
+def get_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    """Devuelve el snapshot si está cargado; None para leer desde la base de datos."""
+    return snapshot if snapshot.activo else None
@@ -1,12 +1,16 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, insert, update, delete
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
+from database import descartar_instancia
 import models
 import schemas
+from service.change_service import ChangeService
 
 class CategoryService:
     def __init__(self, db: Session):
         self.db = db
+        self.cambios = ChangeService(db)
 
     def get_all(self) -> List[models.Categorias]:
         return self.db.query(models.Categorias).all()
@@ -22,27 +26,56 @@ class CategoryService:
         ).first()
 
     def create(self, categoria: schemas.CategoriaCreate) -> models.Categorias:
-        db_categoria = models.Categorias(**categoria.model_dump())
-        self.db.add(db_categoria)
-        self.db.commit()
-        self.db.refresh(db_categoria)
+        try:
+            db_categoria = self.db.scalars(
+                insert(models.Categorias).values(**categoria.model_dump()).returning(models.Categorias)
+            ).one()
+            cambio = self.cambios.registrar("categoria", db_categoria.id_categoria, "create")
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise ValueError(f"La categoría {categoria.nombre_categoria} ya existe")
+        self.cambios.publicar(cambio, db_categoria)
         return db_categoria
 
     def update(self, categoria_id: int, categoria_update: schemas.CategoriaCreate) -> Optional[models.Categorias]:
-        db_categoria = self.get_by_id(categoria_id)
-        if not db_categoria:
-            return None
         update_data = categoria_update.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_categoria, field, value)
-        self.db.commit()
-        self.db.refresh(db_categoria)
+        if not update_data:
+            return self.get_by_id(categoria_id)
+        try:
+            descartar_instancia(self.db, models.Categorias, categoria_id)
+            db_categoria = self.db.scalars(
+                update(models.Categorias)
+                .where(models.Categorias.id_categoria == categoria_id)
+                .values(**update_data)
+                .returning(models.Categorias)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            if not db_categoria:
+                self.db.rollback()
+                return None
+            cambio = self.cambios.registrar("categoria", categoria_id, "update")
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise ValueError(f"La categoría {update_data.get('nombre_categoria')} ya existe")
+        self.cambios.publicar(cambio, db_categoria)
         return db_categoria
 
+    def partial_update(self, categoria_id: int, categoria_update: schemas.CategoriaUpdate) -> Optional[models.Categorias]:
+        return self.update(categoria_id, categoria_update)
+
     def delete(self, categoria_id: int) -> bool:
-        db_categoria = self.get_by_id(categoria_id)
-        if not db_categoria:
+        eliminado = self.db.execute(
+            delete(models.Categorias)
+            .where(models.Categorias.id_categoria == categoria_id)
+            .returning(models.Categorias.id_categoria)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not eliminado:
+            self.db.rollback()
             return False
-        self.db.delete(db_categoria)
+        cambio = self.cambios.registrar("categoria", categoria_id, "delete")
         self.db.commit()
-        return True
\ No newline at end of file
+        self.cambios.publicar(cambio)
+        return True
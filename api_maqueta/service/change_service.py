@@ -0,0 +1,302 @@
+import asyncio
+import logging
+import threading
+from sqlalchemy.orm import Session
+from datetime import datetime
+from sqlalchemy import func, insert
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set
+from config import settings
+from database import SessionLocal
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+# Esquema usado para serializar cada entidad en los eventos
+ESQUEMAS_ENTIDAD = {
+    "producto": schemas.ProductoResponse,
+    "categoria": schemas.CategoriaResponse,
+    "distribuidor": schemas.DistribuidorResponse,
+}
+
+MODELOS_ENTIDAD = {
+    "producto": (models.Productos, models.Productos.id_producto),
+    "categoria": (models.Categorias, models.Categorias.id_categoria),
+    "distribuidor": (models.Distribuidores, models.Distribuidores.id_distribuidor),
+}
+
+# En modo particionado los productos no están en la base global: se leen con esta función
+cargador_productos: Optional[Callable[[Session, List[int]], list]] = None
+
+
+def serializar_entidad(entidad: str, db_obj) -> Optional[dict]:
+    if db_obj is None:
+        return None
+    return ESQUEMAS_ENTIDAD[entidad].model_validate(db_obj).model_dump(mode="json")
+
+
+class ChangeBroker:
+    """Pub/sub en memoria para empujar los cambios a los clientes conectados (SSE / GraphQL).
+
+    Cada suscriptor recibe en su cola pares (del_log, evento): los publicados en
+    este proceso al instante (del_log False) y los que un único sondeo
+    compartido relee del log cada CHANGE_LOG_SONDEO_SEGUNDOS (del_log True),
+    que incluyen las escrituras de otros workers y de los trabajos.
+    """
+
+    def __init__(self, max_pendientes: int = 1000):
+        self.max_pendientes = max_pendientes
+        self._suscriptores: Set[asyncio.Queue] = set()
+        self._oyentes: List[Callable[[dict], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sondeo: Optional[asyncio.Task] = None
+        # Último seq confirmado que conoce este proceso (publicado aquí o releído del log); None hasta la primera lectura
+        self.ultimo_seq: Optional[int] = None
+        # Cambia con cada seq nuevo y con cada escritura local que todavía no tiene seq (modo particionado)
+        self.version = 0
+        self._lock_seq = threading.Lock()
+
+    def agregar_oyente(self, oyente: Callable[[dict], None]) -> None:
+        """Registra un callback síncrono que recibe cada cambio confirmado en este proceso."""
+        self._oyentes.append(oyente)
+
+    def quitar_oyente(self, oyente: Callable[[dict], None]) -> None:
+        if oyente in self._oyentes:
+            self._oyentes.remove(oyente)
+
+    def suscribir(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        cola = asyncio.Queue(maxsize=self.max_pendientes)
+        self._suscriptores.add(cola)
+        return cola
+
+    def desuscribir(self, cola: asyncio.Queue) -> None:
+        self._suscriptores.discard(cola)
+
+    def sondear_desde(self, cursor: int) -> None:
+        """Inicia el sondeo compartido del log desde `cursor` si no está corriendo; se detiene solo sin suscriptores."""
+        if self._sondeo is None or self._sondeo.done():
+            self._sondeo = asyncio.get_running_loop().create_task(self._sondear(cursor))
+
+    async def _sondear(self, cursor: int) -> None:
+        try:
+            while True:
+                await asyncio.sleep(settings.CHANGE_LOG_SONDEO_SEGUNDOS)
+                if not self._suscriptores:
+                    return
+                try:
+                    while pagina := await asyncio.to_thread(
+                        _consultar_log, lambda servicio: servicio.get_since(cursor, limit=settings.CHANGE_LOG_PAGINA)
+                    ):
+                        for evento in pagina:
+                            for cola in list(self._suscriptores):
+                                self._entregar(cola, (True, evento))
+                        cursor = max(cursor, max(evento["seq"] for evento in pagina))
+                except Exception:
+                    # Un error de la base no debe cortar las suscripciones: se reintenta en el próximo sondeo
+                    logger.exception("Falló la relectura del log de cambios")
+        finally:
+            self._sondeo = None
+
+    def avanzar(self, seq: int) -> None:
+        # Lo llaman el event loop (al publicar) y el hilo de relectura: nunca retrocede
+        with self._lock_seq:
+            if self.ultimo_seq is None or seq > self.ultimo_seq:
+                self.ultimo_seq = seq
+                self.version += 1
+
+    def marcar_escritura(self) -> None:
+        with self._lock_seq:
+            self.version += 1
+
+    def tiene_interesados(self) -> bool:
+        return bool(self._oyentes or self._suscriptores)
+
+    def avisar_oyentes(self, evento: dict) -> None:
+        for oyente in self._oyentes:
+            oyente(evento)
+
+    def publicar(self, evento: dict, oyentes: bool = True) -> None:
+        """Entrega el evento a los oyentes (salvo que ya lo hayan recibido) y a los suscriptores en vivo."""
+        if oyentes:
+            self.avisar_oyentes(evento)
+        if not self._suscriptores or self._loop is None or self._loop.is_closed():
+            return
+        for cola in list(self._suscriptores):
+            self._loop.call_soon_threadsafe(self._entregar, cola, (False, evento))
+
+    @staticmethod
+    def _entregar(cola: asyncio.Queue, item: tuple) -> None:
+        # Un cliente lento pierde eventos; detecta el salto por seq y se resincroniza con /changes
+        try:
+            cola.put_nowait(item)
+        except asyncio.QueueFull:
+            pass
+
+
+broker = ChangeBroker()
+
+
+class ChangeService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def registrar(self, entidad: str, id_entidad: int, operacion: str) -> dict:
+        """Agrega una entrada al log dentro de la transacción en curso (se confirma junto con la escritura)."""
+        cambio = models.CambiosCatalogo(entidad=entidad, id_entidad=id_entidad, operacion=operacion)
+        self.db.add(cambio)
+        self.db.flush()
+        return {
+            "seq": cambio.seq,
+            "entidad": entidad,
+            "id_entidad": id_entidad,
+            "operacion": operacion,
+            "fecha": cambio.fecha.isoformat(),
+        }
+
+    def registrar_lote(self, entidad: str, ids: List[int], operacion: str) -> None:
+        """Igual que registrar para muchas filas, en un solo INSERT (escrituras masivas sin publicación en vivo)."""
+        if ids:
+            ahora = datetime.now()
+            self.db.execute(insert(models.CambiosCatalogo), [
+                {"entidad": entidad, "id_entidad": i, "operacion": operacion, "fecha": ahora} for i in ids
+            ])
+
+    def publicar(self, cambio: dict, db_obj=None) -> None:
+        """Publica el cambio ya confirmado a los suscriptores en vivo."""
+        broker.avanzar(cambio["seq"])
+        if not broker.tiene_interesados():
+            # Sin oyentes no se serializa la fila (evita cargar sus relaciones)
+            return
+        evento = dict(cambio)
+        evento["datos"] = None if cambio["operacion"] == "delete" else serializar_entidad(cambio["entidad"], db_obj)
+        broker.publicar(evento)
+
+    def ultimo_seq(self, entidad: Optional[str] = None) -> int:
+        query = self.db.query(func.max(models.CambiosCatalogo.seq))
+        if entidad:
+            query = query.filter(models.CambiosCatalogo.entidad == entidad)
+        return query.scalar() or 0
+
+    def get_since(self, since: int = 0, limit: int = 500, entidad: Optional[str] = None) -> List[dict]:
+        """Cambios posteriores a `since`, uno por entidad (el más reciente), con el estado actual de cada fila."""
+        query = self.db.query(models.CambiosCatalogo).filter(models.CambiosCatalogo.seq > since)
+        if entidad:
+            query = query.filter(models.CambiosCatalogo.entidad == entidad)
+        cambios = query.order_by(models.CambiosCatalogo.seq).limit(limit).all()
+
+        # Dentro de la página solo importa el último cambio de cada fila
+        ultimos: Dict[tuple, models.CambiosCatalogo] = {}
+        for cambio in cambios:
+            ultimos.pop((cambio.entidad, cambio.id_entidad), None)
+            ultimos[(cambio.entidad, cambio.id_entidad)] = cambio
+
+        # Una sola consulta IN por tipo de entidad
+        filas: Dict[tuple, object] = {}
+        ids_por_entidad: Dict[str, List[int]] = {}
+        for (nombre, id_entidad), cambio in ultimos.items():
+            if cambio.operacion != "delete":
+                ids_por_entidad.setdefault(nombre, []).append(id_entidad)
+        for nombre, ids in ids_por_entidad.items():
+            modelo, columna_id = MODELOS_ENTIDAD[nombre]
+            if nombre == "producto" and cargador_productos is not None:
+                encontradas = [fila for fila in cargador_productos(self.db, ids) if fila is not None]
+            else:
+                encontradas = self.db.query(modelo).filter(columna_id.in_(ids)).all()
+            for fila in encontradas:
+                filas[(nombre, getattr(fila, columna_id.key))] = fila
+
+        resultado = []
+        for clave, cambio in ultimos.items():
+            fila = filas.get(clave)
+            resultado.append({
+                "seq": cambio.seq,
+                "entidad": cambio.entidad,
+                "id_entidad": cambio.id_entidad,
+                # Si la fila ya no existe la réplica debe borrarla aunque el cambio haya sido un update
+                "operacion": cambio.operacion if fila is not None or cambio.operacion == "delete" else "delete",
+                "fecha": cambio.fecha.isoformat(),
+                "datos": serializar_entidad(cambio.entidad, fila),
+            })
+        return resultado
+
+    def compactar(self, hasta_seq: Optional[int] = None) -> int:
+        """Elimina las entradas antiguas dejando solo la última de cada fila.
+
+        Aplicar el log compactado sigue produciendo el mismo estado final en la réplica.
+        """
+        if hasta_seq is None:
+            hasta_seq = self.ultimo_seq() - settings.CHANGE_LOG_RETENCION
+        if hasta_seq <= 0:
+            return 0
+        ultimos = self.db.query(func.max(models.CambiosCatalogo.seq)).group_by(
+            models.CambiosCatalogo.entidad, models.CambiosCatalogo.id_entidad
+        )
+        eliminados = self.db.query(models.CambiosCatalogo).filter(
+            models.CambiosCatalogo.seq <= hasta_seq,
+            models.CambiosCatalogo.seq.not_in(ultimos.scalar_subquery()),
+        ).delete(synchronize_session=False)
+        self.db.commit()
+        return eliminados
+
+
+def _consultar_log(consulta: Callable[["ChangeService"], object]):
+    # Las lecturas del log corren en un hilo (asyncio.to_thread) con su propia sesión
+    db = SessionLocal()
+    try:
+        return consulta(ChangeService(db))
+    finally:
+        db.close()
+
+
+async def escuchar_cambios(since: Optional[int] = None, heartbeat: float = 15.0) -> AsyncIterator[Optional[dict]]:
+    """Generador compartido por SSE y GraphQL: reenvía el log desde `since` y luego los cambios en vivo.
+
+    Los cambios de este proceso llegan al instante por el broker; los de otros
+    workers y de los trabajos en segundo plano, con el sondeo del log que el
+    broker comparte entre todos los suscriptores. Entre procesos el orden por
+    seq no está garantizado. Emite None cada `heartbeat` segundos sin actividad
+    para mantener viva la conexión.
+    """
+    cola = broker.suscribir()
+    loop = asyncio.get_running_loop()
+    try:
+        # El cursor avanza solo con lo leído del log: un evento en vivo puede adelantarse a
+        # escrituras de otros procesos con seq menor. Los ya enviados se recuerdan hasta que el log los alcance.
+        entregados: Set[int] = set()
+        ultima_emision = loop.time()
+        if since is None:
+            cursor = await asyncio.to_thread(_consultar_log, ChangeService.ultimo_seq)
+        else:
+            # Reenvío inicial propio de esta conexión; lo posterior llega por el sondeo compartido
+            cursor = since
+            while pendientes := await asyncio.to_thread(
+                _consultar_log, lambda servicio: servicio.get_since(cursor, limit=settings.CHANGE_LOG_PAGINA)
+            ):
+                for evento in pendientes:
+                    ultima_emision = loop.time()
+                    yield evento
+                cursor = max(cursor, max(evento["seq"] for evento in pendientes))
+        broker.sondear_desde(cursor)
+        while True:
+            if loop.time() - ultima_emision >= heartbeat:
+                ultima_emision = loop.time()
+                yield None
+            try:
+                del_log, evento = await asyncio.wait_for(
+                    cola.get(), timeout=max(0.0, ultima_emision + heartbeat - loop.time())
+                )
+            except asyncio.TimeoutError:
+                continue
+            seq = evento["seq"]
+            if seq > cursor and seq not in entregados:
+                ultima_emision = loop.time()
+                yield evento
+            if del_log:
+                # El sondeo entrega el log en orden de seq
+                cursor = max(cursor, seq)
+                entregados = {s for s in entregados if s > cursor}
+            elif seq > cursor:
+                entregados.add(seq)
+    finally:
+        broker.desuscribir(cola)
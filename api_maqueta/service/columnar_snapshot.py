@@ -0,0 +1,191 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from config import settings
+from database import SessionLocal
+import models
+import sharding
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional: sin pyarrow los endpoints responden 501
+    pa = pc = pq = None
+
+# ==============================
+# SNAPSHOT COLUMNAR (ARROW / PARQUET)
+# ==============================
+# Catálogo completo para consumidores analíticos. Los lotes se arman desde
+# columnas leídas directo del driver (sin modelos ORM ni Pydantic por fila),
+# los precios se mantienen como decimal128 y categoría y distribuidor van
+# codificados como diccionario.
+FORMATOS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+SQL_PRODUCTOS = (
+    "SELECT id_producto, codigo_producto, nombre_producto, marca, descripcion, id_categoria, id_distribuidor, "
+    "precio_compra, margen_ganancia, precio_neto, precio_iva, precio_venta, stock, fecha_actualizacion "
+    "FROM Productos WHERE id_producto > ? ORDER BY id_producto LIMIT ?"
+)
+
+DECIMALES = {
+    "precio_compra": (10, 2), "margen_ganancia": (5, 2),
+    "precio_neto": (10, 2), "precio_iva": (10, 2), "precio_venta": (10, 2),
+}
+
+
+def disponible() -> bool:
+    return pa is not None
+
+
+def esquema() -> "pa.Schema":
+    diccionario = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id_producto", pa.int32()),
+        ("codigo_producto", pa.string()),
+        ("nombre_producto", pa.string()),
+        ("marca", pa.string()),
+        ("descripcion", pa.string()),
+        ("id_categoria", pa.int32()),
+        ("categoria", diccionario),
+        ("id_distribuidor", pa.int32()),
+        ("distribuidor", diccionario),
+        *[(campo, pa.decimal128(*tipo)) for campo, tipo in DECIMALES.items()],
+        ("stock", pa.int32()),
+        ("fecha_actualizacion", pa.date32()),
+    ])
+
+
+class _Sumidero:
+    """Archivo de solo escritura que acumula lo escrito hasta que se vacía (para emitir cada lote al cliente)."""
+
+    closed = False
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, datos) -> int:
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        datos, self._partes = b"".join(self._partes), []
+        return datos
+
+
+class ColumnarSnapshot:
+    """Codifica el catálogo como stream Arrow IPC o archivo Parquet y guarda en
+    memoria el último resultado de cada formato junto con la versión del
+    catálogo (último seq del log de cambios). Mientras no haya escrituras las
+    descargas se sirven desde la cache."""
+
+    def __init__(self):
+        self._cache: Dict[str, Tuple[int, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def en_cache(self, formato: str, version: int) -> Optional[bytes]:
+        with self._lock:
+            version_cache, datos = self._cache.get(formato, (None, None))
+        return datos if version_cache == version else None
+
+    def generar(self, formato: str, version: int) -> Iterator[bytes]:
+        """Emite el snapshot a medida que se codifica cada lote y al terminar lo deja en cache."""
+        sumidero = _Sumidero()
+        if formato == "parquet":
+            escritor = pq.ParquetWriter(sumidero, esquema(), compression="zstd")
+            escribir = escritor.write_batch
+        else:
+            escritor = pa.ipc.new_stream(sumidero, esquema())
+            escribir = escritor.write_batch
+        partes = []
+        for lote in self.lotes():
+            escribir(lote)
+            datos = sumidero.vaciar()
+            if datos:
+                partes.append(datos)
+                yield datos
+        escritor.close()
+        datos = sumidero.vaciar()
+        partes.append(datos)
+        yield datos
+        with self._lock:
+            self._cache[formato] = (version, b"".join(partes))
+
+    def lotes(self) -> Iterator["pa.RecordBatch"]:
+        with _sesion() as db:
+            categorias = _diccionario(db, models.Categorias.id_categoria, models.Categorias.nombre_categoria)
+            distribuidores = _diccionario(db, models.Distribuidores.id_distribuidor, models.Distribuidores.nombre)
+        # Con Productos particionado se recorre un shard tras otro: orden por id dentro de cada shard
+        for base in _bases_productos():
+            with base as db:
+                conexion = db.connection()
+                ultimo = 0
+                while True:
+                    filas = conexion.exec_driver_sql(SQL_PRODUCTOS, (ultimo, settings.SNAPSHOT_COLUMNAR_LOTE)).fetchall()
+                    if not filas:
+                        break
+                    yield _lote(list(zip(*filas)), categorias, distribuidores)
+                    ultimo = filas[-1][0]
+
+
+def _lote(columnas: list, categorias, distribuidores) -> "pa.RecordBatch":
+    (id_producto, codigo, nombre, marca, descripcion, id_categoria, id_distribuidor,
+     *precios, stock, fecha) = columnas
+    ids_categoria = pa.array(id_categoria, pa.int32())
+    ids_distribuidor = pa.array(id_distribuidor, pa.int32())
+    arrays = [
+        pa.array(id_producto, pa.int32()),
+        pa.array(codigo, pa.string()),
+        pa.array(nombre, pa.string()),
+        pa.array(marca, pa.string()),
+        pa.array(descripcion, pa.string()),
+        ids_categoria,
+        _codificar(ids_categoria, *categorias),
+        ids_distribuidor,
+        _codificar(ids_distribuidor, *distribuidores),
+    ]
+    # SQLite devuelve los DECIMAL como REAL: se redondean a la escala de la columna
+    for valores, (precision, escala) in zip(precios, DECIMALES.values()):
+        arrays.append(pc.round(pa.array(valores, pa.float64()), escala).cast(pa.decimal128(precision, escala)))
+    arrays.append(pa.array(stock, pa.int32()))
+    arrays.append(pa.array(fecha, pa.string()).cast(pa.date32()))
+    return pa.RecordBatch.from_arrays(arrays, schema=esquema())
+
+
+def _diccionario(db: Session, columna_id, columna_nombre) -> tuple:
+    filas = db.execute(select(columna_id, columna_nombre).order_by(columna_id)).all()
+    return pa.array([f[0] for f in filas], pa.int32()), pa.array([f[1] for f in filas], pa.string())
+
+
+def _codificar(ids: "pa.Array", ids_diccionario: "pa.Array", nombres: "pa.Array") -> "pa.DictionaryArray":
+    # Mismo diccionario en todos los lotes: posición del id entre los ids existentes
+    return pa.DictionaryArray.from_arrays(pc.index_in(ids, value_set=ids_diccionario), nombres)
+
+
+@contextmanager
+def _sesion():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _bases_productos():
+    if sharding.router:
+        return [sharding.router.sesion(shard) for shard in range(sharding.router.n_shards)]
+    return [_sesion()]
+
+
+columnar = ColumnarSnapshot()
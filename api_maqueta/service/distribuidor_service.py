@@ -0,0 +1,172 @@
+import logging
+import re
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from typing import Iterable, List, Optional
+from database import descartar_instancia
+import models
+import schemas
+from service.change_service import ChangeService
+
+logger = logging.getLogger(__name__)
+
+
+# Cuerpo numérico (con o sin puntos de miles) y dígito verificador 0-9 o K, con o sin guion
+FORMATO_RUT = re.compile(r"(\d{1,3}(?:\.?\d{3})*)-?([0-9kK])")
+
+
+def normalizar_rut(rut: str) -> str:
+    """Forma canónica del RUT: sin puntos, con guion y K mayúscula ("12.345.678-k" -> "12345678-K").
+
+    Un RUT con otro formato se rechaza con ValueError en vez de reescribirlo.
+    """
+    formato = FORMATO_RUT.fullmatch((rut or "").strip())
+    if not formato:
+        raise ValueError(f"El RUT {rut!r} no es válido (formato 12.345.678-K)")
+    cuerpo, verificador = formato.groups()
+    return f"{cuerpo.replace('.', '')}-{verificador.upper()}"
+
+
+def rut_buscable(rut: str) -> Optional[str]:
+    """Forma canónica para una búsqueda: un RUT inválido no coincide con ninguno."""
+    try:
+        return normalizar_rut(rut)
+    except ValueError:
+        return None
+
+
+class DistribuidorService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.cambios = ChangeService(db)
+
+    def get_all(self) -> List[models.Distribuidores]:
+        return self.db.query(models.Distribuidores).all()
+
+    def get_by_id(self, distribuidor_id: int) -> Optional[models.Distribuidores]:
+        return self.db.query(models.Distribuidores).filter(
+            models.Distribuidores.id_distribuidor == distribuidor_id
+        ).first()
+
+    def get_by_rut(self, rut: str) -> Optional[models.Distribuidores]:
+        canonico = rut_buscable(rut)
+        if canonico is None:
+            return None
+        return self.db.query(models.Distribuidores).filter(
+            models.Distribuidores.rut == canonico
+        ).first()
+
+    def get_many(self, ids: Iterable[int]) -> List[models.Distribuidores]:
+        """Distribuidores con los ids dados en una sola consulta, en el orden pedido (omite los inexistentes)."""
+        ids = list(dict.fromkeys(ids))
+        if not ids:
+            return []
+        encontrados = {
+            d.id_distribuidor: d
+            for d in self.db.query(models.Distribuidores).filter(models.Distribuidores.id_distribuidor.in_(ids))
+        }
+        return [encontrados[i] for i in ids if i in encontrados]
+
+    def get_many_by_rut(self, ruts: Iterable[str]) -> List[models.Distribuidores]:
+        """Igual que get_many pero por RUT; acepta RUT con o sin puntos."""
+        ruts = [r for r in dict.fromkeys(rut_buscable(r) for r in ruts) if r is not None]
+        if not ruts:
+            return []
+        encontrados = {
+            d.rut: d
+            for d in self.db.query(models.Distribuidores).filter(models.Distribuidores.rut.in_(ruts))
+        }
+        return [encontrados[r] for r in ruts if r in encontrados]
+
+    def create(self, distribuidor: schemas.DistribuidorCreate) -> models.Distribuidores:
+        datos = distribuidor.model_dump()
+        datos["rut"] = normalizar_rut(datos["rut"])
+        try:
+            db_distribuidor = self.db.scalars(
+                insert(models.Distribuidores).values(**datos).returning(models.Distribuidores)
+            ).one()
+            cambio = self.cambios.registrar("distribuidor", db_distribuidor.id_distribuidor, "create")
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise ValueError(f"El RUT {datos['rut']} ya existe")
+        self.cambios.publicar(cambio, db_distribuidor)
+        return db_distribuidor
+
+    def update(self, distribuidor_id: int, distribuidor_update) -> Optional[models.Distribuidores]:
+        update_data = distribuidor_update.model_dump(exclude_unset=True)
+        if update_data.get("rut") is not None:
+            update_data["rut"] = normalizar_rut(update_data["rut"])
+        if not update_data:
+            return self.get_by_id(distribuidor_id)
+        try:
+            descartar_instancia(self.db, models.Distribuidores, distribuidor_id)
+            db_distribuidor = self.db.scalars(
+                update(models.Distribuidores)
+                .where(models.Distribuidores.id_distribuidor == distribuidor_id)
+                .values(**update_data)
+                .returning(models.Distribuidores)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            if not db_distribuidor:
+                self.db.rollback()
+                return None
+            cambio = self.cambios.registrar("distribuidor", distribuidor_id, "update")
+            self.db.commit()
+        except IntegrityError:
+            self.db.rollback()
+            raise ValueError(f"El RUT {update_data.get('rut')} ya existe")
+        self.cambios.publicar(cambio, db_distribuidor)
+        return db_distribuidor
+
+    def partial_update(self, distribuidor_id: int, distribuidor_update: schemas.DistribuidorUpdate) -> Optional[models.Distribuidores]:
+        return self.update(distribuidor_id, distribuidor_update)
+
+    def delete(self, distribuidor_id: int) -> bool:
+        eliminado = self.db.execute(
+            delete(models.Distribuidores)
+            .where(models.Distribuidores.id_distribuidor == distribuidor_id)
+            .returning(models.Distribuidores.id_distribuidor)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not eliminado:
+            self.db.rollback()
+            return False
+        cambio = self.cambios.registrar("distribuidor", distribuidor_id, "delete")
+        self.db.commit()
+        self.cambios.publicar(cambio)
+        return True
+
+    def normalizar_ruts_existentes(self) -> int:
+        """Migración al iniciar: guarda en forma canónica los RUT de filas anteriores a normalizar_rut.
+
+        Así las búsquedas por RUT son siempre por igualdad sobre el índice único. Si
+        dos filas antiguas quedan con el mismo RUT, o una tiene un RUT inválido, se
+        deja como estaba y se avisa (hay que corregirla a mano).
+        """
+        filas = self.db.query(models.Distribuidores.id_distribuidor, models.Distribuidores.rut).all()
+        ocupados = {rut for _, rut in filas}
+        ids = []
+        for id_distribuidor, rut in filas:
+            canonico = rut_buscable(rut)
+            if canonico is None:
+                logger.warning("El RUT %r del distribuidor %s no es válido; no se normalizó", rut, id_distribuidor)
+                continue
+            if canonico == rut:
+                continue
+            if canonico in ocupados:
+                logger.warning("El RUT %r del distribuidor %s duplica a %s; no se normalizó", rut, id_distribuidor, canonico)
+                continue
+            self.db.execute(
+                update(models.Distribuidores)
+                .where(models.Distribuidores.id_distribuidor == id_distribuidor)
+                .values(rut=canonico)
+                .execution_options(synchronize_session=False)
+            )
+            ocupados.discard(rut)
+            ocupados.add(canonico)
+            ids.append(id_distribuidor)
+        self.cambios.registrar_lote("distribuidor", ids, "update")
+        self.db.commit()
+        return len(ids)
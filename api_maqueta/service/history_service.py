@@ -0,0 +1,274 @@
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy.orm import Session
+from sqlalchemy import Column, Integer, MetaData, Table, bindparam, case, cast, event, func, insert, literal, or_, select
+from sqlalchemy.sql.elements import ClauseElement
+from typing import Dict, Iterator, List, Optional
+import models
+
+# ==============================
+# HISTORIAL DE PRECIOS Y STOCK
+# ==============================
+# Una tabla por mes (HistorialProductos_AAAAMM), WITHOUT ROWID con clave
+# (id_producto, fecha): la tabla misma es el índice cubriente de las consultas
+# por producto y rango, sin b-tree aparte ni rowid. Por fila:
+#   fecha   milisegundos desde el inicio del mes
+#   base    1 en la primera fila del producto en el mes (valores absolutos), 0 en el resto
+#   precio_compra / margen_ganancia en centésimas, stock en unidades: delta
+#   respecto de la fila anterior salvo en las filas base
+# Los deltas son enteros pequeños (SQLite los guarda en 1-2 bytes) y borrar
+# meses antiguos es un DROP TABLE.
+CAMPOS = ("precio_compra", "margen_ganancia", "stock")
+ESCALA = {"precio_compra": 100, "margen_ganancia": 100, "stock": 1}
+
+_metadata = MetaData()
+_tablas: Dict[str, Table] = {}
+_creadas = set()
+_sentencias: Dict[tuple, tuple] = {}  # INSERT por producto compilados: (tabla, campos, base) -> (sql, orden, constantes)
+_lecturas: Dict[tuple, str] = {}  # SELECT de historial por tupla de tablas mensuales
+_lock = threading.Lock()
+
+
+def inicio_mes(fecha: datetime) -> datetime:
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def meses(desde: datetime, hasta: datetime) -> Iterator[datetime]:
+    mes = inicio_mes(desde)
+    while mes <= hasta:
+        yield mes
+        mes = (mes + timedelta(days=32)).replace(day=1)
+
+
+def tabla_mes(mes: datetime) -> Table:
+    nombre = f"HistorialProductos_{mes.year:04d}{mes.month:02d}"
+    with _lock:
+        if nombre not in _tablas:
+            _tablas[nombre] = Table(
+                nombre, _metadata,
+                Column("id_producto", Integer, primary_key=True, autoincrement=False),
+                Column("fecha", Integer, primary_key=True, autoincrement=False),
+                Column("base", Integer, nullable=False),
+                *[Column(campo, Integer, nullable=False) for campo in CAMPOS],
+                sqlite_with_rowid=False,
+            )
+        return _tablas[nombre]
+
+
+def _insercion(tabla: Table, condicion, nuevos: dict, forzar_base: bool, milisegundo):
+    """INSERT ... SELECT desde Productos con los valores absolutos (fila base) o los deltas."""
+    productos = models.Productos.__table__
+    ultima = select(func.max(tabla.c.fecha)).where(
+        tabla.c.id_producto == productos.c.id_producto
+    ).correlate(productos).scalar_subquery()
+    sin_base = literal(True) if forzar_base else ultima.is_(None)
+
+    def entero(expresion, campo):
+        return cast(func.round(expresion * ESCALA[campo]), Integer)
+
+    valores, cambios = [], []
+    for campo in CAMPOS:
+        actual = entero(productos.c[campo], campo)
+        nuevo = entero(nuevos[campo], campo) if campo in nuevos else actual
+        valores.append(case((sin_base, nuevo), else_=nuevo - actual))
+        if campo in nuevos:
+            cambios.append(nuevo != actual)
+
+    # Dos cambios del mismo producto en el mismo milisegundo: el segundo se corre a fecha + 1
+    fecha = case((ultima >= milisegundo, ultima + 1), else_=milisegundo)
+    seleccion = select(
+        productos.c.id_producto, fecha, case((sin_base, 1), else_=0), *valores
+    ).where(condicion, or_(sin_base, *cambios))
+    return insert(tabla).from_select(["id_producto", "fecha", "base", *CAMPOS], seleccion)
+
+
+def cambios_registrables(valores: dict) -> dict:
+    """Los campos con historial presentes en una actualización."""
+    return {campo: valores[campo] for campo in CAMPOS if valores.get(campo) is not None}
+
+
+def _valor(entero: int, campo: str):
+    return entero if ESCALA[campo] == 1 else Decimal(entero).scaleb(-2)
+
+
+class HistoryService:
+    """Historial solo de inserción de precio_compra, margen_ganancia y stock.
+
+    Lo escriben las altas y actualizaciones de ProductService dentro de su
+    propia transacción. Vive en la misma base que Productos (cada shard en
+    modo particionado).
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def registrar(self, condicion, nuevos: Optional[dict] = None, forzar_base: bool = False,
+                  ahora: Optional[datetime] = None) -> None:
+        """Agrega una fila por cada producto que cumple `condicion` y cuyo precio, margen o stock cambia.
+
+        `nuevos` son los valores (o expresiones SQL sobre Productos) que se van a
+        escribir; los campos ausentes quedan como están. Se llama antes del
+        UPDATE, así el delta se calcula contra los valores actuales en la misma
+        sentencia, sin SELECT previo. `forzar_base` guarda valores absolutos
+        (altas y productos que llegan de otro shard).
+        """
+        ahora = ahora or datetime.now()
+        mes = inicio_mes(ahora)
+        tabla = self._tabla(mes)
+        nuevos = {
+            campo: valor if isinstance(valor, ClauseElement) else literal(valor)
+            for campo, valor in (nuevos or {}).items()
+        }
+        self.db.execute(_insercion(tabla, condicion, nuevos, forzar_base, (ahora - mes) // timedelta(milliseconds=1)))
+
+    def registrar_producto(self, producto_id: int, nuevos: Optional[dict] = None, forzar_base: bool = False,
+                           ahora: Optional[datetime] = None) -> None:
+        """registrar() para un solo producto, el caso de cada alta y actualización.
+
+        La sentencia se compila una vez por tabla y combinación de campos y se
+        ejecuta directo en el driver: armar la expresión de SQLAlchemy en cada
+        escritura costaba más que la escritura misma.
+        """
+        nuevos = nuevos or {}
+        if not nuevos and not forzar_base:
+            return
+        ahora = ahora or datetime.now()
+        mes = inicio_mes(ahora)
+        tabla = self._tabla(mes)
+        clave = (tabla.name, tuple(campo for campo in CAMPOS if campo in nuevos), forzar_base)
+        if clave not in _sentencias:
+            compilada = _insercion(
+                tabla, models.Productos.id_producto == bindparam("id_producto"),
+                {campo: bindparam(campo) for campo in clave[1]}, forzar_base, bindparam("milisegundo")
+            ).compile(dialect=self.db.get_bind().dialect)
+            _sentencias[clave] = (str(compilada), compilada.positiontup, compilada.params)
+        sql, orden, constantes = _sentencias[clave]
+        parametros = {
+            **constantes,
+            "id_producto": producto_id,
+            "milisegundo": (ahora - mes) // timedelta(milliseconds=1),
+            **{campo: float(valor) if isinstance(valor, Decimal) else valor for campo, valor in nuevos.items()},
+        }
+        self.db.connection().exec_driver_sql(sql, tuple(parametros[nombre] for nombre in orden))
+
+    def get_history(self, producto_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+        """Valores del producto después de cada cambio en [desde, hasta], en orden."""
+        return [p for p in self.puntos(producto_id, desde, hasta) if p["fecha"] >= desde]
+
+    def puntos(self, producto_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+        """Decodifica los meses que cubren el rango. Incluye los cambios del mes
+        de `desde` anteriores a esa fecha, que dan el valor vigente al inicio; si
+        el producto no cambió en ese mes, el valor vigente es el último punto del
+        mes anterior más reciente en que cambió."""
+        inicios = self._meses_existentes(list(meses(desde, hasta)))
+        puntos = self._leer(producto_id, inicios, hasta) if inicios else []
+        if not puntos or inicio_mes(puntos[0]["fecha"]) > inicio_mes(desde):
+            anterior = self._ultimo_anterior(producto_id, inicio_mes(desde))
+            if anterior:
+                puntos.insert(0, anterior)
+        return puntos
+
+    def _ultimo_anterior(self, producto_id: int, mes: datetime) -> Optional[dict]:
+        """Último punto del producto antes de `mes`: el final del mes anterior más reciente con filas suyas."""
+        anteriores = self.db.connection().exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'HistorialProductos\\_%' ESCAPE '\\'"
+            " AND name < ? ORDER BY name DESC", (tabla_mes(mes).name,)
+        ).scalars().all()
+        for nombre in anteriores:
+            sufijo = nombre.rsplit("_", 1)[1]
+            inicio = datetime(int(sufijo[:4]), int(sufijo[4:]), 1)
+            # Cada mes empieza con una fila base del producto: alcanza con decodificar ese mes
+            puntos = self._leer(producto_id, [inicio], mes)
+            if puntos:
+                return puntos[-1]
+        return None
+
+    def _leer(self, producto_id: int, inicios: List[datetime], hasta: datetime) -> List[dict]:
+        # Todos los meses en una sola consulta (UNION ALL), cada uno leído por su clave primaria
+        nombres = tuple(tabla_mes(mes).name for mes in inicios)
+        if nombres not in _lecturas:
+            _lecturas[nombres] = " UNION ALL ".join(
+                f"SELECT {n}, fecha, base, {', '.join(CAMPOS)} FROM {nombre} WHERE id_producto = ? AND fecha <= ?"
+                for n, nombre in enumerate(nombres)
+            ) + " ORDER BY 1, 2"
+        parametros = []
+        for mes in inicios:
+            parametros += [producto_id, (hasta - mes) // timedelta(milliseconds=1)]
+
+        puntos, estado = [], None
+        for n, milisegundo, base, *valores in self.db.connection().exec_driver_sql(_lecturas[nombres], tuple(parametros)):
+            estado = valores if base else [a + d for a, d in zip(estado, valores)]
+            puntos.append({
+                "fecha": inicios[n] + timedelta(milliseconds=milisegundo),
+                **{campo: _valor(valor, campo) for campo, valor in zip(CAMPOS, estado)},
+            })
+        return puntos
+
+    def _meses_existentes(self, candidatos: List[datetime]) -> List[datetime]:
+        url = str(self.db.get_bind().url)
+        nombres = {mes: tabla_mes(mes).name for mes in candidatos}
+        faltantes = [nombre for nombre in nombres.values() if (url, nombre) not in _creadas]
+        if faltantes:
+            # Una sola consulta al catálogo para todos los meses aún no vistos
+            marcadores = ", ".join("?" * len(faltantes))
+            for (nombre,) in self.db.connection().exec_driver_sql(
+                f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({marcadores})", tuple(faltantes)
+            ):
+                _creadas.add((url, nombre))
+        return [mes for mes, nombre in nombres.items() if (url, nombre) in _creadas]
+
+    def _tabla(self, mes: datetime) -> Table:
+        """Tabla del mes, creándola si no existe (solo en escrituras)."""
+        tabla = tabla_mes(mes)
+        clave = (str(self.db.get_bind().url), tabla.name)
+        if clave in _creadas:
+            return tabla
+        tabla.create(self.db.connection(), checkfirst=True)
+        # Se recuerda recién al confirmar: si la transacción se revierte, el CREATE TABLE también
+        vigente = {"ok": True}
+        event.listen(self.db, "after_rollback", lambda session: vigente.update(ok=False), once=True)
+        event.listen(self.db, "after_commit", lambda session: vigente["ok"] and _creadas.add(clave), once=True)
+        return tabla
+
+
+def muestrear(puntos: List[dict], desde: datetime, hasta: datetime, buckets: int) -> List[dict]:
+    """Serie de `buckets` intervalos iguales entre desde y hasta: último valor de cada
+    campo en el intervalo (se arrastra si no hubo cambios), mínimo y máximo de
+    precio_compra y cantidad de cambios. Los intervalos anteriores al primer
+    valor conocido se omiten."""
+    ancho = (hasta - desde) / buckets
+    serie = []
+    estado: Optional[dict] = None
+    i = 0
+    for n in range(buckets):
+        inicio = desde + ancho * n
+        fin = hasta if n == buckets - 1 else inicio + ancho
+        cambios = 0
+        precios: List[Decimal] = [estado["precio_compra"]] if estado else []
+        while i < len(puntos) and (puntos[i]["fecha"] < fin or (n == buckets - 1 and puntos[i]["fecha"] <= fin)):
+            estado = puntos[i]
+            if estado["fecha"] >= inicio:
+                cambios += 1
+                precios.append(estado["precio_compra"])
+            else:
+                precios = [estado["precio_compra"]]
+            i += 1
+        if estado is None:
+            continue
+        serie.append({
+            "desde": inicio,
+            "hasta": fin,
+            "precio_compra": estado["precio_compra"],
+            "precio_compra_min": min(precios),
+            "precio_compra_max": max(precios),
+            "margen_ganancia": estado["margen_ganancia"],
+            "stock": estado["stock"],
+            "cambios": cambios,
+        })
+    return serie
+
+
+def combinar(listas: List[List[dict]]) -> List[dict]:
+    """Une puntos de varias bases (shards) en orden de fecha."""
+    return sorted((p for lista in listas for p in lista), key=lambda p: p["fecha"])
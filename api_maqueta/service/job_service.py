@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from sqlalchemy.orm import Session
+from sqlalchemy import or_, select, update
+from typing import List, Optional
+from config import settings
+import models
+import schemas
+import sharding
+
+TERMINADOS = ("completado", "fallido", "cancelado")
+
+
+class JobService:
+    """Tabla de trabajos en segundo plano: alta, consulta, cancelación y transiciones de estado."""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_all(self, estado: Optional[str] = None, limit: int = 100) -> List[models.Trabajos]:
+        query = self.db.query(models.Trabajos)
+        if estado:
+            query = query.filter(models.Trabajos.estado == estado)
+        return query.order_by(models.Trabajos.id_trabajo.desc()).limit(limit).all()
+
+    def get_by_id(self, trabajo_id: int) -> Optional[models.Trabajos]:
+        return self.db.get(models.Trabajos, trabajo_id)
+
+    def create(self, trabajo: schemas.TrabajoCreate) -> models.Trabajos:
+        db_trabajo = models.Trabajos(tipo=trabajo.tipo, parametros=self._validar(trabajo.tipo, trabajo.parametros))
+        self.db.add(db_trabajo)
+        self.db.commit()
+        return db_trabajo
+
+    def cancel(self, trabajo_id: int) -> Optional[models.Trabajos]:
+        """Un trabajo pendiente se cancela de inmediato; uno en curso se detiene al terminar su lote actual."""
+        db_trabajo = self.get_by_id(trabajo_id)
+        if not db_trabajo:
+            return None
+        if db_trabajo.estado in TERMINADOS:
+            raise ValueError(f"El trabajo ya terminó ({db_trabajo.estado})")
+        db_trabajo.cancelacion_solicitada = True
+        if db_trabajo.estado == "pendiente":
+            db_trabajo.estado = "cancelado"
+            db_trabajo.terminado = datetime.now()
+        self.db.commit()
+        return db_trabajo
+
+    # ------------------------------
+    # Transiciones usadas por jobs.py
+    # ------------------------------
+    def tomar_pendientes(self, limit: int, propietario: str) -> List[int]:
+        """Marca en_curso hasta `limit` trabajos pendientes (los más antiguos) a nombre de `propietario` y devuelve sus ids.
+
+        Es un solo UPDATE, así dos ejecutores nunca toman el mismo trabajo.
+        """
+        pendientes = select(models.Trabajos.id_trabajo).where(
+            models.Trabajos.estado == "pendiente"
+        ).order_by(models.Trabajos.id_trabajo).limit(limit)
+        ahora = datetime.now()
+        ids = self.db.scalars(
+            update(models.Trabajos)
+            .where(models.Trabajos.id_trabajo.in_(pendientes.scalar_subquery()))
+            .values(estado="en_curso", iniciado=ahora, propietario=propietario, latido=ahora)
+            .returning(models.Trabajos.id_trabajo)
+            .execution_options(synchronize_session=False)
+        ).all()
+        self.db.commit()
+        return sorted(ids)
+
+    def renovar(self, propietario: str) -> None:
+        """Renueva el latido de los trabajos en curso de `propietario` (mientras lo haga, nadie más los reanuda)."""
+        self.db.execute(
+            update(models.Trabajos)
+            .where(models.Trabajos.estado == "en_curso", models.Trabajos.propietario == propietario)
+            .values(latido=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+    def reanudar_interrumpidos(self, propietario: Optional[str] = None) -> int:
+        """Devuelve a pendiente los trabajos en_curso interrumpidos; se reanudan desde su checkpoint.
+
+        Sin `propietario`, los de ejecutores que dejaron de renovar su latido
+        (proceso detenido): los que corren en otro worker no se tocan. Con
+        `propietario`, los de ese ejecutor (su pool de procesos se interrumpió).
+        """
+        if propietario:
+            condicion = models.Trabajos.propietario == propietario
+        else:
+            vencimiento = datetime.now() - timedelta(seconds=settings.JOBS_LEASE_SEGUNDOS)
+            condicion = or_(models.Trabajos.latido.is_(None), models.Trabajos.latido < vencimiento)
+        reanudados = self.db.execute(
+            update(models.Trabajos)
+            .where(models.Trabajos.estado == "en_curso", condicion)
+            .values(estado="pendiente", propietario=None, latido=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+        return reanudados
+
+    def finalizar(self, trabajo_id: int, estado: str, resultado: Optional[dict] = None, error: Optional[str] = None,
+                  propietario: Optional[str] = None) -> None:
+        """Deja el estado final; con `propietario`, solo si el trabajo sigue siendo suyo."""
+        condicion = [models.Trabajos.id_trabajo == trabajo_id]
+        if propietario:
+            condicion += [models.Trabajos.estado == "en_curso", models.Trabajos.propietario == propietario]
+        self.db.execute(
+            update(models.Trabajos)
+            .where(*condicion)
+            .values(estado=estado, resultado=resultado, error=error, terminado=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+    @staticmethod
+    def _validar(tipo: str, parametros: dict) -> dict:
+        """Valida los parámetros de cada tipo y los deja serializables a JSON."""
+        if tipo == "importacion":
+            productos = parametros.get("productos")
+            if not productos or not isinstance(productos, list):
+                raise ValueError("La importación requiere una lista 'productos' no vacía")
+            return {"productos": [schemas.ProductoCreate(**p).model_dump(mode="json") for p in productos]}
+
+        filtros = {}
+        for campo in ("categoria_id", "distribuidor_id"):
+            if parametros.get(campo) is not None:
+                if not isinstance(parametros[campo], int):
+                    raise ValueError(f"'{campo}' debe ser un entero")
+                filtros[campo] = parametros[campo]
+
+        if tipo == "reprecio":
+            if sharding.router:
+                raise ValueError("El reprecio masivo no está disponible con Productos particionado")
+            valores = {}
+            for campo in ("margen_ganancia", "factor_precio"):
+                if parametros.get(campo) is not None:
+                    try:
+                        valores[campo] = str(Decimal(str(parametros[campo])))
+                    except InvalidOperation:
+                        raise ValueError(f"'{campo}' debe ser numérico")
+            if not valores:
+                raise ValueError("El reprecio requiere 'margen_ganancia' y/o 'factor_precio'")
+            if "margen_ganancia" in valores:
+                # Mismo rango que ProductoBase: un margen fuera de él deja productos que la API no puede serializar
+                schemas.ProductoBase.ganancia_must_be_reasonable(Decimal(valores["margen_ganancia"]))
+            if "factor_precio" in valores and Decimal(valores["factor_precio"]) <= 0:
+                raise ValueError("'factor_precio' debe ser mayor que 0")
+            return {**valores, **filtros}
+        if tipo == "exportacion":
+            return filtros
+        return {}
@@ -1,16 +1,42 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from typing import List, Optional, Dict
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import and_, or_, func, insert, select, update, delete
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from decimal import Decimal
+from typing import Iterable, List, Optional, Dict
+from database import descartar_instancia
 import models
 import schemas
+from service.change_service import ChangeService
+from service.history_service import HistoryService, cambios_registrables, muestrear
+
+CODIGO_DUPLICADO = {
+    "UNIQUE constraint failed: Productos.codigo_producto",
+    "UNIQUE constraint failed: DirectorioProductos.codigo_producto",
+}
+
 
 class ProductService:
     def __init__(self, db: Session):
         self.db = db
+        self.cambios = ChangeService(db)
+        self.historial = HistoryService(db)
 
     def get_all(self, skip: int = 0, limit: int = 100) -> List[models.Productos]:
         return self.db.query(models.Productos).offset(skip).limit(limit).all()
 
+    def listar_desde(self, after_id: Optional[int] = None, limit: int = 100, categoria_id: Optional[int] = None,
+                     distribuidor_id: Optional[int] = None) -> List[models.Productos]:
+        """Paginación por keyset: productos con id mayor a `after_id`, ordenados por id."""
+        query = self._query_con_relaciones()
+        if after_id is not None:
+            query = query.filter(models.Productos.id_producto > after_id)
+        if categoria_id:
+            query = query.filter(models.Productos.id_categoria == categoria_id)
+        if distribuidor_id:
+            query = query.filter(models.Productos.id_distribuidor == distribuidor_id)
+        return query.order_by(models.Productos.id_producto).limit(limit).all()
+
     def get_by_id(self, producto_id: int) -> Optional[models.Productos]:
         return self.db.query(models.Productos).filter(
             models.Productos.id_producto == producto_id
@@ -21,44 +47,138 @@ class ProductService:
             models.Productos.codigo_producto == codigo_producto
         ).first()
 
+    def get_many(self, ids: Iterable[int]) -> List[Optional[models.Productos]]:
+        """Productos por id en una sola consulta IN, en el orden pedido y con None para los inexistentes."""
+        ids = list(ids)
+        encontrados = {
+            p.id_producto: p
+            for p in self._query_con_relaciones().filter(models.Productos.id_producto.in_(set(ids)))
+        } if ids else {}
+        return [encontrados.get(i) for i in ids]
+
+    def get_many_by_codigo_producto(self, codigos: Iterable[str]) -> List[Optional[models.Productos]]:
+        """Igual que get_many pero por código de producto."""
+        codigos = list(codigos)
+        encontrados = {
+            p.codigo_producto: p
+            for p in self._query_con_relaciones().filter(models.Productos.codigo_producto.in_(set(codigos)))
+        } if codigos else {}
+        return [encontrados.get(c) for c in codigos]
+
+    def _query_con_relaciones(self):
+        return self.db.query(models.Productos).options(
+            joinedload(models.Productos.categoria),
+            joinedload(models.Productos.distribuidor)
+        )
+
+    # Las escrituras son una sola sentencia: la restricción UNIQUE detecta los
+    # duplicados y RETURNING devuelve las columnas calculadas (precio_*), sin
+    # SELECT previo ni refresh posterior.
     def create(self, producto: schemas.ProductoCreate) -> models.Productos:
-        # Verificar si el código de producto ya existe
-        if self.get_by_codigo_producto(producto.codigo_producto):
-            raise ValueError(f"El código de producto {producto.codigo_producto} ya existe")
-        
-        # Crear instancia
-        db_producto = models.Productos(**producto.model_dump())
-        
-        self.db.add(db_producto)
-        self.db.commit()
-        self.db.refresh(db_producto)
+        try:
+            db_producto = self.db.scalars(
+                insert(models.Productos).values(**producto.model_dump()).returning(models.Productos)
+            ).one()
+            self.historial.registrar_producto(db_producto.id_producto, forzar_base=True)
+            cambio = self.cambios.registrar("producto", db_producto.id_producto, "create")
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            raise self._error_integridad(e, producto.codigo_producto)
+        self.cambios.publicar(cambio, db_producto)
         return db_producto
 
     def update(self, producto_id: int, producto_update: schemas.ProductoUpdate) -> Optional[models.Productos]:
-        db_producto = self.get_by_id(producto_id)
-        if not db_producto:
-            return None
-        
         update_data = producto_update.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_producto, field, value)
-        
-        self.db.commit()
-        self.db.refresh(db_producto)
+        if not update_data:
+            return self.get_by_id(producto_id)
+
+        try:
+            self.historial.registrar_producto(producto_id, cambios_registrables(update_data))
+            descartar_instancia(self.db, models.Productos, producto_id)
+            db_producto = self.db.scalars(
+                update(models.Productos)
+                .where(models.Productos.id_producto == producto_id)
+                .values(**update_data)
+                .returning(models.Productos)
+                .execution_options(synchronize_session=False)
+            ).one_or_none()
+            if not db_producto:
+                self.db.rollback()
+                return None
+            cambio = self.cambios.registrar("producto", producto_id, "update")
+            self.db.commit()
+        except IntegrityError as e:
+            self.db.rollback()
+            raise self._error_integridad(e, update_data.get("codigo_producto"))
+        self.cambios.publicar(cambio, db_producto)
         return db_producto
 
     def partial_update(self, producto_id: int, producto_update: schemas.ProductoUpdate) -> Optional[models.Productos]:
         return self.update(producto_id, producto_update)
 
     def delete(self, producto_id: int) -> bool:
-        db_producto = self.get_by_id(producto_id)
-        if not db_producto:
+        eliminado = self.db.execute(
+            delete(models.Productos)
+            .where(models.Productos.id_producto == producto_id)
+            .returning(models.Productos.id_producto)
+            .execution_options(synchronize_session=False)
+        ).first()
+        if not eliminado:
+            self.db.rollback()
             return False
-        
-        self.db.delete(db_producto)
+        cambio = self.cambios.registrar("producto", producto_id, "delete")
         self.db.commit()
+        self.cambios.publicar(cambio)
         return True
 
+    def repreciar_lote(self, after_id: int, limit: int, margen_ganancia: Optional[Decimal] = None,
+                       factor_precio: Optional[Decimal] = None, categoria_id: Optional[int] = None,
+                       distribuidor_id: Optional[int] = None) -> List[int]:
+        """Actualiza margen y/o precio de compra de los siguientes `limit` productos con id mayor a `after_id`.
+
+        Un solo UPDATE por lote con su registro en el log de cambios. No confirma
+        la transacción: quien agrupa los lotes (jobs.py) hace commit junto con su
+        checkpoint. Devuelve los ids actualizados en orden.
+        """
+        seleccion = select(models.Productos.id_producto).where(models.Productos.id_producto > after_id)
+        if categoria_id:
+            seleccion = seleccion.where(models.Productos.id_categoria == categoria_id)
+        if distribuidor_id:
+            seleccion = seleccion.where(models.Productos.id_distribuidor == distribuidor_id)
+        seleccion = seleccion.order_by(models.Productos.id_producto).limit(limit)
+
+        valores = {}
+        if margen_ganancia is not None:
+            valores["margen_ganancia"] = margen_ganancia
+        if factor_precio is not None:
+            valores["precio_compra"] = func.round(models.Productos.precio_compra * factor_precio, 2)
+        condicion = models.Productos.id_producto.in_(seleccion.scalar_subquery())
+        self.historial.registrar(condicion, valores)
+        ids = sorted(self.db.scalars(
+            update(models.Productos)
+            .where(condicion)
+            .values(**valores)
+            .returning(models.Productos.id_producto)
+            .execution_options(synchronize_session=False)
+        ))
+        self.cambios.registrar_lote("producto", ids, "update")
+        return ids
+
+    def get_history(self, producto_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+        return self.historial.get_history(producto_id, desde, hasta)
+
+    def get_history_series(self, producto_id: int, desde: datetime, hasta: datetime, buckets: int) -> List[dict]:
+        return muestrear(self.historial.puntos(producto_id, desde, hasta), desde, hasta, buckets)
+
+    @staticmethod
+    def _error_integridad(error: IntegrityError, codigo_producto: Optional[str]) -> ValueError:
+        # Solo la restricción UNIQUE es un código duplicado (un NOT NULL también menciona la columna);
+        # en modo particionado la del directorio de cada shard
+        if str(error.orig) in CODIGO_DUPLICADO:
+            return ValueError(f"El código de producto {codigo_producto} ya existe")
+        return ValueError(f"Datos de producto inválidos: {error.orig}")
+
     def count_all(self) -> int:
         return self.db.query(models.Productos).count()
 
@@ -0,0 +1,651 @@
+import heapq
+import logging
+import threading
+import time
+from itertools import islice
+from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, update, delete
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from config import settings
+from database import SessionLocal
+import models
+import schemas
+import sharding
+from service import change_service
+from service.change_service import ChangeService, broker, serializar_entidad
+from service.history_service import HistoryService, cambios_registrables, combinar, muestrear, tabla_mes
+from service.product_service import ProductService
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_ESCRIBIBLES = [c.key for c in models.Productos.__table__.columns if c.computed is None]
+LOTE_MIGRACION = 500  # productos de la base global que pasan a los shards por transacción
+
+
+class ShardedProductService:
+    """ProductService para el modo particionado.
+
+    Productos vive en N shards según id_distribuidor y ninguna escritura pasa
+    por la base global: el id lo asigna el generador de un shard, la unicidad
+    de codigo_producto la garantiza el directorio del shard dueño del código y
+    el cambio se anota en el log del shard, en la misma transacción que la
+    fila; RelayCambios lo lleva después al log global y lo publica. Las
+    operaciones de un solo producto o distribuidor van directo a su shard; los
+    listados y conteos globales consultan todos los shards en paralelo y
+    mezclan por id.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.router = sharding.router
+
+    # ------------------------------
+    # Lecturas
+    # ------------------------------
+    def get_all(self, skip: int = 0, limit: int = 100) -> List[models.Productos]:
+        return self._mezclar(skip, limit)
+
+    def listar_desde(self, after_id: Optional[int] = None, limit: int = 100, categoria_id: Optional[int] = None,
+                     distribuidor_id: Optional[int] = None) -> List[models.Productos]:
+        if distribuidor_id:
+            with self.router.sesion(self.router.shard_para(distribuidor_id)) as db:
+                return ProductService(db).listar_desde(after_id, limit, categoria_id, distribuidor_id)
+        partes = self.router.en_todos(
+            lambda db, shard: ProductService(db).listar_desde(after_id, limit, categoria_id)
+        )
+        return list(islice(heapq.merge(*partes, key=lambda p: p.id_producto), limit))
+
+    def get_by_id(self, producto_id: int) -> Optional[models.Productos]:
+        return self.get_many([producto_id])[0]
+
+    def get_by_codigo_producto(self, codigo_producto: str) -> Optional[models.Productos]:
+        return self.get_many_by_codigo_producto([codigo_producto])[0]
+
+    def get_many(self, ids: Iterable[int]) -> List[Optional[models.Productos]]:
+        ids = list(ids)
+        encontrados = self._leer_por_shard(self._entradas(set(ids)))
+        return [encontrados.get(i) for i in ids]
+
+    def get_many_by_codigo_producto(self, codigos: Iterable[str]) -> List[Optional[models.Productos]]:
+        codigos = list(codigos)
+        por_dueño: Dict[int, Set[str]] = {}
+        for codigo in set(codigos):
+            por_dueño.setdefault(self.router.dueño_de_codigo(codigo), set()).add(codigo)
+        entradas = self._directorio(por_dueño, models.DirectorioProductos.codigo_producto)
+        encontrados = {p.codigo_producto: p for p in self._leer_por_shard(entradas).values()}
+        return [encontrados.get(c) for c in codigos]
+
+    def get_history(self, producto_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+        return [p for p in self._puntos_historial(producto_id, desde, hasta) if p["fecha"] >= desde]
+
+    def get_history_series(self, producto_id: int, desde: datetime, hasta: datetime, buckets: int) -> List[dict]:
+        return muestrear(self._puntos_historial(producto_id, desde, hasta), desde, hasta, buckets)
+
+    def _puntos_historial(self, producto_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+        # Un producto que cambió de distribuidor tiene historial en más de un shard
+        return combinar(self.router.en_todos(lambda db, shard: HistoryService(db).puntos(producto_id, desde, hasta)))
+
+    def count_all(self) -> int:
+        return sum(self.router.en_todos(lambda db, shard: ProductService(db).count_all()))
+
+    def filtrar_por_categoria(self, categoria_id: int, skip: int = 0, limit: int = 100) -> List[models.Productos]:
+        return self._mezclar(skip, limit, categoria_id=categoria_id)
+
+    def filtrar_por_distribuidor(self, distribuidor_id: int, skip: int = 0, limit: int = 100) -> List[models.Productos]:
+        with self.router.sesion(self.router.shard_para(distribuidor_id)) as db:
+            return ProductService(db).listar_desde(None, skip + limit, distribuidor_id=distribuidor_id)[skip:]
+
+    def _mezclar(self, skip: int, limit: int, categoria_id: Optional[int] = None) -> List[models.Productos]:
+        # Con offset cada shard debe entregar skip + limit filas; el keyset (listar_desde) evita ese costo
+        partes = self.router.en_todos(
+            lambda db, shard: ProductService(db).listar_desde(None, skip + limit, categoria_id)
+        )
+        return list(islice(heapq.merge(*partes, key=lambda p: p.id_producto), skip, skip + limit))
+
+    def _entradas(self, ids: Set[int]) -> List[models.DirectorioProductos]:
+        """Entradas del directorio por id. Cada id se busca primero en el shard que lo
+        asignó (id módulo N), que es el dueño de su código mientras este no cambie;
+        los que no aparecen se buscan en los demás shards."""
+        n = self.router.n_shards
+        por_shard: Dict[int, Set[int]] = {}
+        for i in ids:
+            por_shard.setdefault(i % n, set()).add(i)
+        entradas = self._directorio(por_shard, models.DirectorioProductos.id_producto)
+        faltantes = ids - {entrada.id_producto for entrada in entradas}
+        if faltantes:
+            resto = {shard: faltantes - por_shard.get(shard, set()) for shard in range(n)}
+            entradas += self._directorio(resto, models.DirectorioProductos.id_producto)
+        return entradas
+
+    def _entrada(self, producto_id: int) -> Optional[models.DirectorioProductos]:
+        entradas = self._entradas({producto_id})
+        return entradas[0] if entradas else None
+
+    def _directorio(self, claves_por_shard: Dict[int, set], columna) -> List[models.DirectorioProductos]:
+        shards = [shard for shard, claves in claves_por_shard.items() if claves]
+        if not shards:
+            return []
+        partes = self.router.en_paralelo(shards, lambda db, shard: db.query(models.DirectorioProductos).filter(
+            columna.in_(claves_por_shard[shard])
+        ).all())
+        return [entrada for parte in partes for entrada in parte]
+
+    def _leer_por_shard(self, entradas: List[models.DirectorioProductos]) -> Dict[int, models.Productos]:
+        por_shard: Dict[int, List[int]] = {}
+        for entrada in entradas:
+            por_shard.setdefault(entrada.shard, []).append(entrada.id_producto)
+        if not por_shard:
+            return {}
+        shards = list(por_shard)
+        partes = self.router.en_paralelo(shards, lambda db, shard: ProductService(db).get_many(por_shard[shard]))
+        return {p.id_producto: p for parte in partes for p in parte if p is not None}
+
+    # ------------------------------
+    # Escrituras
+    # ------------------------------
+    def create(self, producto: schemas.ProductoCreate) -> models.Productos:
+        shard = self.router.shard_para(producto.id_distribuidor)
+        dueño = self.router.dueño_de_codigo(producto.codigo_producto)
+        # Si el código es de otro shard se reserva primero allí; si no, va en la misma transacción
+        id_producto = self._reservar(dueño, producto.codigo_producto, shard) if dueño != shard else None
+        try:
+            with self.router.sesion(shard) as db:
+                if id_producto is None:
+                    id_producto = self._anotar_en_directorio(db, producto.codigo_producto, shard)
+                db_producto = db.scalars(
+                    insert(models.Productos)
+                    .values(id_producto=id_producto, **producto.model_dump())
+                    .returning(models.Productos)
+                ).one()
+                HistoryService(db).registrar_producto(id_producto, forzar_base=True)
+                cambio = ChangeService(db).registrar("producto", id_producto, "create")
+                db.commit()
+                self._cargar_relaciones(db_producto)
+        except Exception as e:
+            if dueño != shard:
+                self._liberar(dueño, id_producto)
+            if isinstance(e, IntegrityError):
+                raise ProductService._error_integridad(e, producto.codigo_producto)
+            raise
+        relay.enviar(shard, cambio, db_producto)
+        return db_producto
+
+    def update(self, producto_id: int, producto_update: schemas.ProductoUpdate) -> Optional[models.Productos]:
+        entrada = self._entrada(producto_id)
+        if entrada is None:
+            return None
+        update_data = producto_update.model_dump(exclude_unset=True)
+        if not update_data:
+            return self.get_by_id(producto_id)
+
+        codigo_anterior = entrada.codigo_producto
+        codigo_nuevo = update_data.get("codigo_producto", codigo_anterior)
+        dueño_anterior = self.router.dueño_de_codigo(codigo_anterior)
+        dueño_nuevo = self.router.dueño_de_codigo(codigo_nuevo)
+        cambia_dueño = dueño_nuevo != dueño_anterior
+        shard_anterior = entrada.shard
+        shard_nuevo = self.router.shard_para(update_data["id_distribuidor"]) if "id_distribuidor" in update_data else shard_anterior
+
+        # Un código nuevo se reserva antes de escribir la fila (se revierte si la escritura falla);
+        # la entrada sigue apuntando al shard actual hasta que la fila esté en el nuevo
+        if cambia_dueño:
+            self._reservar(dueño_nuevo, codigo_nuevo, shard_anterior, producto_id)
+        elif codigo_nuevo != codigo_anterior:
+            self._actualizar_directorio(dueño_anterior, producto_id, codigo_producto=codigo_nuevo)
+        try:
+            if shard_nuevo == shard_anterior:
+                with self.router.sesion(shard_anterior) as db:
+                    HistoryService(db).registrar_producto(producto_id, cambios_registrables(update_data))
+                    db_producto = db.scalars(
+                        update(models.Productos)
+                        .where(models.Productos.id_producto == producto_id)
+                        .values(**update_data)
+                        .returning(models.Productos)
+                        .execution_options(synchronize_session=False)
+                    ).one_or_none()
+                    if db_producto is not None:
+                        cambio = ChangeService(db).registrar("producto", producto_id, "update")
+                        db.commit()
+                        self._cargar_relaciones(db_producto)
+            else:
+                db_producto, cambio = self._mover(producto_id, dueño_nuevo, shard_anterior, shard_nuevo, update_data)
+        except Exception as e:
+            self._revertir_codigo(producto_id, codigo_anterior, codigo_nuevo)
+            if isinstance(e, IntegrityError):
+                raise ProductService._error_integridad(e, update_data.get("codigo_producto"))
+            raise
+        if db_producto is None:
+            # Se borró mientras tanto
+            self._revertir_codigo(producto_id, codigo_anterior, codigo_nuevo)
+            return None
+        # Con la fila escrita se borra la entrada del código anterior
+        if cambia_dueño:
+            self._liberar(dueño_anterior, producto_id)
+        relay.enviar(shard_nuevo, cambio, db_producto)
+        return db_producto
+
+    def _revertir_codigo(self, producto_id: int, codigo_anterior: str, codigo_nuevo: str) -> None:
+        """Deshace la reserva o el cambio de código de una actualización que no se escribió."""
+        dueño_anterior = self.router.dueño_de_codigo(codigo_anterior)
+        dueño_nuevo = self.router.dueño_de_codigo(codigo_nuevo)
+        if dueño_nuevo != dueño_anterior:
+            self._liberar(dueño_nuevo, producto_id)
+        elif codigo_nuevo != codigo_anterior:
+            self._actualizar_directorio(dueño_anterior, producto_id, codigo_producto=codigo_anterior)
+
+    def partial_update(self, producto_id: int, producto_update: schemas.ProductoUpdate) -> Optional[models.Productos]:
+        return self.update(producto_id, producto_update)
+
+    def delete(self, producto_id: int) -> bool:
+        entrada = self._entrada(producto_id)
+        if entrada is None:
+            return False
+        dueño = self.router.dueño_de_codigo(entrada.codigo_producto)
+        with self.router.sesion(entrada.shard) as db:
+            db.execute(delete(models.Productos).where(models.Productos.id_producto == producto_id))
+            if dueño == entrada.shard:
+                db.execute(delete(models.DirectorioProductos).where(models.DirectorioProductos.id_producto == producto_id))
+            cambio = ChangeService(db).registrar("producto", producto_id, "delete")
+            db.commit()
+        if dueño != entrada.shard:
+            self._liberar(dueño, producto_id)
+        if entrada.shard_pendiente is not None:
+            # Copia de un cambio de shard sin terminar: sin la entrada del directorio nadie más la borraría
+            self._borrar_fila(entrada.shard_pendiente, producto_id)
+        relay.enviar(entrada.shard, cambio)
+        return True
+
+    def _anotar_en_directorio(self, db: Session, codigo_producto: str, shard: int, id_producto: Optional[int] = None) -> int:
+        """Entrada del directorio en el shard de `db` (sin commit); sin `id_producto` ese shard asigna uno nuevo."""
+        id_producto = id_producto or self.router.nuevo_id(db)
+        db.execute(insert(models.DirectorioProductos).values(
+            id_producto=id_producto, codigo_producto=codigo_producto, shard=shard
+        ))
+        return id_producto
+
+    def _reservar(self, dueño: int, codigo_producto: str, shard: int, id_producto: Optional[int] = None) -> int:
+        """Reserva el código en el directorio de su shard dueño y devuelve el id del producto."""
+        with self.router.sesion(dueño) as db:
+            try:
+                id_producto = self._anotar_en_directorio(db, codigo_producto, shard, id_producto)
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                raise ValueError(f"El código de producto {codigo_producto} ya existe")
+        return id_producto
+
+    def _liberar(self, dueño: int, producto_id: int) -> None:
+        with self.router.sesion(dueño) as db:
+            db.execute(delete(models.DirectorioProductos).where(models.DirectorioProductos.id_producto == producto_id))
+            db.commit()
+
+    def _actualizar_directorio(self, dueño: int, producto_id: int, **valores) -> None:
+        with self.router.sesion(dueño) as db:
+            try:
+                db.execute(
+                    update(models.DirectorioProductos)
+                    .where(models.DirectorioProductos.id_producto == producto_id)
+                    .values(**valores)
+                )
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                raise ValueError(f"El código de producto {valores.get('codigo_producto')} ya existe")
+
+    def _mover(self, producto_id: int, dueño: int, origen: int, destino: int, update_data: dict) -> tuple:
+        """El distribuidor cambió a otro shard: la fila se copia al destino (con su cambio en el log),
+        el directorio pasa a apuntar allí y recién entonces se borra del origen.
+
+        La entrada del directorio (en el shard `dueño`) manda: lo anota en
+        shard_pendiente antes de cada paso, así un movimiento interrumpido deja
+        a lo sumo una copia que no vale, que se borra aquí mismo si se puede o
+        si no con reparar_movimientos. Devuelve (None, None) si la fila ya no
+        existe en el origen.
+        """
+        with self.router.sesion(origen) as db_origen:
+            fila = db_origen.get(models.Productos, producto_id)
+            if fila is None:
+                return None, None
+            valores = {columna: getattr(fila, columna) for columna in COLUMNAS_ESCRIBIBLES}
+        valores.update(update_data)
+
+        self._actualizar_directorio(dueño, producto_id, shard_pendiente=destino, movido=datetime.now())
+        try:
+            with self.router.sesion(destino) as db_destino:
+                # Una copia que haya quedado de un movimiento anterior no vale: el directorio apunta al origen
+                db_destino.execute(delete(models.Productos).where(models.Productos.id_producto == producto_id))
+                db_producto = db_destino.scalars(
+                    insert(models.Productos).values(**valores).returning(models.Productos)
+                ).one()
+                HistoryService(db_destino).registrar_producto(producto_id, forzar_base=True)
+                cambio = ChangeService(db_destino).registrar("producto", producto_id, "update")
+                db_destino.commit()
+                self._cargar_relaciones(db_producto)
+            self._actualizar_directorio(dueño, producto_id, shard=destino, shard_pendiente=origen, movido=datetime.now())
+        except Exception:
+            self._descartar_copia(dueño, producto_id, destino)
+            raise
+        self._descartar_copia(dueño, producto_id, origen)
+        return db_producto, cambio
+
+    def _descartar_copia(self, dueño: int, producto_id: int, shard: int) -> None:
+        """Borra la copia de `shard` que quedó de un cambio de shard y lo da por terminado
+        (idempotente). Si falla queda anotada para reparar_movimientos."""
+        try:
+            with self.router.sesion(dueño) as db:
+                entrada = db.get(models.DirectorioProductos, producto_id)
+            if entrada is not None and entrada.shard == shard:
+                return  # el directorio ya apunta a esa fila: es la vigente
+            self._borrar_fila(shard, producto_id)
+            with self.router.sesion(dueño) as db:
+                db.execute(
+                    update(models.DirectorioProductos)
+                    .where(models.DirectorioProductos.id_producto == producto_id,
+                           models.DirectorioProductos.shard_pendiente == shard)
+                    .values(shard_pendiente=None, movido=None)
+                )
+                db.commit()
+        except Exception:
+            logger.exception("No se pudo borrar la copia del producto %s en el shard %s; se reintenta luego", producto_id, shard)
+
+    def _borrar_fila(self, shard: int, producto_id: int) -> None:
+        with self.router.sesion(shard) as db:
+            db.execute(delete(models.Productos).where(models.Productos.id_producto == producto_id))
+            db.commit()
+
+    def reparar_movimientos(self) -> int:
+        """Termina los cambios de shard que un proceso dejó a medias hace más de SHARD_HUERFANOS_SEGUNDOS."""
+        limite = datetime.now() - timedelta(seconds=settings.SHARD_HUERFANOS_SEGUNDOS)
+        partes = self.router.en_todos(lambda db, shard: [
+            (shard, entrada.id_producto, entrada.shard_pendiente)
+            for entrada in db.query(models.DirectorioProductos).filter(
+                models.DirectorioProductos.shard_pendiente.is_not(None), models.DirectorioProductos.movido < limite
+            )
+        ])
+        pendientes = [pendiente for parte in partes for pendiente in parte]
+        for dueño, producto_id, shard in pendientes:
+            self._descartar_copia(dueño, producto_id, shard)
+        if pendientes:
+            logger.warning("Terminados %s cambios de shard interrumpidos", len(pendientes))
+        return len(pendientes)
+
+    @staticmethod
+    def _cargar_relaciones(db_producto: models.Productos) -> None:
+        # Se cargan antes de cerrar la sesión del shard para poder serializar la respuesta
+        db_producto.categoria
+        db_producto.distribuidor
+
+
+# ==============================
+# RELAY DEL LOG DE CAMBIOS
+# ==============================
+class RelayCambios:
+    """Lleva los cambios de productos del log de cada shard al log global y los publica.
+
+    Corre en un hilo propio. Cada escritura confirma solo en su shard y avisa
+    al relay, que mueve todo lo acumulado en una sola transacción de la base
+    global, publica los eventos con su seq global a los suscriptores en vivo
+    (los oyentes ya los recibieron en `enviar`) y luego los borra de los
+    shards. Lo que quede en un shard porque el proceso se detuvo antes lo
+    reenvía cualquier proceso pasado SHARD_HUERFANOS_SEGUNDOS; un cambio
+    repetido en el log no altera el estado que se reconstruye con él.
+
+    En el mismo ciclo periódico termina los cambios de shard interrumpidos y
+    replica en los shards las categorías y distribuidores escritos por otros
+    procesos (el oyente del broker solo ve los de este).
+    """
+
+    def __init__(self, router: sharding.ShardRouter, cursor_replicas: int):
+        self.router = router
+        self._pendientes: List[tuple] = []  # (shard, cambio, evento a publicar o None)
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._activo = True
+        self._cursores = {entidad: cursor_replicas for entidad in sharding.MODELOS_REPLICADOS}
+        self._hilo = threading.Thread(target=self._ejecutar, name="relay-cambios", daemon=True)
+
+    def iniciar(self) -> None:
+        self._hilo.start()
+
+    def detener(self) -> None:
+        """Mueve lo pendiente y termina el hilo."""
+        self._activo = False
+        self._despertar.set()
+        self._hilo.join()
+
+    def enviar(self, shard: int, cambio: dict, db_obj=None) -> None:
+        """Encola un cambio ya confirmado en `shard`; se publica al llegar al log global."""
+        evento = None
+        if broker.tiene_interesados():
+            # Se serializa ahora: la fila del shard ya no se vuelve a leer. Los oyentes de este
+            # proceso (snapshot) lo aplican sin esperar al relay, así quien escribió lee su cambio.
+            evento = dict(cambio, seq=None)
+            evento["datos"] = None if cambio["operacion"] == "delete" else serializar_entidad(cambio["entidad"], db_obj)
+            broker.avisar_oyentes(evento)
+        broker.marcar_escritura()
+        with self._lock:
+            self._pendientes.append((shard, cambio, evento))
+        self._despertar.set()
+
+    def _ejecutar(self) -> None:
+        proximo_ciclo = 0.0
+        while self._activo:
+            self._despertar.wait(timeout=settings.SHARD_SYNC_SEGUNDOS)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+                if time.monotonic() >= proximo_ciclo:
+                    self.reenviar_huerfanos()
+                    self.reparar_movimientos()
+                    self.sincronizar_replicas()
+                    proximo_ciclo = time.monotonic() + settings.SHARD_SYNC_SEGUNDOS
+            except Exception:
+                logger.exception("Falló el relay de cambios de los shards; se reintenta")
+                time.sleep(0.1)
+        self.vaciar()
+
+    def vaciar(self) -> int:
+        """Mueve al log global los cambios encolados en este proceso (group commit) y los publica."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, []
+        if not pendientes:
+            return 0
+        try:
+            seqs = self._al_log_global([
+                dict(cambio, fecha=datetime.fromisoformat(cambio["fecha"])) for _, cambio, _ in pendientes
+            ])
+        except Exception:
+            with self._lock:
+                self._pendientes[:0] = pendientes
+            raise
+        for (_, _, evento), seq in zip(pendientes, seqs):
+            broker.avanzar(seq)
+            if evento is not None:
+                broker.publicar(dict(evento, seq=seq), oyentes=False)
+        self._borrar_de_shards([(shard, cambio["seq"]) for shard, cambio, _ in pendientes])
+        return len(pendientes)
+
+    def reenviar_huerfanos(self) -> int:
+        limite = datetime.now() - timedelta(seconds=settings.SHARD_HUERFANOS_SEGUNDOS)
+        with self._lock:
+            encolados = {(shard, cambio["seq"]) for shard, cambio, _ in self._pendientes}
+        partes = self.router.en_todos(lambda db, shard: [
+            (shard, fila) for fila in db.query(models.CambiosCatalogo)
+            .filter(models.CambiosCatalogo.fecha < limite)
+            .order_by(models.CambiosCatalogo.seq)
+            .limit(settings.CHANGE_LOG_PAGINA)
+            if (shard, fila.seq) not in encolados
+        ])
+        huerfanos = [huerfano for parte in partes for huerfano in parte]
+        if not huerfanos:
+            return 0
+        # Sin los datos de la fila no se publican: el snapshot y los suscriptores los leen del log global
+        for seq in self._al_log_global([
+            {"entidad": fila.entidad, "id_entidad": fila.id_entidad, "operacion": fila.operacion, "fecha": fila.fecha}
+            for _, fila in huerfanos
+        ]):
+            broker.avanzar(seq)
+        self._borrar_de_shards([(shard, fila.seq) for shard, fila in huerfanos])
+        logger.warning("Reenviados %s cambios que quedaron en el log de los shards", len(huerfanos))
+        return len(huerfanos)
+
+    def reparar_movimientos(self) -> int:
+        db = SessionLocal()
+        try:
+            return ShardedProductService(db).reparar_movimientos()
+        finally:
+            db.close()
+
+    def sincronizar_replicas(self) -> None:
+        db = SessionLocal()
+        try:
+            servicio = ChangeService(db)
+            for entidad in self._cursores:
+                while eventos := servicio.get_since(self._cursores[entidad], settings.CHANGE_LOG_PAGINA, entidad):
+                    for evento in eventos:
+                        self.router.replicar_evento(evento)
+                    self._cursores[entidad] = max(evento["seq"] for evento in eventos)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _al_log_global(cambios: List[dict]) -> List[int]:
+        db = SessionLocal()
+        try:
+            seqs = db.scalars(
+                insert(models.CambiosCatalogo).returning(models.CambiosCatalogo.seq, sort_by_parameter_order=True),
+                [{campo: cambio[campo] for campo in ("entidad", "id_entidad", "operacion", "fecha")} for cambio in cambios],
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+        return seqs
+
+    def _borrar_de_shards(self, entradas: List[tuple]) -> None:
+        por_shard: Dict[int, List[int]] = {}
+        for shard, seq in entradas:
+            por_shard.setdefault(shard, []).append(seq)
+
+        def borrar(db: Session, shard: int) -> None:
+            db.execute(delete(models.CambiosCatalogo).where(models.CambiosCatalogo.seq.in_(por_shard[shard])))
+            db.commit()
+
+        self.router.en_paralelo(list(por_shard), borrar)
+
+
+relay: Optional[RelayCambios] = None
+
+
+def product_service_para(db: Session):
+    """ProductService o su variante particionada según la configuración."""
+    return ShardedProductService(db) if sharding.router else ProductService(db)
+
+
+def activar_sharding(db_global: Session) -> None:
+    """Crea los shards, replica Categorias y Distribuidores, prepara los generadores de ids y arranca el relay."""
+    router = sharding.crear_router()
+    _migrar_productos(router, db_global)
+    router.sembrar_secuencias(router.maximo_id())
+    cursor = ChangeService(db_global).ultimo_seq()
+    router.replicar_catalogo(db_global)
+    broker.agregar_oyente(router.replicar_evento)
+    change_service.cargador_productos = lambda db, ids: ShardedProductService(db).get_many(ids)
+    _iniciar_relay(router, cursor)
+
+
+def conectar_sharding() -> None:
+    """Para los procesos de trabajos: conecta los shards ya creados y arranca el relay de sus escrituras."""
+    router = sharding.crear_router()
+    db = SessionLocal()
+    try:
+        cursor = ChangeService(db).ultimo_seq()
+    finally:
+        db.close()
+    _iniciar_relay(router, cursor)
+
+
+def detener_sharding() -> None:
+    """Detiene el relay (moviendo lo pendiente) y desconecta los shards."""
+    global relay
+    if relay:
+        relay.detener()
+        relay = None
+    if sharding.router:
+        broker.quitar_oyente(sharding.router.replicar_evento)
+        change_service.cargador_productos = None
+        for engine in sharding.router.engines:
+            engine.dispose()
+        sharding.router = None
+
+
+def _iniciar_relay(router: sharding.ShardRouter, cursor_replicas: int) -> None:
+    global relay
+    relay = RelayCambios(router, cursor_replicas)
+    relay.iniciar()
+
+
+
+def _migrar_productos(router: sharding.ShardRouter, db_global: Session) -> int:
+    """Productos que quedaron en la base global (escritos sin particionar) pasan a su shard.
+
+    Cada fila conserva su id y se copia con su entrada del directorio y su
+    historial; recién confirmada la copia se borra de la base global. Si el
+    proceso se detiene a mitad, el próximo arranque repite el lote: las filas
+    ya copiadas se ignoran.
+    """
+    historial = [
+        (nombre, tabla_mes(datetime.strptime(nombre.rsplit("_", 1)[1], "%Y%m")))
+        for (nombre,) in db_global.connection().exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'HistorialProductos\\_%' ESCAPE '\\'"
+        )
+    ]
+    migrados = 0
+    while filas := db_global.query(models.Productos).order_by(models.Productos.id_producto).limit(LOTE_MIGRACION).all():
+        ids = [fila.id_producto for fila in filas]
+        productos: Dict[int, List[dict]] = {}
+        directorio: Dict[int, List[dict]] = {}
+        for fila in filas:
+            shard = router.shard_para(fila.id_distribuidor)
+            productos.setdefault(shard, []).append({columna: getattr(fila, columna) for columna in COLUMNAS_ESCRIBIBLES})
+            directorio.setdefault(router.dueño_de_codigo(fila.codigo_producto), []).append(
+                {"id_producto": fila.id_producto, "codigo_producto": fila.codigo_producto, "shard": shard}
+            )
+        shard_de = {valores["id_producto"]: shard for shard, lote in productos.items() for valores in lote}
+        puntos: Dict[int, Dict[str, List[dict]]] = {}
+        for nombre, tabla in historial:
+            for punto in db_global.execute(select(tabla).where(tabla.c.id_producto.in_(ids))).mappings():
+                puntos.setdefault(shard_de[punto["id_producto"]], {}).setdefault(nombre, []).append(dict(punto))
+
+        def copiar(db: Session, shard: int) -> None:
+            entradas = directorio.get(shard, [])
+            if entradas:
+                # Un código ya usado por otro producto de los shards no se puede migrar sin perder una de las filas
+                ocupados = db.execute(select(models.DirectorioProductos.codigo_producto).where(
+                    models.DirectorioProductos.codigo_producto.in_([e["codigo_producto"] for e in entradas]),
+                    models.DirectorioProductos.id_producto.not_in([e["id_producto"] for e in entradas]),
+                )).scalars().all()
+                if ocupados:
+                    raise RuntimeError(
+                        f"No se pueden migrar a los shards los productos con códigos ya usados allí: {', '.join(ocupados)}"
+                    )
+                db.execute(insert_sqlite(models.DirectorioProductos).on_conflict_do_nothing(), entradas)
+            if productos.get(shard):
+                db.execute(insert_sqlite(models.Productos).on_conflict_do_nothing(), productos[shard])
+            for nombre, filas_historial in puntos.get(shard, {}).items():
+                tabla = dict(historial)[nombre]
+                tabla.create(db.connection(), checkfirst=True)
+                db.execute(insert_sqlite(tabla).on_conflict_do_nothing(), filas_historial)
+            db.commit()
+
+        router.en_todos(copiar)
+        for _, tabla in historial:
+            db_global.execute(delete(tabla).where(tabla.c.id_producto.in_(ids)))
+        db_global.execute(delete(models.Productos).where(models.Productos.id_producto.in_(ids)))
+        db_global.commit()
+        migrados += len(ids)
+    if migrados:
+        logger.warning("Migrados %s productos de la base global a los shards", migrados)
+    return migrados
@@ -0,0 +1,111 @@
+import asyncio
+from functools import lru_cache
+from typing import Callable, Dict, Hashable, TypeVar
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from admission import ceder_cupo
+from config import settings
+from database import SessionLocal
+from service.catalog_snapshot import get_catalog_snapshot
+from service.change_service import ChangeService, broker
+
+T = TypeVar("T")
+
+
+# ==============================
+# LECTURAS COMPARTIDAS (SINGLE-FLIGHT)
+# ==============================
+class SingleFlight:
+    """Una sola ejecución por clave para las llamadas concurrentes.
+
+    La primera llamada lanza el cálculo en un hilo; las que llegan con la misma
+    clave mientras sigue en curso esperan ese mismo resultado (o la misma
+    excepción). No es una cache: al terminar se descarta y la siguiente
+    llamada vuelve a calcular.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[Hashable, asyncio.Future] = {}
+        self.calculos = 0
+        self.compartidas = 0
+
+    async def hacer(self, clave: Hashable, calcular: Callable[[], T]) -> T:
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(asyncio.to_thread(calcular))
+            self._en_vuelo[clave] = tarea
+            tarea.add_done_callback(lambda t: self._terminado(clave, t))
+            self.calculos += 1
+        else:
+            self.compartidas += 1
+            ceder_cupo()
+        # shield: si el cliente que lo lanzó se desconecta, el cálculo sigue para los demás
+        return await asyncio.shield(tarea)
+
+    def _terminado(self, clave: Hashable, tarea: asyncio.Future) -> None:
+        if self._en_vuelo.get(clave) is tarea:
+            del self._en_vuelo[clave]
+        if not tarea.cancelled():
+            tarea.exception()  # evita el aviso de excepción no leída si ya nadie la espera
+
+    def estadisticas(self) -> dict:
+        return {"en_vuelo": len(self._en_vuelo), "calculos": self.calculos, "compartidas": self.compartidas}
+
+
+lecturas = SingleFlight()
+
+
+def _con_sesion(calcular: Callable[[Session], T]) -> Callable[[], T]:
+    # Sesión propia del cálculo compartido: no pertenece a ninguna de las solicitudes que lo esperan
+    def ejecutar() -> T:
+        db = SessionLocal()
+        try:
+            return calcular(db)
+        finally:
+            db.close()
+    return ejecutar
+
+
+def version_catalogo() -> int:
+    """Versión del catálogo sin consultar la base en cada request.
+
+    Con el snapshot en memoria es su contador de cambios aplicados. Si no, es la
+    versión del broker, que cambia con cada seq nuevo que conoce este proceso:
+    las escrituras propias la avanzan al publicarse (quien acaba de escribir
+    nunca se une a un cálculo anterior) y refrescar_version() relee el log
+    periódicamente para las de otros procesos.
+    """
+    snapshot = get_catalog_snapshot()
+    if snapshot:
+        return snapshot.version
+    if broker.ultimo_seq is None:
+        refrescar_version()
+    return broker.version
+
+
+def refrescar_version() -> None:
+    _con_sesion(lambda db: broker.avanzar(ChangeService(db).ultimo_seq()))()
+
+
+async def compartir(ruta: str, parametros: dict, calcular: Callable[[Session], T]) -> T:
+    """Ejecuta calcular(db) una vez por grupo de solicitudes concurrentes idénticas.
+
+    La clave es la ruta normalizada, los parámetros ya validados (en cualquier
+    orden) y la versión del catálogo, así una solicitud posterior a una
+    escritura nunca se une a un cálculo con datos anteriores.
+    """
+    if not settings.COALESCER_LECTURAS:
+        return await asyncio.to_thread(_con_sesion(calcular))
+    clave = (ruta, tuple(sorted(parametros.items())), version_catalogo())
+    return await lecturas.hacer(clave, _con_sesion(calcular))
+
+
+@lru_cache(maxsize=None)
+def _adaptador(tipo) -> TypeAdapter:
+    return TypeAdapter(tipo)
+
+
+def codificar(tipo, valor) -> bytes:
+    """JSON de `valor` según `tipo` (el response_model de la ruta); el cálculo compartido devuelve los bytes ya codificados."""
+    adaptador = _adaptador(tipo)
+    return adaptador.dump_json(adaptador.validate_python(valor, from_attributes=True))
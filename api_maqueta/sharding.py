@@ -0,0 +1,166 @@
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, List, Optional, TypeVar
+from sqlalchemy import create_engine, delete, event, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+from sqlalchemy.orm import Session, sessionmaker
+from config import settings
+import models
+
+T = TypeVar("T")
+
+# Tablas de la base global presentes en cada shard: Productos particionada, Categorias y
+# Distribuidores replicadas y la parte local del log de cambios. Cada shard tiene además las
+# de BaseShards (directorio de productos y generador de ids).
+TABLAS_SHARD = [
+    models.Categorias.__table__, models.Distribuidores.__table__, models.Productos.__table__,
+    models.CambiosCatalogo.__table__,
+]
+MODELOS_REPLICADOS = {"categoria": models.Categorias, "distribuidor": models.Distribuidores}
+
+
+def _pragmas_wal(dbapi_connection, connection_record):
+    # WAL permite lecturas concurrentes con la escritura y evita un fsync por commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+class ShardRouter:
+    """Conjunto de bases SQLite que particionan Productos por id_distribuidor."""
+
+    def __init__(self, n_shards: int, url_template: str):
+        self.n_shards = n_shards
+        self.engines = []
+        self._sesiones = []
+        for n in range(n_shards):
+            engine = create_engine(url_template.format(n=n), connect_args={"check_same_thread": False})
+            event.listen(engine, "connect", _pragmas_wal)
+            self.engines.append(engine)
+            self._sesiones.append(sessionmaker(bind=engine, autoflush=False, expire_on_commit=False))
+        self._executor = ThreadPoolExecutor(max_workers=n_shards, thread_name_prefix="shard")
+
+    def crear_tablas(self) -> None:
+        for engine in self.engines:
+            models.Base.metadata.create_all(bind=engine, tables=TABLAS_SHARD)
+            models.BaseShards.metadata.create_all(bind=engine)
+
+    def shard_para(self, id_distribuidor: Optional[int]) -> int:
+        return (id_distribuidor or 0) % self.n_shards
+
+    def dueño_de_codigo(self, codigo_producto: str) -> int:
+        """Shard que guarda la entrada del directorio de un código (crc32: estable entre procesos, a diferencia de hash())."""
+        return zlib.crc32(codigo_producto.encode()) % self.n_shards
+
+    @contextmanager
+    def sesion(self, shard: int):
+        db = self._sesiones[shard]()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def en_paralelo(self, shards: List[int], fn: Callable[[Session, int], T]) -> List[T]:
+        """Ejecuta fn(sesion, shard) en los shards indicados en paralelo; resultados en el mismo orden."""
+        def ejecutar(shard: int) -> T:
+            with self.sesion(shard) as db:
+                return fn(db, shard)
+        if len(shards) == 1:
+            return [ejecutar(shards[0])]
+        return list(self._executor.map(ejecutar, shards))
+
+    def en_todos(self, fn: Callable[[Session, int], T]) -> List[T]:
+        return self.en_paralelo(list(range(self.n_shards)), fn)
+
+    # ------------------------------
+    # Ids de producto
+    # ------------------------------
+    def sembrar_secuencias(self, minimo: int) -> None:
+        """Deja el generador de cada shard por encima de `minimo` si falta o se sembró con otro número de shards.
+
+        El shard n entrega n + k·N (k creciente): sin coordinación entre shards
+        ni con la base global, dos shards nunca asignan el mismo id.
+        """
+        base = (minimo // self.n_shards + 1) * self.n_shards
+
+        def sembrar(db: Session, shard: int) -> None:
+            valores = {"ultimo_id": base + shard - self.n_shards, "paso": self.n_shards}
+            db.execute(insert_sqlite(models.SecuenciaProductos).values(id=1, **valores).on_conflict_do_nothing())
+            db.execute(
+                update(models.SecuenciaProductos)
+                .where(models.SecuenciaProductos.paso != self.n_shards)
+                .values(**valores)
+            )
+            db.commit()
+
+        self.en_todos(sembrar)
+
+    def maximo_id(self) -> int:
+        """Mayor id_producto usado en los shards (filas y directorio)."""
+        def maximo(db: Session, shard: int) -> int:
+            return max(
+                db.scalar(select(func.max(models.Productos.id_producto))) or 0,
+                db.scalar(select(func.max(models.DirectorioProductos.id_producto))) or 0,
+            )
+        return max(self.en_todos(maximo))
+
+    @staticmethod
+    def nuevo_id(db: Session) -> int:
+        """Siguiente id del shard de `db`, dentro de la transacción en curso (sin commit)."""
+        return db.scalar(
+            update(models.SecuenciaProductos)
+            .values(ultimo_id=models.SecuenciaProductos.ultimo_id + models.SecuenciaProductos.paso)
+            .returning(models.SecuenciaProductos.ultimo_id)
+            .execution_options(synchronize_session=False)
+        )
+
+    # ------------------------------
+    # Réplicas de Categorias y Distribuidores
+    # ------------------------------
+    def replicar_catalogo(self, db_global: Session) -> None:
+        """Copia completa de las tablas replicadas desde la base global a cada shard."""
+        filas = {
+            modelo: [
+                {c.key: getattr(fila, c.key) for c in modelo.__table__.columns}
+                for fila in db_global.query(modelo)
+            ]
+            for modelo in MODELOS_REPLICADOS.values()
+        }
+
+        def copiar(db: Session, shard: int) -> None:
+            for modelo, valores in filas.items():
+                db.execute(delete(modelo))
+                if valores:
+                    db.execute(insert(modelo), valores)
+            db.commit()
+
+        self.en_todos(copiar)
+
+    def replicar_evento(self, evento: dict) -> None:
+        """Oyente del log de cambios: aplica en cada shard las escrituras de categorías y distribuidores."""
+        modelo = MODELOS_REPLICADOS.get(evento["entidad"])
+        if modelo is None:
+            return
+        datos = evento.get("datos")
+        columnas = {c.key for c in modelo.__table__.columns}
+
+        def aplicar(db: Session, shard: int) -> None:
+            if datos is None:
+                db.execute(delete(modelo).where(modelo.__table__.primary_key.columns[0] == evento["id_entidad"]))
+            else:
+                db.merge(modelo(**{k: v for k, v in datos.items() if k in columnas}))
+            db.commit()
+
+        self.en_todos(aplicar)
+
+
+router: Optional[ShardRouter] = None
+
+
+def crear_router() -> ShardRouter:
+    global router
+    router = ShardRouter(settings.SHARDS, settings.SHARD_URL_TEMPLATE)
+    router.crear_tablas()
+    return router
@@ -0,0 +1,107 @@
+"""Prueba de sobrecarga del control de admisión con la configuración por defecto.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+Requiere httpx y pytest.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pytest
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import httpx
+
+import main
+from admission import clasificar_graphql
+from benchmarks.comun import poblar
+from database import SessionLocal
+
+N_PRODUCTOS = 5_000
+
+
+@pytest.fixture(scope="module", autouse=True)
+def catalogo():
+    db = SessionLocal()
+    poblar(db, N_PRODUCTOS)
+    db.close()
+
+
+def cliente() -> httpx.AsyncClient:
+    transporte = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transporte, base_url="http://test", timeout=60)
+
+
+def p99(latencias) -> float:
+    latencias = sorted(latencias)
+    return latencias[int(len(latencias) * 0.99) - 1]
+
+
+@pytest.mark.parametrize("consulta, variables, esperado", [
+    ("{ product(id: 1) { nombreProducto } }", None, ("critica", True)),
+    ("mutation { createCategoria(categoria: {nombreCategoria: \"x\"}) { idCategoria } }", None, ("normal", False)),
+    ("{ products { idProducto } }", None, ("normal", True)),
+    ("{ products(limit: 1000) { idProducto } }", None, ("pesada", True)),
+    ("query Q($l: Int!) { products(limit: $l) { idProducto } }", {"l": 5000}, ("pesada", True)),
+    ("{ productsByIds(ids: [1, 2]) { idProducto } }", None, ("normal", False)),
+    ("{ __schema { types { name } } }", None, ("pesada", False)),
+    ("no es graphql", None, ("pesada", False)),
+])
+def test_clasificar_graphql(consulta, variables, esperado):
+    assert clasificar_graphql(json.dumps({"query": consulta, "variables": variables}).encode()) == esperado
+
+
+def test_lecturas_baratas_estables_bajo_sobrecarga():
+    async def escenario():
+        async with cliente() as c:
+            async def barato():
+                inicio = time.perf_counter()
+                r = await c.get(f"/productos/{random.randint(1, N_PRODUCTOS)}")
+                return r.status_code, time.perf_counter() - inicio
+
+            base = [await barato() for _ in range(100)]  # calentamiento, sin carga
+
+            async def pesado():
+                r = await c.get("/productos/", params={"limit": 1000, "skip": random.randint(0, 4000)})
+                return r.status_code, r.headers.get("retry-after")
+
+            pesados = [asyncio.create_task(pesado()) for _ in range(40)]
+            baratos = []
+            for _ in range(200):
+                baratos.append(asyncio.create_task(barato()))
+                await asyncio.sleep(0.005)
+            return base, await asyncio.gather(*baratos), await asyncio.gather(*pesados)
+
+    base, baratos, pesados = asyncio.run(escenario())
+    assert all(estado == 200 for estado, _ in base)
+    assert all(estado == 200 for estado, _ in baratos)
+    # Sin admisión los get-by-id esperan detrás de los listados hasta el DB_POOL_TIMEOUT
+    assert p99([t for _, t in baratos]) < 0.25
+    assert {estado for estado, _ in pesados} <= {200, 503}
+    assert any(estado == 503 for estado, _ in pesados)
+    assert all(retry_after for estado, retry_after in pesados if estado == 503)
+
+
+@pytest.mark.parametrize("cantidad, metodo, url, opciones", [
+    (300, "GET", "/productos/", {"params": {"categoria_id": 3}}),
+    (300, "POST", "/graphql", {"json": {"query": "{ products { idProducto precioVenta } }"}}),
+    (12, "POST", "/graphql", {"json": {"query": "{ product(id: 1) { idProducto } }"}}),
+])
+def test_rafaga_identica_no_se_rechaza(cantidad, metodo, url, opciones):
+    # Las solicitudes idénticas se unen al mismo cálculo y no ocupan cupo propio
+    async def rafaga():
+        async with cliente() as c:
+            return await asyncio.gather(*(c.request(metodo, url, **opciones) for _ in range(cantidad)))
+
+    respuestas = asyncio.run(rafaga())
+    assert [r.status_code for r in respuestas] == [200] * cantidad
+    assert len({r.content for r in respuestas}) == 1
@@ -0,0 +1,85 @@
+"""Autenticación de las escrituras: tokens falsificados, expirados, sin scope y cache.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import httpx
+from jose import jwt
+
+import main
+from auth import crear_token, token_cache, verificar_token
+from config import Settings, settings
+
+SECRETO = "secreto-de-las-pruebas"
+
+
+@pytest.fixture(autouse=True)
+def secreto(monkeypatch):
+    monkeypatch.setattr(settings, "JWT_SECRET", SECRETO)
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+
+def firmar(secreto: str, exp: float, scope: str = settings.JWT_SCOPE_ESCRITURA) -> str:
+    return jwt.encode({"sub": "terminal", "scope": scope, "exp": int(exp)}, secreto, algorithm=settings.JWT_ALGORITHM)
+
+
+def borrar(token: str) -> httpx.Response:
+    async def pedir():
+        transporte = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as c:
+            return await c.delete("/productos/999999", headers={"Authorization": f"Bearer {token}"})
+
+    return asyncio.run(pedir())
+
+
+def test_settings_lee_jwt_secret_del_entorno(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET", "desde-el-entorno")
+    assert Settings().JWT_SECRET == "desde-el-entorno"
+
+
+def test_token_valido():
+    assert borrar(crear_token("terminal", [settings.JWT_SCOPE_ESCRITURA])).status_code == 404
+
+
+def test_token_falsificado_con_el_secreto_por_defecto():
+    assert borrar(firmar("secreto123", time.time() + 600)).status_code == 401
+
+
+@pytest.mark.parametrize("secreto_servidor", ["", "secreto123"])
+def test_sin_secreto_propio_se_rechazan_las_escrituras(monkeypatch, secreto_servidor):
+    monkeypatch.setattr(settings, "JWT_SECRET", secreto_servidor)
+    assert borrar(firmar("secreto123", time.time() + 600)).status_code == 503
+
+
+def test_token_expirado():
+    assert borrar(firmar(SECRETO, time.time() - 10)).status_code == 401
+
+
+def test_token_sin_scope_de_escritura():
+    assert borrar(firmar(SECRETO, time.time() + 600, scope="catalogo:read")).status_code == 403
+
+
+def test_cache_no_acepta_el_token_despues_de_exp():
+    exp = int(time.time()) + 2
+    token = firmar(SECRETO, exp)
+    verificar_token(token, [settings.JWT_SCOPE_ESCRITURA])
+    assert token_cache.get(token) is not None
+    time.sleep(exp - time.time() + 1.1)
+    with pytest.raises(ValueError):
+        verificar_token(token, [settings.JWT_SCOPE_ESCRITURA])
+    assert borrar(token).status_code == 401
@@ -0,0 +1,102 @@
+"""Entrega en vivo de los cambios del catálogo escritos por otros procesos.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+import models
+import schemas
+from config import settings
+from database import SessionLocal
+from service.category_service import CategoryService
+from service.change_service import ChangeService, escuchar_cambios
+
+
+def escribir(nombre: str, publicar: bool) -> int:
+    """Alta de una categoría; sin `publicar` queda solo en la base, como la escritura de otro worker o de un trabajo."""
+    db = SessionLocal()
+    try:
+        if publicar:
+            CategoryService(db).create(schemas.CategoriaCreate(nombre_categoria=nombre))
+            return ChangeService(db).ultimo_seq()
+        categoria = models.Categorias(nombre_categoria=nombre)
+        db.add(categoria)
+        db.flush()
+        cambio = ChangeService(db).registrar("categoria", categoria.id_categoria, "create")
+        db.commit()
+        return cambio["seq"]
+    finally:
+        db.close()
+
+
+def test_suscriptor_recibe_escrituras_de_otros_procesos(monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_LOG_SONDEO_SEGUNDOS", 0.5)
+
+    async def escenario():
+        recibidos = []
+        eventos = escuchar_cambios()
+
+        async def leer():
+            async for evento in eventos:
+                if evento is not None:
+                    recibidos.append(evento)
+                if len(recibidos) == 2:
+                    return
+
+        lector = asyncio.create_task(leer())
+        await asyncio.sleep(0.1)
+        # Otro proceso confirma un seq menor que el que este proceso publica justo después
+        seq_otro = await asyncio.to_thread(escribir, "Otro proceso", False)
+        seq_propio = await asyncio.to_thread(escribir, "Este proceso", True)
+        await asyncio.wait_for(lector, timeout=5)
+        await eventos.aclose()
+        return recibidos, seq_otro, seq_propio
+
+    recibidos, seq_otro, seq_propio = asyncio.run(escenario())
+    assert [e["seq"] for e in recibidos] == [seq_propio, seq_otro]
+    assert [e["datos"]["nombre_categoria"] for e in recibidos] == ["Este proceso", "Otro proceso"]
+
+
+def test_un_solo_sondeo_para_todos_los_suscriptores(monkeypatch):
+    monkeypatch.setattr(settings, "CHANGE_LOG_SONDEO_SEGUNDOS", 0.2)
+    consultas = []
+    get_since = ChangeService.get_since
+
+    def contar(self, *args, **kwargs):
+        consultas.append(1)
+        return get_since(self, *args, **kwargs)
+
+    monkeypatch.setattr(ChangeService, "get_since", contar)
+
+    async def escenario():
+        recibidos = [[] for _ in range(5)]
+        suscriptores = [escuchar_cambios() for _ in recibidos]
+
+        async def leer(eventos, lista):
+            async for evento in eventos:
+                if evento is not None:
+                    lista.append(evento)
+
+        lectores = [asyncio.create_task(leer(e, lista)) for e, lista in zip(suscriptores, recibidos)]
+        await asyncio.sleep(0.1)
+        seq = await asyncio.to_thread(escribir, "Sondeo compartido", False)
+        await asyncio.sleep(1.2)
+        for lector in lectores:
+            lector.cancel()
+        await asyncio.gather(*lectores, return_exceptions=True)
+        return seq, recibidos
+
+    seq, recibidos = asyncio.run(escenario())
+    assert [[e["seq"] for e in lista] for lista in recibidos] == [[seq]] * 5
+    # Unos 6 sondeos en el tiempo del escenario (uno más cuando trae cambios), no uno por suscriptor
+    assert len(consultas) <= 10
@@ -0,0 +1,62 @@
+"""Lecturas del snapshot del catálogo concurrentes con la aplicación de eventos.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+from service.catalog_snapshot import CatalogSnapshot
+
+N = 200
+
+
+def evento(seq: int, id_producto: int, stock: int) -> dict:
+    return {"seq": seq, "entidad": "producto", "id_entidad": id_producto, "datos": {
+        "id_producto": id_producto, "codigo_producto": f"SNAP-{id_producto}", "nombre_producto": "Filtro",
+        "id_categoria": 1 + id_producto % 3, "marca": "Marca", "descripcion": None,
+        "precio_compra": "1000", "margen_ganancia": "30", "precio_neto": "1300", "precio_iva": "247",
+        "precio_venta": "1547", "stock": stock, "id_distribuidor": 1 + id_producto % 2,
+        "fecha_actualizacion": None,
+    }}
+
+
+def test_lecturas_no_ven_productos_a_medio_actualizar():
+    snapshot = CatalogSnapshot()
+    for i in range(1, N + 1):
+        snapshot.aplicar(evento(i, i, 0))
+    fin = time.monotonic() + 1.0
+    errores = []
+
+    def escribir():
+        seq = N
+        while time.monotonic() < fin:
+            for i in range(1, N + 1):
+                seq += 1
+                snapshot.aplicar(evento(seq, i, seq))
+
+    def leer():
+        try:
+            while time.monotonic() < fin:
+                assert len(snapshot.listar(limit=N)) == N
+                assert len(snapshot.listar_desde(0, limit=N, categoria_id=1)) == N // 3
+                assert None not in snapshot.get_productos(range(1, N + 1))
+                assert snapshot.count_all() == N
+        except Exception as e:  # noqa: BLE001  (se informa desde el hilo principal)
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir)] + [threading.Thread(target=leer) for _ in range(3)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
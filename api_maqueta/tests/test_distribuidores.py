@@ -0,0 +1,55 @@
+"""Validación y normalización del RUT de los distribuidores.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+import schemas
+from database import SessionLocal
+from service.distribuidor_service import DistribuidorService, normalizar_rut
+
+
+@pytest.mark.parametrize("rut, canonico", [
+    ("12.345.678-k", "12345678-K"),
+    ("12345678K", "12345678-K"),
+    (" 7.654.321-0 ", "7654321-0"),
+    ("1-9", "1-9"),
+])
+def test_normaliza_ruts_validos(rut, canonico):
+    assert normalizar_rut(rut) == canonico
+
+
+@pytest.mark.parametrize("rut", ["DE-812345678", "n/a", "", "12.34.567-8", "12345678-X", "-K"])
+def test_rechaza_ruts_invalidos(rut):
+    with pytest.raises(ValueError, match="no es válido"):
+        normalizar_rut(rut)
+
+
+def test_alta_y_busqueda_por_rut():
+    db = SessionLocal()
+    try:
+        service = DistribuidorService(db)
+        creado = service.create(schemas.DistribuidorCreate(nombre="Repuestos Sur", rut="11.222.333-k"))
+        assert creado.rut == "11222333-K"
+        assert service.get_by_rut("11222333k").id_distribuidor == creado.id_distribuidor
+        assert service.get_by_rut("n/a") is None
+        for invalido in ("n/a", "DE-812345678"):
+            with pytest.raises(ValueError, match="no es válido"):
+                service.create(schemas.DistribuidorCreate(nombre="Otro", rut=invalido))
+        with pytest.raises(ValueError, match="no es válido"):
+            service.update(creado.id_distribuidor, schemas.DistribuidorUpdate(rut="n/a"))
+        with pytest.raises(ValueError, match="ya existe"):
+            service.create(schemas.DistribuidorCreate(nombre="Otro", rut="11222333-K"))
+    finally:
+        db.close()
@@ -0,0 +1,92 @@
+"""Historial de precios y stock: codificación por deltas y lectura por rango.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+import models
+from benchmarks.comun import poblar
+from database import SessionLocal
+from service.history_service import CAMPOS, HistoryService, muestrear
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    if not db.query(models.Distribuidores).count():  # otros módulos de prueba comparten la base global
+        poblar(db, 0, distribuidores=8)
+    yield db
+    db.close()
+
+
+def con_historial(db, codigo: str, inicial: dict, cambios: list) -> int:
+    """Producto con su fila base en `inicial["fecha"]` y un cambio por cada (fecha, valores), como ProductService."""
+    producto = models.Productos(
+        codigo_producto=codigo, nombre_producto="Filtro", id_categoria=1, marca="Marca", id_distribuidor=1,
+        **{campo: inicial[campo] for campo in CAMPOS},
+    )
+    db.add(producto)
+    db.flush()
+    historial = HistoryService(db)
+    historial.registrar_producto(producto.id_producto, forzar_base=True, ahora=inicial["fecha"])
+    for fecha, valores in cambios:
+        historial.registrar_producto(producto.id_producto, valores, ahora=fecha)
+        db.execute(update(models.Productos).where(models.Productos.id_producto == producto.id_producto).values(**valores))
+    db.commit()
+    return producto.id_producto
+
+
+def test_ida_y_vuelta(db):
+    inicial = {"fecha": datetime(2024, 5, 10, 8), "precio_compra": Decimal("1234.57"),
+               "margen_ganancia": Decimal("33.33"), "stock": 40}
+    cambios = [
+        (datetime(2024, 5, 10, 9), {"precio_compra": Decimal("999.99")}),
+        (datetime(2024, 5, 10, 9), {"stock": 12}),  # mismo milisegundo: se corre 1 ms
+        (datetime(2024, 5, 31, 23, 59, 59), {"margen_ganancia": Decimal("0.01"), "stock": 0}),
+        (datetime(2024, 7, 1), {"precio_compra": Decimal("1500"), "stock": 250}),  # sin cambios en junio
+        (datetime(2024, 7, 2), {"stock": 250}),  # sin cambio real: no agrega fila
+        (datetime(2024, 7, 3), {"margen_ganancia": Decimal("1000")}),
+    ]
+    producto_id = con_historial(db, "HIST-ida-vuelta", inicial, cambios)
+
+    puntos = HistoryService(db).get_history(producto_id, datetime(2024, 5, 1), datetime(2024, 7, 31))
+    assert [tuple(p[campo] for campo in CAMPOS) for p in puntos] == [
+        (Decimal("1234.57"), Decimal("33.33"), 40),
+        (Decimal("999.99"), Decimal("33.33"), 40),
+        (Decimal("999.99"), Decimal("33.33"), 12),
+        (Decimal("999.99"), Decimal("0.01"), 0),
+        (Decimal("1500"), Decimal("0.01"), 250),
+        (Decimal("1500"), Decimal("1000"), 250),
+    ]
+    assert puntos[2]["fecha"] == datetime(2024, 5, 10, 9) + timedelta(milliseconds=1)
+    assert [p["fecha"].month for p in puntos] == [5, 5, 5, 5, 7, 7]
+
+
+def test_rango_sin_cambios_arrastra_el_valor_anterior(db):
+    inicial = {"fecha": datetime(2024, 6, 3), "precio_compra": Decimal(1000), "margen_ganancia": Decimal(30), "stock": 5}
+    producto_id = con_historial(db, "HIST-arrastre", inicial, [(datetime(2024, 7, 15), {"precio_compra": Decimal(1100)})])
+    desde, hasta = datetime(2024, 8, 1), datetime(2024, 9, 30)
+    historial = HistoryService(db)
+
+    assert historial.get_history(producto_id, desde, hasta) == []
+    serie = muestrear(historial.puntos(producto_id, desde, hasta), desde, hasta, 4)
+    assert len(serie) == 4
+    assert {(s["precio_compra"], s["margen_ganancia"], s["stock"], s["cambios"]) for s in serie} == {
+        (Decimal(1100), Decimal(30), 5, 0)
+    }
+    # Antes de cualquier cambio no hay valor conocido
+    assert historial.puntos(producto_id, datetime(2024, 1, 1), datetime(2024, 2, 1)) == []
@@ -0,0 +1,176 @@
+"""Trabajos en segundo plano: reanudación, cancelación y cambio de ejecutor a mitad de un trabajo.
+
+Las tareas corren en este proceso con ejecutar_trabajo (lo mismo que hace cada
+proceso del pool), así se pueden interrumpir en un punto exacto.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from decimal import Decimal
+
+import pytest
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+import models
+import schemas
+from benchmarks.comun import poblar
+from config import settings
+from database import SessionLocal
+from jobs import ejecutar_trabajo
+from service.category_service import CategoryService
+from service.job_service import JobService
+from service.product_service import ProductService
+
+
+@pytest.fixture(scope="module", autouse=True)
+def catalogo():
+    db = SessionLocal()
+    if not db.query(models.Distribuidores).count():  # otros módulos de prueba comparten la base global
+        poblar(db, 0, distribuidores=8)
+    db.close()
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+def tomar(db, tipo: str, parametros: dict, propietario: str) -> int:
+    """Da de alta un trabajo y lo deja en curso a nombre de `propietario`, como JobRunner."""
+    trabajo = JobService(db).create(schemas.TrabajoCreate(tipo=tipo, parametros=parametros))
+    ceder(trabajo.id_trabajo, propietario)
+    return trabajo.id_trabajo
+
+
+def ceder(trabajo_id: int, propietario: str) -> None:
+    """El latido venció y otro ejecutor tomó el trabajo (reanudar_interrumpidos + tomar_pendientes)."""
+    db = SessionLocal()
+    try:
+        trabajo = db.get(models.Trabajos, trabajo_id)
+        trabajo.estado, trabajo.propietario = "en_curso", propietario
+        db.commit()
+    finally:
+        db.close()
+
+
+def estado(trabajo_id: int) -> models.Trabajos:
+    db = SessionLocal()
+    try:
+        return db.get(models.Trabajos, trabajo_id)
+    finally:
+        db.close()
+
+
+def producto(codigo_producto: str) -> dict:
+    return {
+        "codigo_producto": codigo_producto, "nombre_producto": "Filtro", "id_categoria": 1, "marca": "Marca",
+        "precio_compra": "1000", "stock": 1, "id_distribuidor": 1,
+    }
+
+
+def interrumpir_en(monkeypatch, llamada: int, accion) -> None:
+    """Ejecuta `accion` antes del alta número `llamada` de ProductService.create."""
+    original = ProductService.create
+    llamadas = []
+
+    def create(self, *args, **kwargs):
+        llamadas.append(1)
+        if len(llamadas) == llamada:
+            accion()
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(ProductService, "create", create)
+
+
+def test_importacion_reanudada_a_mitad_de_lote(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_LOTE", 3)
+    ProductService(db).create(schemas.ProductoCreate(**producto("IMP-existente")))
+    codigos = ["IMP-existente", "IMP-1", "IMP-2", "IMP-3", "IMP-3", "IMP-4"]
+    trabajo_id = tomar(db, "importacion", {"productos": [producto(c) for c in codigos]}, "A")
+
+    def detener():
+        raise KeyboardInterrupt  # el proceso muere: ni siquiera se marca fallido
+
+    # IMP-3 (segundo lote) queda confirmado y el proceso muere antes de IMP-4
+    interrumpir_en(monkeypatch, 4, detener)
+    with pytest.raises(KeyboardInterrupt):
+        ejecutar_trabajo(trabajo_id, "A")
+    monkeypatch.undo()
+    assert estado(trabajo_id).procesados == 3
+
+    ceder(trabajo_id, "B")
+    assert ejecutar_trabajo(trabajo_id, "B") == "completado"
+    assert estado(trabajo_id).resultado == {"creados": 4, "omitidos": 2, "errores": []}
+    assert all(ProductService(db).get_many_by_codigo_producto(codigos))
+
+
+def test_importacion_cancelada_a_mitad_de_lote(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_LOTE", 2)
+    codigos = [f"CAN-{i}" for i in range(6)]
+    trabajo_id = tomar(db, "importacion", {"productos": [producto(c) for c in codigos]}, "A")
+
+    def cancelar():
+        otra = SessionLocal()
+        try:
+            JobService(otra).cancel(trabajo_id)
+        finally:
+            otra.close()
+
+    # La cancelación llega durante el primer lote: se termina ese lote y no se empieza el siguiente
+    interrumpir_en(monkeypatch, 1, cancelar)
+    assert ejecutar_trabajo(trabajo_id, "A") == "cancelado"
+    trabajo = estado(trabajo_id)
+    assert (trabajo.estado, trabajo.procesados) == ("cancelado", 2)
+    assert [p is not None for p in ProductService(db).get_many_by_codigo_producto(codigos)] == [True] * 2 + [False] * 4
+
+
+def test_reprecio_retomado_por_otro_ejecutor_se_aplica_una_vez(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOBS_LOTE", 2)
+    categoria = CategoryService(db).create(schemas.CategoriaCreate(nombre_categoria="Reprecio retomado"))
+    service = ProductService(db)
+    ids = [
+        service.create(schemas.ProductoCreate(
+            codigo_producto=f"REL-{i}", nombre_producto="Filtro", id_categoria=categoria.id_categoria,
+            marca="Marca", precio_compra=Decimal(1000 + i), stock=1, id_distribuidor=1,
+        )).id_producto
+        for i in range(5)
+    ]
+    trabajo_id = tomar(db, "reprecio", {"factor_precio": "2", "categoria_id": categoria.id_categoria}, "A")
+
+    original = ProductService.repreciar_lote
+    llamadas = []
+
+    def repreciar_lote(self, *args, **kwargs):
+        llamadas.append(args[0])
+        if len(llamadas) == 2:
+            # A deja de renovar su latido en el segundo lote y B lo toma antes de que A confirme
+            ceder(trabajo_id, "B")
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(ProductService, "repreciar_lote", repreciar_lote)
+    assert ejecutar_trabajo(trabajo_id, "A") == "perdido"
+    trabajo = estado(trabajo_id)
+    assert (trabajo.estado, trabajo.propietario, trabajo.procesados) == ("en_curso", "B", 2)
+
+    monkeypatch.setattr(ProductService, "repreciar_lote", original)
+    assert ejecutar_trabajo(trabajo_id, "B") == "completado"
+    assert estado(trabajo_id).resultado == {"actualizados": 5}
+    db.expire_all()
+    assert [db.get(models.Productos, i).precio_compra for i in ids] == [Decimal(2 * (1000 + i)) for i in range(5)]
+
+
+def test_ejecutor_sin_el_trabajo_no_lo_corre(db):
+    trabajo_id = tomar(db, "reindexado", {}, "A")
+    assert ejecutar_trabajo(trabajo_id, "B") == "perdido"
+    assert ejecutar_trabajo(trabajo_id, "A") == "completado"
+    assert estado(trabajo_id).estado == "completado"
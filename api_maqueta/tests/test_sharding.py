@@ -0,0 +1,157 @@
+"""Cambios de shard, de código y compensación de códigos duplicados en modo particionado.
+
+Uso (desde api_maqueta/):  python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import pytest
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TMP = tempfile.TemporaryDirectory()
+os.chdir(TMP.name)
+
+import main  # noqa: F401  (crea las tablas)
+import models
+import schemas
+import sharding
+from benchmarks.comun import poblar
+from config import settings
+from database import SessionLocal
+from service import sharded_product_service
+from service.history_service import HistoryService
+from service.sharded_product_service import ShardedProductService, activar_sharding, detener_sharding
+
+N_SHARDS = 4
+
+
+@pytest.fixture(scope="module")
+def service():
+    db = SessionLocal()
+    if not db.query(models.Distribuidores).count():  # otros módulos de prueba comparten la base global
+        poblar(db, 0, distribuidores=8)
+    anterior = (settings.SHARDS, settings.SHARD_URL_TEMPLATE)
+    settings.SHARDS = N_SHARDS
+    settings.SHARD_URL_TEMPLATE = os.path.join(f"sqlite:///{TMP.name}", "shard{n}.db")
+    activar_sharding(db)
+    yield ShardedProductService(db)
+    detener_sharding()
+    settings.SHARDS, settings.SHARD_URL_TEMPLATE = anterior
+    db.close()
+
+
+def codigo(dueño: int, prefijo: str) -> str:
+    """Un código cuya entrada del directorio vive en el shard `dueño`."""
+    i = 0
+    while zlib.crc32(f"{prefijo}-{i}".encode()) % N_SHARDS != dueño:
+        i += 1
+    return f"{prefijo}-{i}"
+
+
+def crear(service: ShardedProductService, codigo_producto: str, id_distribuidor: int) -> models.Productos:
+    return service.create(schemas.ProductoCreate(
+        codigo_producto=codigo_producto, nombre_producto="Filtro", id_categoria=1, marca="Marca",
+        precio_compra=Decimal(1000), stock=5, id_distribuidor=id_distribuidor,
+    ))
+
+
+def filas(producto_id: int) -> list:
+    """Shards que tienen una fila de Productos con ese id."""
+    return [shard for shard, hay in enumerate(sharding.router.en_todos(
+        lambda db, shard: db.get(models.Productos, producto_id) is not None
+    )) if hay]
+
+
+def entradas(producto_id: int) -> list:
+    return [
+        (shard, e.codigo_producto, e.shard, e.shard_pendiente)
+        for shard, parte in enumerate(sharding.router.en_todos(lambda db, shard: db.query(models.DirectorioProductos).filter(
+            models.DirectorioProductos.id_producto == producto_id
+        ).all()))
+        for e in parte
+    ]
+
+
+def test_mover_de_shard(service):
+    producto = crear(service, codigo(0, "mov"), id_distribuidor=1)
+    actualizado = service.update(producto.id_producto, schemas.ProductoUpdate(id_distribuidor=2, stock=9))
+    assert (actualizado.id_distribuidor, actualizado.stock) == (2, 9)
+    assert filas(producto.id_producto) == [2]
+    assert entradas(producto.id_producto) == [(0, producto.codigo_producto, 2, None)]
+    assert service.get_by_id(producto.id_producto).stock == 9
+    # El historial viaja con la fila
+    ahora = datetime.now()
+    assert service.get_history(producto.id_producto, ahora - timedelta(hours=1), ahora + timedelta(hours=1))[-1]["stock"] == 9
+
+
+def test_cambiar_codigo_y_shard(service):
+    anterior = codigo(1, "recod")
+    producto = crear(service, anterior, id_distribuidor=1)
+    nuevo = codigo(3, "recod-nuevo")
+    service.update(producto.id_producto, schemas.ProductoUpdate(codigo_producto=nuevo, id_distribuidor=2))
+    assert filas(producto.id_producto) == [2]
+    assert entradas(producto.id_producto) == [(3, nuevo, 2, None)]
+    assert service.get_by_codigo_producto(nuevo).id_producto == producto.id_producto
+    assert service.get_by_codigo_producto(anterior) is None
+    # El código anterior queda libre
+    assert crear(service, anterior, id_distribuidor=3).codigo_producto == anterior
+
+
+@pytest.mark.parametrize("mismo_dueño, mover", [(True, False), (False, False), (True, True), (False, True)])
+def test_codigo_duplicado_se_compensa(service, mismo_dueño, mover):
+    prefijo = f"dup-{mismo_dueño}-{mover}"
+    producto = crear(service, codigo(0, prefijo), id_distribuidor=1)
+    otro = crear(service, codigo(0 if mismo_dueño else 2, prefijo + "-otro"), id_distribuidor=3)
+    cambios = {"codigo_producto": otro.codigo_producto, **({"id_distribuidor": 2} if mover else {})}
+    with pytest.raises(ValueError, match="ya existe"):
+        service.update(producto.id_producto, schemas.ProductoUpdate(**cambios))
+    assert filas(producto.id_producto) == [1]
+    assert entradas(producto.id_producto) == [(0, producto.codigo_producto, 1, None)]
+    assert service.get_by_codigo_producto(producto.codigo_producto).id_producto == producto.id_producto
+    assert service.get_by_codigo_producto(otro.codigo_producto).id_producto == otro.id_producto
+
+
+def test_fallo_al_mover_deja_la_fila_en_el_origen(service, monkeypatch):
+    producto = crear(service, codigo(0, "falla"), id_distribuidor=1)
+    total = service.count_all()
+
+    def fallar(self, *args, **kwargs):
+        raise RuntimeError("falla simulada")
+
+    monkeypatch.setattr(HistoryService, "registrar_producto", fallar)
+    with pytest.raises(RuntimeError):
+        service.update(producto.id_producto, schemas.ProductoUpdate(id_distribuidor=2))
+    assert filas(producto.id_producto) == [1]
+    assert entradas(producto.id_producto) == [(0, producto.codigo_producto, 1, None)]
+    assert service.count_all() == total
+
+
+def test_fila_borrada_durante_el_cambio(service):
+    producto = crear(service, codigo(0, "borrada"), id_distribuidor=1)
+    sharding.router.en_paralelo([1], lambda db, shard: (
+        db.query(models.Productos).filter(models.Productos.id_producto == producto.id_producto).delete(), db.commit()
+    ))
+    assert service.update(producto.id_producto, schemas.ProductoUpdate(id_distribuidor=2)) is None
+    assert filas(producto.id_producto) == []
+
+
+def test_reparar_movimiento_interrumpido(service, monkeypatch):
+    producto = crear(service, codigo(0, "interrumpido"), id_distribuidor=1)
+    # Proceso que se detuvo tras copiar la fila al destino y apuntar el directorio allí, sin borrar el origen
+    monkeypatch.setattr(ShardedProductService, "_descartar_copia", lambda self, dueño, producto_id, shard: None)
+    service.update(producto.id_producto, schemas.ProductoUpdate(id_distribuidor=2))
+    monkeypatch.undo()
+    assert filas(producto.id_producto) == [1, 2]
+    assert entradas(producto.id_producto) == [(0, producto.codigo_producto, 2, 1)]
+
+    monkeypatch.setattr(settings, "SHARD_HUERFANOS_SEGUNDOS", 0)
+    assert sharded_product_service.relay.reparar_movimientos() == 1
+    assert filas(producto.id_producto) == [2]
+    assert entradas(producto.id_producto) == [(0, producto.codigo_producto, 2, None)]
+    assert service.get_by_id(producto.id_producto).id_distribuidor == 2